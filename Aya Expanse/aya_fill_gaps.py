@@ -1,24 +1,30 @@
-import json
 import os
 from tqdm import tqdm
-from aya_translate_v6 import generate_translation_prompt, generate_response, translation_validity
-
-failure = {
-    "Incomplete": "Your previous attempt failed because you provided an incomplete translation - Chinese text was found within the output. This time, ensure that your output is entirely in English.",
-    "Preceding": "Your previous attempt failed because you provided preceding text within the output. This time, make sure to directly start outputing the translation without giving any text before it."
-}
-
-def retry_failed_chunks(staging_file="mapping.json", max_retries=3):
-    if not os.path.exists(staging_file):
+from checkpoint_store import CheckpointStore
+from translation_db import TranslationDB
+from aya_translate_v6 import generate_translation_prompt, generate_response, translation_validity, failure, response_key, cache
+
+def retry_failed_chunks(staging_file="mapping.json", max_retries=3, db_path=None):
+    # With a translation.db the failed chunks come from the status index; otherwise scan mapping.json
+    if db_path:
+        store = TranslationDB(db_path)
+    elif os.path.exists(staging_file):
+        store = CheckpointStore(staging_file, indent=4)
+    else:
         print(f"Staging file {staging_file} not found. Exiting.")
         return
 
-    # Load the staging file
-    with open(staging_file, 'r', encoding='utf-8') as sf:
-        staging_data = json.load(sf)
+    with store:
+        retry_chunks(store, max_retries)
+
+def retry_chunks(store, max_retries):
+    staging_data = store.data
 
     # Find chunks with "ERROR" in the English field
-    failed_chunks = {key: value for key, value in staging_data.items() if value.get("English") == "ERROR"}
+    if isinstance(store, TranslationDB):
+        failed_chunks = store.records_with_status("error")
+    else:
+        failed_chunks = {key: value for key, value in staging_data.items() if value.get("English") == "ERROR"}
 
     if not failed_chunks:
         print("No failed chunks found. Exiting.")
@@ -43,13 +49,15 @@ def retry_failed_chunks(staging_file="mapping.json", max_retries=3):
                     glossary_text=glossary_text
                 )
 
-                response = generate_response(prompt + f"\n{retry_message}")
-                validity = translation_validity(response)
+                prompt += f"\n{retry_message}"
+                response = generate_response(prompt)
+                validity = translation_validity(response, chunk_data.get("Glossary", {}))
 
                 if validity == "AllGood":
                     valid_response = True
                     chunk_data["English"] = response.strip()  # Update with corrected translation
                 else:
+                    cache.discard(response_key(prompt))  # a rejected answer must not be replayed
                     retry_reasons.append(validity)
                     if validity != "Error":
                         retry_message = failure[validity]
@@ -62,17 +70,17 @@ def retry_failed_chunks(staging_file="mapping.json", max_retries=3):
             else:
                 print(f"\n{chunk_key}: Failed after {max_retries} attempts. Reasons: {retry_reasons}")
 
-            # Update the staging file with the corrected or failed chunk
-            staging_data[chunk_key] = chunk_data
-
-            # Save progress after each chunk to avoid data loss
-            with open(staging_file, 'w', encoding='utf-8') as sf:
-                json.dump(staging_data, sf, ensure_ascii=False, indent=4)
+            # Save the corrected or failed chunk right away to avoid data loss
+            store.put(chunk_key, chunk_data)
+            if isinstance(store, TranslationDB):
+                store.log_attempts(chunk_key, retry_reasons + (["AllGood"] if valid_response else []))
 
             pbar.update(1)
 
     print(f"\nRetry process complete. {updated_chunks} chunks successfully corrected out of {len(failed_chunks)}.")
+    print(cache.summary())
 
 if __name__ == "__main__":
     staging_file = "mapping.json"
-    retry_failed_chunks(staging_file=staging_file)
+    db_path = os.getenv("TRANSLATION_DB")     # e.g. translation.db, built with translation_db.py import
+    retry_failed_chunks(staging_file=staging_file, db_path=db_path)
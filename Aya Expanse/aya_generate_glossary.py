@@ -1,9 +1,20 @@
-import tiktoken
 import json
-from tqdm import tqdm
 import os
+from tqdm import tqdm
 import ollama
 import re
+from checkpoint_store import CheckpointStore
+from chunker import get_chunks
+from response_cache import cache_key, get_cache
+from telemetry import Telemetry, ollama_usage
+from token_budget import chunk_tokens, counter_for, model_budget
+
+cache = get_cache()  # LLM_CACHE=off to bypass
+telemetry = Telemetry(script="aya_generate_glossary", volume=os.path.basename(os.getcwd()))  # TELEMETRY=off to disable
+
+MODEL = "aya-expanse"
+OLLAMA_OPTIONS = {"num_ctx": model_budget(MODEL).context}
+OUTPUT_RATIO = 0.3  # a JSON list of names is far shorter than the chunk it comes from
 
 system_message = """
         You are a highly skilled translator specializing in Chinese-to-English translations.
@@ -25,48 +36,29 @@ def generate_prompt(current_chunk):
         {current_chunk}
         """
 
-def get_chunks(file_path, tokens_per_chunk=1000, encoding_name="cl100k_base"):
-    tokenizer = tiktoken.get_encoding(encoding_name)
-
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-
-    chunks = []
-    current_chunk = []
-    current_tokens = 0
-
-    for line in lines:
-        line_tokens = tokenizer.encode(line)
-        line_token_count = len(line_tokens)
-
-        # Check if adding the current line would exceed the token limit
-        if current_tokens + line_token_count > tokens_per_chunk:
-            # Finalize the current chunk
-            chunks.append(tokenizer.decode(sum(current_chunk, [])))
-            current_chunk = []
-            current_tokens = 0
+def response_key(prompt, model=MODEL):
+    return cache_key(model, system_message, prompt, config=OLLAMA_OPTIONS)
 
-        # Add the current line to the chunk
-        current_chunk.append(line_tokens)
-        current_tokens += line_token_count
-
-    # Add any remaining lines as the last chunk
-    if current_chunk:
-        chunks.append(tokenizer.decode(sum(current_chunk, [])))
-
-    total_tokens = sum(len(tokenizer.encode(chunk)) for chunk in chunks)
-    print(f"Total number of tokens in the original file: {total_tokens}")
-    print(f"Number of chunks created: {len(chunks)}")
-
-    return chunks
-
-def generate_response(prompt, model="aya-expanse"):
+def generate_response(prompt, model=MODEL):
+    cached = cache.get(response_key(prompt, model))
+    if cached is not None:
+        telemetry.cache_hit(model)
+        return cached
     messages = [
             {"role": "system", "content": system_message},
             {"role": "user", "content": prompt}
             ]
-    response = ollama.chat(model, messages)
-    return response["message"]["content"].strip()
+    call = telemetry.start(model, "ollama", cache="miss")
+    try:
+        response = ollama.chat(model, messages, options=OLLAMA_OPTIONS)
+    except Exception as e:
+        call.done(str(e))
+        raise
+    call.usage(*ollama_usage(response))
+    call.done()
+    text = response["message"]["content"].strip()
+    cache.put(response_key(prompt, model), text)
+    return text
 
 def extract_json_from_response(response):
     """
@@ -108,30 +100,33 @@ def update_glossary(new_data, glossary):
             print(f"\nIgnored -> Key: {key}, Value: {value} - Error in data type")
             continue
 
-def process_file(input_file, glossary_file="glossary.json", tokens_per_chunk=1000):
-    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk)
+def process_file(input_file, glossary_file="glossary.json", tokens_per_chunk=None):
+    # tokens_per_chunk=None → sized from Aya's context window and answer length (token_budget.py)
+    tokens_per_chunk = tokens_per_chunk or chunk_tokens(MODEL, system_message, output_ratio=OUTPUT_RATIO)
+    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk, counter=counter_for(MODEL))
     
-    # Load existing glossary or initialize an empty one
-    if os.path.exists(glossary_file):
-        with open(glossary_file, 'r', encoding='utf-8') as gf:
-            glossary = json.load(gf)
-    else:
-        glossary = {}
-
-    with tqdm(total=len(chunks), desc="Processing") as pbar:
-        for chunk in chunks:
-            prompt = generate_prompt(chunk)
-            response = generate_response(prompt)
-            
-            new_data = extract_json_from_response(response)
-            if new_data:  # Only update if valid JSON is found
-                update_glossary(new_data, glossary)
-
-            pbar.update(1)
-
-            # Periodically save glossary
-            with open(glossary_file, 'w', encoding='utf-8') as gf:
-                json.dump(glossary, gf, ensure_ascii=False, indent=4)
+    # Load existing glossary (and any terms a crashed run left in glossary.json.wal)
+    with CheckpointStore(glossary_file, indent=4) as store:
+        glossary = store.data
+
+        with tqdm(total=len(chunks), desc="Processing") as pbar:
+            for chunk_idx, chunk in enumerate(chunks, start=1):
+                prompt = generate_prompt(chunk)
+                with telemetry.scope("glossary", unit=chunk_idx) as scope:
+                    response = generate_response(prompt)
+                    new_data = extract_json_from_response(response)
+                    scope.verdict = "AllGood" if new_data is not None else "Malformed"
+
+                if new_data is None:  # {} is a valid "no names here" answer and stays cached
+                    cache.discard(response_key(prompt))
+                if new_data:  # Only update if valid JSON is found
+                    known = set(glossary)
+                    update_glossary(new_data, glossary)
+                    # Persist only the newly added terms instead of rewriting the whole glossary
+                    for key in glossary.keys() - known:
+                        store.put(key, glossary[key])
+
+                pbar.update(1)
 
 if __name__ == "__main__":
     input_file = "Chinese.txt"
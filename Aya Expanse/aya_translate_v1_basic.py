@@ -1,18 +1,7 @@
 import requests
 import json
-import tiktoken
-
-def get_chunks(file_path, tokens_per_chunk=1000, encoding_name="cl100k_base"):
-    # Use a compatible tokenizer for tokenization
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    
-    with open(file_path, 'r', encoding='utf-8') as file:
-        text = file.read()
-    
-    tokens = tokenizer.encode(text)
-    
-    for i in range(0, len(tokens), tokens_per_chunk):
-        yield tokenizer.decode(tokens[i:i + tokens_per_chunk])
+from segmenter import get_chunks  # sentence-aligned, so no overlap between chunks
+from token_budget import counter_for  # chunk sizes in Aya Expanse tokens, not cl100k_base
 
 def generate_response(prompt, model="aya-expanse", url="http://localhost:11434/api/generate"):
     headers = {"Content-Type": "application/json"}
@@ -34,7 +23,7 @@ def generate_response(prompt, model="aya-expanse", url="http://localhost:11434/a
 
 def process_file(input_file, output_file):
     with open(output_file, 'w', encoding='utf-8') as out_file:
-        for chunk in get_chunks(input_file):
+        for chunk in get_chunks(input_file, counter=counter_for("aya-expanse")):
             response = generate_response(chunk)
             out_file.write(response + "\n\n")  # Write translated chunk
 
@@ -1,25 +1,13 @@
 import aiohttp
 import asyncio
-import tiktoken
+from segmenter import get_chunks  # sentence-aligned, so no overlap between chunks
+from token_budget import counter_for  # chunk sizes in Aya Expanse tokens, not cl100k_base
 import json
 from tqdm import tqdm
 from prompt_utils import alt_prompt
 
 base_prompt = alt_prompt
 
-async def get_chunks(file_path, tokens_per_chunk=1000, encoding_name="cl100k_base"):
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    
-    with open(file_path, 'r', encoding='utf-8') as file:
-        text = file.read()
-    
-    tokens = tokenizer.encode(text)
-    total_tokens = len(tokens)
-    print(f"Total number of tokens in the original file: {total_tokens}")
-    
-    chunks = [tokenizer.decode(tokens[i:i + tokens_per_chunk]) for i in range(0, len(tokens), tokens_per_chunk)]
-    return chunks
-
 async def generate_response(session, prompt, model="aya-expanse", url="http://localhost:11434/api/generate"):
     headers = {"Content-Type": "application/json"}
     payload = {
@@ -36,7 +24,7 @@ async def generate_response(session, prompt, model="aya-expanse", url="http://lo
             return f"Error: {response.status}"
 
 async def process_file(input_file, output_file, concurrency=10):
-    chunks = await get_chunks(input_file)
+    chunks = get_chunks(input_file, counter=counter_for("aya-expanse"))
     
     async with aiohttp.ClientSession() as session:
         tasks = []
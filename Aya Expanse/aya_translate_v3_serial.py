@@ -1,5 +1,6 @@
 import requests
-import tiktoken
+from segmenter import get_chunks  # sentence-aligned, so no overlap between chunks
+from token_budget import counter_for  # chunk sizes in Aya Expanse tokens, not cl100k_base
 import json
 from tqdm import tqdm
 
@@ -16,23 +17,6 @@ def generate_prompt(previous_translation, current_chunk):
         {current_chunk}
         """
 
-def get_chunks(file_path, tokens_per_chunk=1000, overlap_tokens=50, encoding_name="cl100k_base"):
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    
-    with open(file_path, 'r', encoding='utf-8') as file:
-        text = file.read()
-    
-    tokens = tokenizer.encode(text)
-    total_tokens = len(tokens)
-    print(f"Total number of tokens in the original file: {total_tokens}")
-    
-    chunks = []
-    for i in range(0, len(tokens), tokens_per_chunk - overlap_tokens):
-        chunk = tokens[i:i + tokens_per_chunk]
-        chunks.append(tokenizer.decode(chunk))
-    
-    return chunks
-
 def generate_response(prompt, model="aya-expanse", url="http://localhost:11434/api/generate"):
     headers = {"Content-Type": "application/json"}
     payload = {
@@ -48,8 +32,8 @@ def generate_response(prompt, model="aya-expanse", url="http://localhost:11434/a
     else:
         return f"Error: {response.status_code}"
 
-def process_file(input_file, output_file, tokens_per_chunk=1000, overlap_tokens=50):
-    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk, overlap_tokens=overlap_tokens)
+def process_file(input_file, output_file, tokens_per_chunk=1000):
+    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk, counter=counter_for("aya-expanse"))
     
     results = []
     previous_translation = "[No previous context available]"  # Initial value for the first chunk
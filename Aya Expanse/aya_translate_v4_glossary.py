@@ -1,5 +1,7 @@
 import requests
-import tiktoken
+from segmenter import get_chunks  # sentence-aligned, so no overlap between chunks
+from token_budget import counter_for  # chunk sizes in Aya Expanse tokens, not cl100k_base
+from glossary_index import load_glossary_index
 import json
 import os
 import re
@@ -30,19 +32,6 @@ def generate_translation_prompt(previous_translation, current_chunk, glossary_te
             {current_chunk}
             """
 
-def get_chunks(file_path, tokens_per_chunk=1000, overlap_tokens=50, encoding_name="cl100k_base"):
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    with open(file_path, 'r', encoding='utf-8') as file:
-        text = file.read()    
-    tokens = tokenizer.encode(text)
-    total_tokens = len(tokens)
-    print(f"Total number of tokens in the original file: {total_tokens}")
-    chunks = []
-    for i in range(0, len(tokens), tokens_per_chunk - overlap_tokens):
-        chunk = tokens[i:i + tokens_per_chunk]
-        chunks.append(tokenizer.decode(chunk))
-    return chunks
-
 def generate_response(prompt, model="aya-expanse", url="http://localhost:11434/api/generate"):
     headers = {"Content-Type": "application/json"}
     payload = {
@@ -57,12 +46,9 @@ def generate_response(prompt, model="aya-expanse", url="http://localhost:11434/a
     else:
         return f"Error: {response.status_code}"
 
-def filter_glossary_for_chunk(chunk, glossary):
-    relevant_glossary = {}
-    for key, values in glossary.items():
-        if key in chunk:
-            relevant_glossary[key] = values
-    return relevant_glossary
+def filter_glossary_for_chunk(chunk, glossary, index):
+    # One Aho-Corasick pass over the chunk; terms nested inside a longer hit are dropped
+    return index.filter(chunk, glossary)
 
 def is_valid_translation(response):
     try:
@@ -83,8 +69,8 @@ def is_valid_translation(response):
     except Exception:
         return False
 
-def process_file(input_file, output_file, glossary_file="glossary.json", tokens_per_chunk=1000, overlap_tokens=50, max_retries=3):
-    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk, overlap_tokens=overlap_tokens)
+def process_file(input_file, output_file, glossary_file="glossary.json", tokens_per_chunk=1000, max_retries=3):
+    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk, counter=counter_for("aya-expanse"))
     
     # Load the glossary
     if os.path.exists(glossary_file):
@@ -93,13 +79,14 @@ def process_file(input_file, output_file, glossary_file="glossary.json", tokens_
     else:
         print("Glossary file not found. Exiting.")
         return
+    index = load_glossary_index(glossary_file, glossary)
 
     results = []
     previous_translation = "[No previous context available]"  # Initial value for the first chunk
     
     with tqdm(total=len(chunks), desc="Translating") as pbar:
         for chunk in chunks:
-            glossary_subset = filter_glossary_for_chunk(chunk, glossary)
+            glossary_subset = filter_glossary_for_chunk(chunk, glossary, index)
             glossary_text = "\n".join([f'"{key}": "{", ".join(values)}"' for key, values in glossary_subset.items()])
             retries = 0
             valid_response = False
@@ -1,10 +1,25 @@
-import tiktoken
 import json
 import os
 import re
 import ollama
 from tqdm import tqdm
 import logging
+from checkpoint_store import CheckpointStore
+from chunker import check_resume, get_chunks  # streamed, one encode pass; v7 imports it from here
+from glossary_index import load_glossary_index
+from glossary_validator import GlossaryValidator
+from response_cache import cache_key, get_cache
+from streaming import STREAMING, HAN_RE, StreamGuard, stream_ollama_lib
+from telemetry import Telemetry, ollama_usage
+from token_budget import chunk_tokens, counter_for, model_budget
+
+cache = get_cache()  # LLM_CACHE=off to bypass, LLM_CACHE=refresh to re-ask and overwrite
+telemetry = Telemetry(script="aya_translate_v6", volume=os.path.basename(os.getcwd()))  # TELEMETRY=off to disable
+
+# Chunk sizes are counted in Aya's own tokens and derived from the context window we ask Ollama for
+MODEL = "aya-expanse"
+OLLAMA_OPTIONS = {"num_ctx": model_budget(MODEL).context}
+PROMPT_RESERVE = 600  # glossary subset + previous line + retry hint
 
 # Configuring Logging
 logging.basicConfig(
@@ -53,53 +68,51 @@ def generate_translation_prompt(previous_translation, current_chunk, glossary_te
             {current_chunk}
             """
 
-def get_chunks(file_path, tokens_per_chunk, encoding_name="cl100k_base"):
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
+def response_key(prompt, model=MODEL):
+    return cache_key(model, system_message, prompt, config=OLLAMA_OPTIONS)
 
-    chunks = []
-    current_chunk = []
-    current_tokens = 0
-
-    for line in lines:
-        line_tokens = tokenizer.encode(line)
-        line_token_count = len(line_tokens)
-        if current_tokens + line_token_count > tokens_per_chunk:
-            chunks.append(tokenizer.decode(sum(current_chunk, [])))
-            current_chunk = []
-            current_tokens = 0
-
-        # Add the current line to the chunk
-        current_chunk.append(line_tokens)
-        current_tokens += line_token_count
-
-    # Add any remaining lines as the last chunk
-    if current_chunk:
-        chunks.append(tokenizer.decode(sum(current_chunk, [])))
-
-    total_tokens = sum(len(tokenizer.encode(chunk)) for chunk in chunks)
-    print(f"Total number of tokens in the original file: {total_tokens}")
-    print(f"Number of chunks created: {len(chunks)}")
-
-    return chunks
-
-def generate_response(prompt, model="aya-expanse"):
+def generate_response(prompt, model=MODEL):
+    # Identical prompts (reruns, fill-gap retries of neighbours) are answered from the disk cache
+    cached = cache.get(response_key(prompt, model))
+    if cached is not None:
+        telemetry.cache_hit(model)
+        return cached
     messages = [
             {"role": "system", "content": system_message},
             {"role": "user", "content": prompt}
             ]
-    response = ollama.chat(model, messages)
-    return response["message"]["content"].strip()
+    call = telemetry.start(model, "ollama", streamed=STREAMING, cache="miss")
+    try:
+        if STREAMING:
+            # Stop generating as soon as the answer fails the Incomplete/Preceding checks below;
+            # translation_validity then rejects the partial text for the same reason
+            guard = StreamGuard(HAN_RE, anywhere=("translation",))
+            text, verdict = stream_answer(model, messages, guard)
+            call.first_token(guard.first_at)
+            call.usage(*guard.usage)
+            if verdict:
+                call.done("ABORTED")
+                return text.strip()
+        else:
+            response = ollama.chat(model, messages, options=OLLAMA_OPTIONS)
+            call.usage(*ollama_usage(response))
+            text = response["message"]["content"]
+    except Exception as e:
+        call.done(str(e))
+        raise
+    call.done()
+    text = text.strip()
+    cache.put(response_key(prompt, model), text)
+    return text
+
+def stream_answer(model, messages, guard):
+    return stream_ollama_lib(model, messages, guard, OLLAMA_OPTIONS)
 
-def filter_glossary_for_chunk(chunk, glossary):
-    relevant_glossary = {}
-    for key, values in glossary.items():
-        if key in chunk:
-            relevant_glossary[key] = values
-    return relevant_glossary
+def filter_glossary_for_chunk(chunk, glossary, index):
+    # One Aho-Corasick pass over the chunk; terms nested inside a longer hit are dropped
+    return index.filter(chunk, glossary)
 
-def translation_validity(response, glossary):
+def translation_validity(response, glossary, validator=None):
     try:
         # Check if the text contains Chinese characters
         chinese_characters = re.search(r'[\u4e00-\u9fff]', response)
@@ -110,18 +123,23 @@ def translation_validity(response, glossary):
         if "translation" in response.lower():
             return "Preceding"
         
-        # Check glossary consistency
-        for term, translations in glossary.items():
-            if not any(re.search(re.escape(translation), response, re.IGNORECASE) for translation in translations):
-                return "Glossary"
+        # Check glossary consistency - one combined regex scan instead of one search per variant
+        validator = validator or GlossaryValidator(glossary)
+        if validator.missing(response, glossary):
+            return "Glossary"
             
         return "AllGood"
     except Exception as e:
         print(f"Error when checking validity: {e}")
         return "Error"
 
+def chunk_file(input_file, tokens_per_chunk=None):
+    # tokens_per_chunk=None → the largest chunk Aya can translate reliably (token_budget.py)
+    tokens_per_chunk = tokens_per_chunk or chunk_tokens(MODEL, system_message, PROMPT_RESERVE)
+    return get_chunks(input_file, tokens_per_chunk=tokens_per_chunk, counter=counter_for(MODEL))
+
 def process_file(input_file, glossary_file, staging_file, tokens_per_chunk, max_retries):
-    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk)
+    chunks = chunk_file(input_file, tokens_per_chunk)
 
     # Load the glossary
     if os.path.exists(glossary_file):
@@ -132,13 +150,17 @@ def process_file(input_file, glossary_file, staging_file, tokens_per_chunk, max_
         return
     
     print(f"Glossary file found with {len(glossary)} entries.")
+    index = load_glossary_index(glossary_file, glossary)
+    validator = GlossaryValidator(glossary)
 
-    # Load or initialize the staging file
-    if os.path.exists(staging_file):
-        with open(staging_file, 'r', encoding='utf-8') as sf:
-            staging_data = json.load(sf)
-    else:
-        staging_data = {}
+    # Load the staging file (plus any chunks a crashed run left in mapping.json.wal)
+    with CheckpointStore(staging_file, indent=4) as store:
+        translate_chunks(chunks, glossary, index, validator, store, max_retries)
+    print(cache.summary())
+
+def translate_chunks(chunks, glossary, index, validator, store, max_retries):
+    staging_data = store.data
+    check_resume(staging_data, chunks, store.path.name)
 
     # Resume processing from the last unprocessed chunk
     last_processed_chunk = max(int(key.split()[1]) for key in staging_data.keys()) if staging_data else 0
@@ -152,22 +174,27 @@ def process_file(input_file, glossary_file, staging_file, tokens_per_chunk, max_
                 pbar.update(1)
                 continue
 
-            glossary_subset = filter_glossary_for_chunk(chunk, glossary)
+            glossary_subset = filter_glossary_for_chunk(chunk, glossary, index)
             glossary_text = "\n".join([f'"{key}": "{", ".join(values)}"' for key, values in glossary_subset.items()])
             retries = 0
             valid_response = False
             retry_reasons = []
             retry_message = ""
 
+            base_prompt = generate_translation_prompt(previous_translation, chunk, glossary_text)
             while retries < max_retries and not valid_response:
-                prompt = generate_translation_prompt(previous_translation, chunk, glossary_text)
-                response = generate_response(prompt + f"\n{retry_message}")
-                validity = translation_validity(response, glossary_subset)
+                prompt = base_prompt + f"\n{retry_message}"
+                with telemetry.scope("translate", unit=chunk_idx, attempt=retries + 1) as scope:
+                    response = generate_response(prompt)
+                    validity = scope.verdict = translation_validity(response, glossary_subset, validator)
 
                 if validity == "AllGood":
                     valid_response = True
                     previous_translation = response.strip().split('\n')[-1]
+                    if retries:  # let a rerun get the accepted answer on its first attempt
+                        cache.put(response_key(base_prompt + "\n"), response)
                 else:
+                    cache.discard(response_key(prompt))  # a rejected answer must not be replayed
                     if validity != "Error":
                         retry_reasons.append(validity)  # Log the failure reason
                         retry_message = failure[validity]
@@ -177,21 +204,18 @@ def process_file(input_file, glossary_file, staging_file, tokens_per_chunk, max_
             # Log the final result for the chunk
             if valid_response:
                 logging.info(f"Chunk {chunk_idx}: Success after {retries + 1} attempts. Retry reasons: {retry_reasons}")
-                staging_data[f"chunk {chunk_idx}"] = {
+                store.put(f"chunk {chunk_idx}", {
                     "Chinese": chunk,
                     "English": response,
                     "Glossary": glossary_subset
-                }
+                })
             else:
                 logging.info(f"Chunk {chunk_idx}: Failed after {max_retries} attempts. Retry reasons: {retry_reasons}")
-                staging_data[f"chunk {chunk_idx}"] = {
+                store.put(f"chunk {chunk_idx}", {
                     "Chinese": chunk,
                     "English": "ERROR",
                     "Glossary": glossary_subset
-                }
-
-            with open(staging_file, 'w', encoding='utf-8') as sf:
-                json.dump(staging_data, sf, ensure_ascii=False, indent=4)
+                })
 
             pbar.update(1)
 
@@ -200,5 +224,5 @@ if __name__ == "__main__":
     glossary_file = "glossary.json"
     staging_file = "mapping.json"
 
-    process_file(input_file, glossary_file, staging_file, tokens_per_chunk=500, max_retries=5)
+    process_file(input_file, glossary_file, staging_file, tokens_per_chunk=None, max_retries=5)
     print("\nTranslation complete. Check English.txt for results.")
@@ -0,0 +1,201 @@
+import aiohttp
+import asyncio
+import json
+import os
+import logging
+from tqdm import tqdm
+from checkpoint_store import CheckpointStore
+from chunker import check_resume
+from translation_db import TranslationDB
+from response_cache import get_cache
+from glossary_index import load_glossary_index
+from glossary_validator import GlossaryValidator
+from streaming import STREAMING, HAN_RE, StreamGuard, stream_ollama_chat
+from telemetry import Telemetry, ollama_usage
+from aya_translate_v6 import system_message, failure, chunk_file, filter_glossary_for_chunk, translation_validity, response_key, MODEL, OLLAMA_OPTIONS
+
+# Ollama serves OLLAMA_NUM_PARALLEL requests per loaded model; keep exactly that many in flight
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+CONCURRENCY = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+TRANSLATION_DB = os.getenv("TRANSLATION_DB")  # optional SQLite store instead of mapping.json
+RETRY_DELAY = 2
+cache = get_cache()  # LLM_CACHE=off to bypass, LLM_CACHE=refresh to re-ask and overwrite
+telemetry = Telemetry(script="aya_translate_v7_async", volume=os.path.basename(os.getcwd()))  # TELEMETRY=off to disable
+
+def generate_translation_prompt(previous_source, current_chunk, glossary_text):
+    # Chunks run in parallel, so the previous *English* is not available yet -
+    # the tail of the previous Chinese chunk is given as read-only context instead
+    return f"""
+            Glossary:
+            {glossary_text}
+
+            Here is the end of the previous Chinese section. It has already been translated - use it only as context and do not translate it again:
+            {previous_source}
+
+            Now, translate the following Chinese text:
+            {current_chunk}
+            """
+
+def source_tail(chunk, lines=2):
+    if not chunk:
+        return "[No previous context available]"
+    return "\n".join(chunk.strip().splitlines()[-lines:])
+
+async def generate_response(session, prompt, model=MODEL):
+    cached = cache.get(response_key(prompt, model))
+    if cached is not None:
+        telemetry.cache_hit(model)
+        return cached
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        "stream": False,
+        "options": OLLAMA_OPTIONS
+    }
+    call = telemetry.start(model, "ollama", streamed=STREAMING, cache="miss")
+    try:
+        if STREAMING:
+            # The connection is dropped as soon as Chinese or a preamble appears, so a bad
+            # attempt costs a few dozen tokens; translation_validity rejects the partial text
+            guard = StreamGuard(HAN_RE, anywhere=("translation",))
+            text, verdict = await stream_ollama_chat(session, f"{OLLAMA_HOST}/api/chat", payload, guard)
+            call.first_token(guard.first_at)
+            call.usage(*guard.usage)
+            if verdict:
+                call.done("ABORTED")
+                return text.strip()
+        else:
+            async with session.post(f"{OLLAMA_HOST}/api/chat", json=payload) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Ollama returned HTTP {response.status}")
+                result = await response.json()
+            call.usage(*ollama_usage(result))
+            text = result["message"]["content"]
+    except Exception as e:
+        call.done(str(e), throttled="HTTP 503" in str(e))
+        raise
+    call.done()
+    text = text.strip()
+    cache.put(response_key(prompt, model), text)
+    return text
+
+async def translate_chunk(session, sem, chunk_idx, chunk, previous_chunk, glossary_subset, validator, max_retries):
+    glossary_text = "\n".join([f'"{key}": "{", ".join(values)}"' for key, values in glossary_subset.items()])
+    prompt = generate_translation_prompt(source_tail(previous_chunk), chunk, glossary_text)
+    retry_reasons = []
+    retry_message = ""
+
+    async with sem:
+        for attempt in range(1, max_retries + 1):
+            with telemetry.scope("translate", unit=chunk_idx, attempt=attempt) as scope:
+                try:
+                    full_prompt = prompt + f"\n{retry_message}"
+                    response = await generate_response(session, full_prompt)
+                except Exception as e:
+                    scope.verdict = "Error"
+                    response = None
+                    retry_reasons.append("Error")
+                    logging.info(f"Chunk {chunk_idx}: Retry {attempt}/{max_retries} - Request failed: {e}")
+                else:
+                    validity = scope.verdict = translation_validity(response, glossary_subset, validator)
+            if response is None:
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+
+            if validity == "AllGood":
+                if attempt > 1:  # let a rerun get the accepted answer on its first attempt
+                    cache.put(response_key(prompt + "\n"), response)
+                logging.info(f"Chunk {chunk_idx}: Success after {attempt} attempts. Retry reasons: {retry_reasons}")
+                return chunk_idx, response, retry_reasons + ["AllGood"]
+
+            cache.discard(response_key(full_prompt))  # never replay a rejected answer
+            retry_reasons.append(validity)
+            if validity != "Error":
+                retry_message = failure[validity]
+            logging.info(f"Chunk {chunk_idx}: Retry {attempt}/{max_retries} - Failure reason: {validity}")
+
+    logging.info(f"Chunk {chunk_idx}: Failed after {max_retries} attempts. Retry reasons: {retry_reasons}")
+    return chunk_idx, "ERROR", retry_reasons
+
+def extract_english(staging_data, output_file):
+    with open(output_file, 'w', encoding='utf-8') as out:
+        for idx in sorted(int(key.split()[1]) for key in staging_data):
+            english_text = staging_data[f"chunk {idx}"].get("English", "")
+            if english_text and english_text != "ERROR":
+                out.write(english_text + '\n')
+
+async def process_file(input_file, glossary_file, staging_file, output_file, tokens_per_chunk, max_retries, concurrency=CONCURRENCY):
+    chunks = chunk_file(input_file, tokens_per_chunk)
+
+    # Load the glossary
+    if os.path.exists(glossary_file):
+        with open(glossary_file, 'r', encoding='utf-8') as gf:
+            glossary = json.load(gf)
+    else:
+        print("Glossary file not found. Exiting.")
+        return
+
+    print(f"Glossary file found with {len(glossary)} entries.")
+    index = load_glossary_index(glossary_file, glossary)
+    validator = GlossaryValidator(glossary)
+
+    # Load the staging file (plus any chunks a crashed run left in mapping.json.wal), or the SQLite store
+    store = TranslationDB(TRANSLATION_DB) if TRANSLATION_DB else CheckpointStore(staging_file, indent=4)
+    with store:
+        await translate_pending(chunks, glossary, index, validator, store, output_file, max_retries, concurrency)
+
+async def translate_pending(chunks, glossary, index, validator, store, output_file, max_retries, concurrency):
+    staging_data = store.data
+    check_resume(staging_data, chunks, store.path.name)
+    # Resume: every chunk without a good translation is (re)queued, not just those after the last key
+    if isinstance(store, TranslationDB):
+        done = set(store.keys(status="done"))
+    else:
+        done = {key for key, value in staging_data.items() if value.get("English") not in (None, "", "ERROR")}
+    pending = [idx for idx in range(1, len(chunks) + 1) if f"chunk {idx}" not in done]
+    print(f"{len(chunks) - len(pending)} chunks already done, {len(pending)} to translate with {concurrency} parallel requests.")
+
+    sem = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = []
+        glossary_subsets = {}
+        for idx in pending:
+            glossary_subsets[idx] = filter_glossary_for_chunk(chunks[idx - 1], glossary, index)
+            previous_chunk = chunks[idx - 2] if idx > 1 else None
+            tasks.append(asyncio.create_task(
+                translate_chunk(session, sem, idx, chunks[idx - 1], previous_chunk,
+                                glossary_subsets[idx], validator, max_retries)))
+
+        failed = 0
+        with tqdm(total=len(chunks), desc="Translating", initial=len(chunks) - len(pending)) as pbar:
+            for finished in asyncio.as_completed(tasks):
+                chunk_idx, response, attempts = await finished
+                failed += response == "ERROR"
+                # Appended to the WAL after every chunk so an interrupted run resumes where it stopped
+                store.put(f"chunk {chunk_idx}", {
+                    "Chinese": chunks[chunk_idx - 1],
+                    "English": response,
+                    "Glossary": glossary_subsets[chunk_idx]
+                })
+                if isinstance(store, TranslationDB):
+                    store.log_attempts(f"chunk {chunk_idx}", attempts)
+                pbar.update(1)
+
+    if failed:
+        print(f"\n{failed} chunk(s) failed validation. Rerun to retry them.")
+    print(cache.summary())
+    extract_english(staging_data, output_file)
+
+if __name__ == "__main__":
+    input_file = "Chinese.txt"
+    glossary_file = "glossary.json"
+    staging_file = "mapping.json"
+    output_file = "English.txt"
+
+    asyncio.run(process_file(input_file, glossary_file, staging_file, output_file, tokens_per_chunk=None, max_retries=5))
+    print("\nTranslation complete. Check English.txt for results.")
@@ -3,21 +3,27 @@ from __future__ import annotations
 import json, os, time, re
 from pathlib import Path
 from typing import Dict, List
-from PIL import Image
 from tqdm import tqdm
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from gemini_clients import get_pool
+from image_prep import prepare
+from page_classifier import classify_all
+from response_cache import cache_key, get_cache
+
 # ─── Config ──────────────────────────────────────────────────────────── #
 load_dotenv()
 MODEL_NAME          = "gemini-2.5-flash-preview-05-20"
+GENERATION_CONFIG   = {}                              # sampling settings, e.g. {"temperature": 0.3}; part of the cache key
 GEMINI_KEY          = os.environ["GEMINI_KEY"]
 IMAGES_DIR          = Path(".\Input\Danmachi_vol20\Images")
 GLOSSARY_PATH       = Path(".\Processing_Files\Danmachi_vol20\Glossary.json")
 TYPE_PATH           = Path(".\Processing_Files\Danmachi_vol20\Type.json")
-SIZE_LIMIT_BYTES    = 7 * 1024 * 1024                 # 7 MB
 MAX_RETRIES         = 3
 RETRY_DELAY         = 6
+CACHE               = get_cache()                     # LLM_CACHE=off to bypass
+POOL                = get_pool()                      # one client + model for the whole run
+LOCAL_CLASSIFY      = os.getenv("LOCAL_CLASSIFY", "1") == "1"   # settle illustrations / blanks without a call
 
 # ─── System instruction – stricter glossary-only extractor ───────────── #
 SYSTEM_PROMPT = """
@@ -62,22 +68,24 @@ def update_glossary(extracted: Dict[str, str], master: Dict[str, List[str]]) ->
 
 def call_gemini(image_path: Path) -> dict | None:
     """Ask Gemini to produce the JSON payload for one image."""
-    genai.configure(api_key=GEMINI_KEY or os.getenv("GOOGLE_API_KEY", ""))
-
-    model = genai.GenerativeModel(
-        model_name=MODEL_NAME,
-        system_instruction=SYSTEM_PROMPT,
-    )
-
+    api_key = GEMINI_KEY or os.getenv("GOOGLE_API_KEY", "")
     prompt = "Extract glossary JSON for this page."
-    img    = Image.open(image_path)
+    image  = prepare(image_path)                # grayscale, resolution-capped derivative
+    key    = cache_key(MODEL_NAME, SYSTEM_PROMPT, prompt, images=[image.path], config=GENERATION_CONFIG)
+    cached = CACHE.get(key)
+    if cached is not None:
+        return json.loads(cached)
 
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = model.generate_content([prompt, img])
+            model = POOL.model(api_key, MODEL_NAME, SYSTEM_PROMPT)
+            resp = model.generate_content([prompt, image.part()], generation_config=GENERATION_CONFIG)
             payload = resp.candidates[0].content.parts[0].text.strip()
-            return json.loads(payload)          # validates JSON
+            result = json.loads(payload)        # validates JSON
+            CACHE.put(key, payload)             # only well-formed answers are cached
+            return result
         except Exception as err:
+            POOL.failed(api_key, MODEL_NAME, SYSTEM_PROMPT, err)
             if attempt == MAX_RETRIES:
                 print(f"[{image_path.name}] failed: {err}")
                 return None
@@ -93,17 +101,16 @@ def main() -> None:
     image_paths = sorted(IMAGES_DIR.glob("page_*.png"))
 
     print(f"Processing {len(image_paths)} page(s)…")
-    
-    for img_path in tqdm(image_paths, unit="page"):
-        size_ok = img_path.stat().st_size <= SIZE_LIMIT_BYTES
-        if not size_ok:
-            page_types.append(
-                {"page_no": img_path.stem.split("_")[1],
-                 "contains_text": False,
-                 "contains_illustration": True}
-            )
-            continue
 
+    # illustration-only / blank pages hold no names to extract: record them without a call
+    verdicts = classify_all(image_paths) if LOCAL_CLASSIFY and image_paths else [None] * len(image_paths)
+    skipped  = 0
+    for img_path, pc in tqdm(list(zip(image_paths, verdicts)), unit="page"):
+        if pc is not None and pc.confident and not pc.contains_text:
+            page_types.append({"page_no": img_path.stem.split("_")[1], "contains_text": False,
+                               "contains_illustration": pc.contains_illustration})
+            skipped += 1
+            continue
         result = call_gemini(img_path)
         if not result:
             continue
@@ -123,7 +130,8 @@ def main() -> None:
         json.dump(page_types, f, ensure_ascii=False, indent=2)
 
     print(f"✓ Glossary written to {GLOSSARY_PATH}")
-    print(f"✓ Page types written to {TYPE_PATH}")
+    print(f"✓ Page types written to {TYPE_PATH} ({skipped} page(s) classified locally)")
+    print(CACHE.summary())
 
 if __name__ == "__main__":
     main()
@@ -4,31 +4,42 @@ import json, os, time, re
 from pathlib import Path
 from typing import Dict, List
 from tqdm import tqdm
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from gemini_batch import GeminiBatch, text_request
+from gemini_clients import get_pool
+from rate_limiter import QuotaScheduler, estimate_tokens, usage_tokens
+from response_cache import cache_key, get_cache
+from telemetry import Telemetry, gemini_usage
+
 # ─── Config ──────────────────────────────────────────────────────────── #
 load_dotenv()
 MODEL_NAME          = "gemini-2.5-flash-preview-05-20"
+GENERATION_CONFIG   = {}                              # sampling settings, e.g. {"temperature": 0.3}; part of the cache key
 FALLBACK_MODEL      = "gemini-2.0-flash"
 CURRENT_MODEL_NAME  = "gemini-2.5-flash-preview-05-20"
 GEMINI_KEY          = os.environ["GEMINI_KEY"]
 ALT_KEY             = os.environ["GEMINI_ALT_KEY"]
-TYPE_PATH           = Path(".\Processing_Files\Danmachi_vol20\Type.json")
-GLOSSARY_PATH       = Path(".\Processing_Files\Danmachi_vol20\Glossary.json")
+TYPE_PATH           = Path(".") / "Processing_Files" / "Danmachi_vol20" / "Type.json"
+GLOSSARY_PATH       = Path(".") / "Processing_Files" / "Danmachi_vol20" / "Glossary.json"
 MAX_RETRIES         = 3
 RETRY_DELAY         = 6                               # seconds
 START_PAGE          = 13
 END_PAGE            = 421
+BATCH_MODE          = os.getenv("GEMINI_BATCH") == "1"  # one Batch API job for all pages
+BATCH_DIR           = TYPE_PATH.parent / "batch"
 
 COMBOS = [
-    {"key": GEMINI_KEY, "model": MODEL_NAME},         # 1  primary key + 2.5
-    {"key": ALT_KEY,   "model": MODEL_NAME},          # 2  alt key     + 2.5
-    {"key": GEMINI_KEY, "model": FALLBACK_MODEL},     # 3  primary key + 2.0
-    {"key": ALT_KEY,   "model": FALLBACK_MODEL},      # 4  alt key     + 2.0
+    {"key": GEMINI_KEY, "tag": "primary", "model": MODEL_NAME},      # 1  primary key + 2.5
+    {"key": ALT_KEY,    "tag": "alt",     "model": MODEL_NAME},      # 2  alt key     + 2.5
+    {"key": GEMINI_KEY, "tag": "primary", "model": FALLBACK_MODEL},  # 3  primary key + 2.0
+    {"key": ALT_KEY,    "tag": "alt",     "model": FALLBACK_MODEL},  # 4  alt key     + 2.0
 ]
 COMBOS = [c for c in COMBOS if c["key"]]
-combo_idx = 0
+SCHEDULER = QuotaScheduler(COMBOS)      # each call goes to the first combo with budget left
+CACHE     = get_cache()                         # LLM_CACHE=off to bypass
+POOL      = get_pool()                          # per-key clients, models reused across pages
+TELEMETRY = Telemetry(script="gemini_generate_glossary_rawtext", volume=TYPE_PATH.parent.name)
 
 # ─── System instruction – glossary from raw text ─────────────────────── #
 SYSTEM_PROMPT = """
@@ -103,48 +114,116 @@ def update_glossary(extracted: Dict[str, str], master: Dict[str, List[str]]) ->
         elif en not in master[jp]:
             master[jp].append(en)
 
-def call_gemini(page_text: str) -> dict | str | None:
-    """Ask Gemini to extract glossary. Walk through COMBOS on 429 errors."""
-    global combo_idx
-    api_key  = COMBOS[combo_idx]["key"]
-    model_id = COMBOS[combo_idx]["model"]
-
-    genai.configure(api_key=api_key)
-
-    prompt = f"""Extract the glossary JSON for the following page:
+def glossary_prompt(page_text: str) -> str:
+    return f"""Extract the glossary JSON for the following page:
 
 <BEGIN_PAGE_TEXT>
 {page_text}
 <END_PAGE_TEXT>"""
 
-    for attempt in range(1, MAX_RETRIES + 1):
+def needs_extraction(page: dict) -> bool:
+    if not page.get("contains_text") or not page.get("rawtext", "").strip():
+        return False                            # nothing to do
+    if int(page["page_no"]) < START_PAGE or int(page["page_no"]) >= END_PAGE:
+        return False
+    # skip if we already captured terms from this page in a previous run
+    # (quick heuristic: store a hidden marker)
+    return "__glossary_extracted" not in page
+
+def call_gemini(page_text: str) -> dict | str | None:
+    """Ask Gemini to extract glossary on whichever combo the quota scheduler picks."""
+    prompt = glossary_prompt(page_text)
+    for model_id in dict.fromkeys(c["model"] for c in COMBOS):
+        cached = CACHE.get(cache_key(model_id, SYSTEM_PROMPT, prompt, config=GENERATION_CONFIG))
+        if cached is not None:
+            TELEMETRY.cache_hit(model_id)
+            return safe_json_load(cached)
+
+    est = estimate_tokens(SYSTEM_PROMPT + prompt) + 500      # + a modest JSON answer
+    attempt = 0
+    while attempt < MAX_RETRIES:
+        slot = SCHEDULER.acquire(est)
+        if slot is None:
+            print("\nRate limit exhausted on all combos, ending safely.")
+            return "LIMITED"
+        combo = slot.combo
+        call = TELEMETRY.start(combo["model"], combo["tag"], cache="miss")
         try:
-            model = genai.GenerativeModel(
-                model_name=model_id,
-                system_instruction=SYSTEM_PROMPT,
-            )
-            resp = model.generate_content(prompt)
+            model = POOL.model(combo["key"], combo["model"], SYSTEM_PROMPT)
+            resp = model.generate_content(prompt, generation_config=GENERATION_CONFIG)
+            SCHEDULER.record(slot, usage_tokens(resp))
+            call.usage(*gemini_usage(resp))
             payload = resp.candidates[0].content.parts[0].text.strip()
-            return safe_json_load(payload)
+            result = safe_json_load(payload)
+            call.done()
+            CACHE.put(cache_key(combo["model"], SYSTEM_PROMPT, prompt, config=GENERATION_CONFIG), payload)  # only parseable answers
+            return result
 
         except Exception as err:
             msg = str(err)
+            POOL.failed(combo["key"], combo["model"], SYSTEM_PROMPT, err)
             if "429" in msg or "quota" in msg.lower():
-                if combo_idx < len(COMBOS) - 1:
-                    combo_idx += 1
-                    next_combo = COMBOS[combo_idx]
-                    print(f"\nRate-limited → switching to {next_combo['model']} on {'alt' if combo_idx%2 else 'primary'} key …")
-                    time.sleep(RETRY_DELAY)
-                    return call_gemini(page_text)
-                else:
-                    print("\nRate limit exhausted on all combos, ending safely.")
-                    return "LIMITED"
+                call.done("429", throttled=True)
+                print(f"\nRate-limited on {combo['model']} / {combo['tag']} key → cooling it down …")
+                SCHEDULER.penalize(slot)        # next acquire() routes to another combo
+                continue
+            call.done(msg)
 
+            attempt += 1
             if attempt == MAX_RETRIES:
                 print(f"\n(Gemini) final failure: {err}")
                 return None
             time.sleep(RETRY_DELAY)
 
+def extract_online(pages: List[dict], glossary: Dict[str, List[str]]) -> None:
+    for page in tqdm(pages, unit="page"):
+        if not needs_extraction(page):
+            continue
+
+        with TELEMETRY.scope("glossary", unit=page["page_no"]) as scope:
+            result = call_gemini(page["rawtext"].strip())
+            scope.verdict = "AllGood" if isinstance(result, dict) else "Failed"
+        if result == "LIMITED":
+            break
+        if not result:
+            continue
+
+        update_glossary(result.get("glossary", {}), glossary)
+        page["__glossary_extracted"] = True     # mark so future reruns skip it
+
+def extract_batch(batch: GeminiBatch, todo: List[dict], glossary: Dict[str, List[str]]) -> None:
+    """
+    Batch-API run over *todo*; pages whose answer is not valid JSON go into
+    the next round.  The caller calls batch.done() once the results are saved.
+    """
+    for rnd in range(1, MAX_RETRIES + 1):
+        if not todo: break
+        prompts = {p["page_no"]: glossary_prompt(p["rawtext"].strip()) for p in todo}
+        answers = {}
+        for pno, prompt in prompts.items():
+            cached = CACHE.get(cache_key(MODEL_NAME, SYSTEM_PROMPT, prompt, config=GENERATION_CONFIG))
+            if cached is not None: answers[pno] = (cached, "")
+        reqs = {pno: text_request(prompt, SYSTEM_PROMPT, GENERATION_CONFIG)
+                for pno, prompt in prompts.items() if pno not in answers}
+        if reqs:
+            answers.update(batch.run(reqs, BATCH_DIR / f"glossary_round{rnd}.jsonl",
+                                     f"{TYPE_PATH.parent.name}-glossary-r{rnd}"))
+
+        retry = []
+        for page in todo:                       # page order, so the first rendering seen wins
+            payload, err = answers.get(page["page_no"], (None, "MISSING"))
+            try:
+                result = safe_json_load(payload) if payload else None
+            except json.JSONDecodeError:
+                result = None
+            if not isinstance(result, dict):
+                retry.append(page); continue
+            CACHE.put(cache_key(MODEL_NAME, SYSTEM_PROMPT, prompts[page["page_no"]], config=GENERATION_CONFIG), payload)
+            update_glossary(result.get("glossary", {}), glossary)
+            page["__glossary_extracted"] = True
+        print(f"[batch] round {rnd}: {len(todo) - len(retry)} page(s) extracted, {len(retry)} to retry")
+        todo = retry
+
 # ─── Main ─────────────────────────────────────────────────────────────── #
 def main() -> None:
     # ---------- load page metadata & prepare output ----------
@@ -161,29 +240,11 @@ def main() -> None:
         glossary: Dict[str, List[str]] = {}
 
     print(f"Scanning {len(pages)} pages for raw text …")
-    for page in tqdm(pages, unit="page"):
-        page_no   = page["page_no"]
-        rawtext   = page.get("rawtext", "").strip()
-
-        if not page.get("contains_text") or not rawtext:
-            continue                            # nothing to do
-
-        if int(page_no) < START_PAGE or int(page_no) >= END_PAGE:
-            continue
-
-        # skip if we already captured terms from this page in a previous run
-        # (quick heuristic: store a hidden marker)
-        if "__glossary_extracted" in page:
-            continue
-
-        result = call_gemini(rawtext)
-        if result == "LIMITED":
-            break
-        if not result:
-            continue
-
-        update_glossary(result.get("glossary", {}), glossary)
-        page["__glossary_extracted"] = True     # mark so future reruns skip it
+    batch = GeminiBatch(GEMINI_KEY, MODEL_NAME) if BATCH_MODE else None
+    if BATCH_MODE:
+        extract_batch(batch, [p for p in pages if needs_extraction(p)], glossary)
+    else:
+        extract_online(pages, glossary)
 
     # ---------- dump glossary ----------
     GLOSSARY_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -192,8 +253,12 @@ def main() -> None:
 
     with TYPE_PATH.open("w", encoding="utf-8") as f:
         json.dump(pages, f, ensure_ascii=False, indent=2)
+    if batch is not None:
+        batch.done()                            # glossary.json and Type.json hold the results
 
     print(f"✓ Fresh glossary written to {GLOSSARY_PATH}")
+    print(CACHE.summary())
+    print(SCHEDULER.summary())
 
 if __name__ == "__main__":
     main()
@@ -1,22 +1,48 @@
 from __future__ import annotations
 
 import json, os, time, re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List
-from PIL import Image
+from typing import Dict, List, Tuple
 from tqdm import tqdm
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from gemini_batch import GeminiBatch, image_request
+from gemini_clients import get_pool
+from image_prep import prepare
+from page_classifier import classify_all, needs_vision
+from rate_limiter import QuotaScheduler, estimate_tokens, usage_tokens
+from response_cache import cache_key, get_cache
+from telemetry import Telemetry, gemini_usage
+
 # ─── Config ──────────────────────────────────────────────────────────── #
 load_dotenv()
 MODEL_NAME          = "gemini-2.5-pro"
+GENERATION_CONFIG   = {}                              # sampling settings, e.g. {"temperature": 0.3}; part of the cache key
 GEMINI_KEY          = os.environ["GEMINI_KEY"]
-IMAGES_DIR          = Path(".\Input\Danmachi_vol20\Images")
-TYPE_PATH           = Path(".\Processing_Files\Danmachi_vol20\Type.json")
-SIZE_LIMIT_BYTES    = 2 * 1024 * 1024                 # 2 MB
+ALT_KEY             = os.getenv("GEMINI_ALT_KEY", "")
+IMAGES_DIR          = Path(".") / "Input" / "Danmachi_vol20" / "Images"
+TYPE_PATH           = Path(".") / "Processing_Files" / "Danmachi_vol20" / "Type.json"
 MAX_RETRIES         = 3
 RETRY_DELAY         = 6                               # seconds
+CONCURRENCY         = int(os.getenv("GEMINI_CONCURRENCY", "4"))   # vision calls in flight
+PAGES               = os.getenv("OCR_PAGES", "")      # e.g. "13" or "13-40"; empty = every page
+FLUSH_EVERY         = 10                              # pages merged between Type.json rewrites
+PAGE_RE             = re.compile(r"page_(\d+)\.png")
+IMAGE_TOKENS        = 2_400                           # ~9 tiles for a prepared (≤2304 px) page
+CACHE               = get_cache()                     # LLM_CACHE=off to bypass
+BATCH_MODE          = os.getenv("GEMINI_BATCH") == "1"  # OCR every page in one Batch API job
+BATCH_DIR           = TYPE_PATH.parent / "batch"
+OCR_PROMPT          = "Transcribe this page per the rules."
+LOCAL_CLASSIFY      = os.getenv("LOCAL_CLASSIFY", "1") == "1"   # settle illustrations / blanks without a call
+
+# calls go to the first (key, model) combo with RPM/TPM/RPD headroom, so
+# throughput follows the key quota rather than one round-trip at a time
+COMBOS    = [{"key": k, "tag": tag, "model": MODEL_NAME}
+             for k, tag in [(GEMINI_KEY, "primary"), (ALT_KEY, "alt")] if k]
+SCHEDULER = QuotaScheduler(COMBOS)
+POOL      = get_pool()                  # per-key clients; no process-global configure() per call
+TELEMETRY = Telemetry(script="gemini_generate_rawtext", volume=TYPE_PATH.parent.name)
 
 # ─── System instruction – OCR with ruby tagging ──────────────────────── #
 SYSTEM_PROMPT = """
@@ -29,7 +55,8 @@ For each page image you receive:
 4. This image is from the light novel *Danmachi* (“Danjon ni Deai o Motomeru no wa Machigatteiru Darō ka”, “Is It Wrong to Try to Pick Up Girls in a Dungeon?”); use that context for resolving proper-nouns that may not be clear in the image.
 5. Return **only** a JSON object following this format:
    {
-     "rawtext": "<transcribed text>"
+     "rawtext": "<transcribed text>",            # "" if the page has no text
+     "contains_illustration": true|false         # drawings / diagrams / manga panels on the page
    }
 6. Return only a JSON object, without any markdown.
 7. Think very carefully about each word that you transcribe. If you find that the word that you're about to output is not meshing with the context thus far, check the image once more to ensure that your transciption is accurate.
@@ -38,29 +65,50 @@ For each page image you receive:
 """
 
 # ─── Helpers ─────────────────────────────────────────────────────────── #
-def call_gemini(image_path: Path) -> dict | None:
-    """Ask Gemini for the structured OCR payload of one page image."""
-    genai.configure(api_key=GEMINI_KEY or os.getenv("GOOGLE_API_KEY", ""))
-
-    model = genai.GenerativeModel(
-        model_name=MODEL_NAME,
-        system_instruction=SYSTEM_PROMPT,
-    )
-
-    prompt = "Transcribe this page per the rules."
-    img    = Image.open(image_path)
-
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            resp = model.generate_content([prompt, img])
-            raw = resp.candidates[0].content.parts[0].text.strip()
-            payload = _strip_code_fence(raw)
-            return json.loads(payload)          # validates that we got pure JSON
-        except Exception as err:
-            if attempt == MAX_RETRIES:
-                print(f"[{image_path.name}] failed: {err}")
-                return None
-            time.sleep(RETRY_DELAY)
+def call_gemini(image_path: Path) -> dict | str | None:
+    """Structured OCR payload of one page image; "LIMITED" once every combo is out of quota."""
+    prompt = OCR_PROMPT
+    image  = prepare(image_path)                # grayscale, ≤2304 px WebP instead of a 600-dpi PNG
+    key    = cache_key(MODEL_NAME, SYSTEM_PROMPT, prompt, images=[image.path], config=GENERATION_CONFIG)
+    cached = CACHE.get(key)
+    if cached is not None:
+        TELEMETRY.record(MODEL_NAME, stage="ocr", unit=image_path.stem, cache="hit")
+        return json.loads(cached)
+
+    est = IMAGE_TOKENS + estimate_tokens(SYSTEM_PROMPT + prompt) + 1_000   # + the transcription
+    attempt = 0
+    while attempt < MAX_RETRIES:
+        slot = SCHEDULER.acquire(est)
+        if slot is None:
+            return "LIMITED"
+        with TELEMETRY.scope("ocr", unit=image_path.stem, attempt=attempt + 1) as scope:
+            call = TELEMETRY.start(slot.combo["model"], slot.combo["tag"], cache="miss")
+            try:
+                model = POOL.model(slot.combo["key"], slot.combo["model"], SYSTEM_PROMPT)
+                resp = model.generate_content([prompt, image.part()], generation_config=GENERATION_CONFIG)
+                SCHEDULER.record(slot, usage_tokens(resp))
+                call.usage(*gemini_usage(resp))
+                call.done()
+                raw = resp.candidates[0].content.parts[0].text.strip()
+                payload = _strip_code_fence(raw)
+                scope.verdict = "Malformed"
+                result = json.loads(payload)    # validates that we got pure JSON
+                scope.verdict = "AllGood"
+                CACHE.put(key, payload)         # only well-formed answers are cached
+                return result
+            except Exception as e:
+                err = e
+                POOL.failed(slot.combo["key"], slot.combo["model"], SYSTEM_PROMPT, e)
+                if call.latency_s is None:      # the request itself failed
+                    call.done(str(e), throttled="429" in str(e) or "quota" in str(e).lower())
+        if call.throttled:
+            SCHEDULER.penalize(slot)            # next acquire() routes to another combo
+            continue
+        attempt += 1
+        if attempt == MAX_RETRIES:
+            print(f"[{image_path.name}] failed: {err}")
+            return None
+        time.sleep(RETRY_DELAY)
 
 def _strip_code_fence(text: str) -> str:
     """
@@ -73,6 +121,84 @@ def _strip_code_fence(text: str) -> str:
     text = re.sub(r'\s*```\s*$', '', text)
     return text.strip()
 
+def ocr_batch(batch: GeminiBatch, image_paths: List[Path]) -> List[tuple]:
+    """
+    Batch-API OCR; pages whose answer is not valid JSON go into the next
+    round.  The caller calls batch.done() once the results are saved.
+    """
+    results = []
+    todo    = list(image_paths)
+    for rnd in range(1, MAX_RETRIES + 1):
+        if not todo: break
+        prepped = {}
+        for p in list(todo):
+            try:
+                prepped[p.stem] = prepare(p).path
+            except Exception as e:              # unreadable image: skip the page like a failed call
+                print(f"[{p.name}] failed: {e}")
+                todo.remove(p)
+        keys    = {stem: cache_key(MODEL_NAME, SYSTEM_PROMPT, OCR_PROMPT, images=[d], config=GENERATION_CONFIG) for stem, d in prepped.items()}
+        answers = {}
+        for stem, key in keys.items():
+            cached = CACHE.get(key)
+            if cached is not None: answers[stem] = (cached, "")
+        reqs = {p.stem: image_request(OCR_PROMPT, prepped[p.stem], SYSTEM_PROMPT, GENERATION_CONFIG)
+                for p in todo if p.stem not in answers}
+        if reqs:
+            answers.update(batch.run(reqs, BATCH_DIR / f"ocr_round{rnd}.jsonl",
+                                     f"{TYPE_PATH.parent.name}-ocr-r{rnd}"))
+
+        retry = []
+        for p in todo:
+            raw, err = answers.get(p.stem, (None, "MISSING"))
+            try:
+                payload = _strip_code_fence(raw) if raw else ""
+                result = json.loads(payload)
+            except json.JSONDecodeError:
+                retry.append(p); continue
+            CACHE.put(keys[p.stem], payload)
+            results.append((p, result))
+        print(f"[batch] round {rnd}: {len(todo) - len(retry)} page(s) transcribed, {len(retry)} to retry")
+        todo = retry
+    return results
+
+def discover_pages(images_dir: Path) -> List[Tuple[str, Path]]:
+    """Every page_NNN.png under *images_dir* as (page_no, path), in page order, OCR_PAGES applied."""
+    found = [(m.group(1), p) for p in images_dir.glob("page_*.png")
+             if (m := PAGE_RE.fullmatch(p.name))]
+    if PAGES:
+        lo, _, hi = PAGES.partition("-")
+        found = [(n, p) for n, p in found if int(lo) <= int(n) <= int(hi or lo)]
+    return sorted(found, key=lambda t: int(t[0]))
+
+def ocr_online(todo: List[Tuple[str, Path]], on_result) -> None:
+    """Bounded worker pool; results are handed back to the calling (writer) thread."""
+    with ThreadPoolExecutor(max_workers=max(1, CONCURRENCY)) as pool:
+        futures = {pool.submit(call_gemini, path): (page_no, path) for page_no, path in todo}
+        limited = False
+        for fut in tqdm(as_completed(futures), total=len(futures), unit="page"):
+            try:
+                result = fut.result() if not fut.cancelled() else None
+            except Exception as e:              # unreadable image etc.: skip the page like a failed call
+                print(f"[{futures[fut][1].name}] failed: {e}")
+                result = None
+            if result == "LIMITED":
+                if not limited:
+                    print("\nRate limit exhausted on all combos, finishing the pages in flight.")
+                    for f in futures: f.cancel()
+                limited = True
+                continue
+            if result:
+                on_result(*futures[fut], result)
+
+def save_types(by_page: Dict[str, dict]) -> None:
+    """Atomic rewrite of Type.json, in natural numeric page order."""
+    updated = sorted(by_page.values(), key=lambda d: int(d["page_no"]))
+    tmp = TYPE_PATH.with_name(TYPE_PATH.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(updated, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, TYPE_PATH)
+
 # ─── Main ─────────────────────────────────────────────────────────────── #
 def main() -> None:
     TYPE_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -88,49 +214,63 @@ def main() -> None:
     # Map for quick lookup / update
     by_page: Dict[str, dict] = {p["page_no"]: p for p in page_types}
 
-    test_page = IMAGES_DIR / "page_013.png"
-    image_paths = [test_page] if test_page.exists() else []
-    #image_paths = sorted(IMAGES_DIR.glob("page_*.png"))
-
-    print(f"Processing {len(image_paths)} page(s)…")
-    for img_path in tqdm(image_paths, unit="page"):
-        page_no = img_path.stem.split("_")[1]
-
-        # skip processed pages
-        if by_page.get(page_no, {}).get("rawtext"):
-            continue
-
-        # big illustration pages ­– mark, but skip OCR to save quota
-        if img_path.stat().st_size > SIZE_LIMIT_BYTES:
-            rec = by_page.get(page_no, {})
-            rec.update({
-                "page_no": page_no,
-                "contains_text": False,
-                "contains_illustration": True,
-                "rawtext": ""
-            })
-            by_page[page_no] = rec
+    todo: List[Tuple[str, Path]] = []
+    for page_no, img_path in discover_pages(IMAGES_DIR):
+        # skip processed pages and pages already settled as pure illustration / blank
+        rec = by_page.get(page_no, {})
+        if rec.get("rawtext") or not needs_vision(rec):
             continue
+        todo.append((page_no, img_path))
 
-        result = call_gemini(img_path)
-        if not result:
-            continue
+    if LOCAL_CLASSIFY and todo:
+        # pages the local classifier is sure carry no text never reach the vision model
+        verdicts = classify_all([p for _, p in todo])
+        keep: List[Tuple[str, Path]] = []
+        for (page_no, img_path), pc in zip(todo, verdicts):
+            if pc.confident and not pc.contains_text:
+                by_page[page_no] = {**by_page.get(page_no, {}), "page_no": page_no, "contains_text": False,
+                                    "contains_illustration": pc.contains_illustration, "rawtext": ""}
+            else:
+                keep.append((page_no, img_path))
+        print(f"Local classifier: {len(todo) - len(keep)} illustration/blank page(s) need no OCR call.")
+        todo = keep
 
+    # this thread is the only one touching by_page / Type.json; workers just return results
+    merged = 0
+    def merge(page_no: str, img_path: Path, result: dict) -> None:
+        nonlocal merged
+        rawtext = result.get("rawtext", "")
         rec = by_page.get(page_no, {})
+        rec.pop("needs_ocr", None)
         rec.update({
             "page_no": page_no,
-            "contains_text": True,
-            "contains_illustration": False,
-            "rawtext": result.get("rawtext", "")
+            "contains_text": bool(rawtext.strip()),
+            "contains_illustration": bool(result.get("contains_illustration")),
+            "rawtext": rawtext
         })
         by_page[page_no] = rec
+        merged += 1
+        if merged % FLUSH_EVERY == 0:
+            save_types(by_page)                 # a crash loses at most FLUSH_EVERY pages (and those are cached)
 
-    # dump back in natural numeric order
-    updated = sorted(by_page.values(), key=lambda d: int(d["page_no"]))
-    with open(TYPE_PATH, "w", encoding="utf-8") as f:
-        json.dump(updated, f, ensure_ascii=False, indent=2)
+    print(f"Processing {len(todo)} page(s) with {CONCURRENCY} worker(s)…")
+    batch = GeminiBatch(GEMINI_KEY, MODEL_NAME) if BATCH_MODE else None
+    try:
+        if BATCH_MODE:
+            for img_path, result in ocr_batch(batch, [p for _, p in todo]):
+                if result:
+                    merge(img_path.stem.split("_")[1], img_path, result)
+        else:
+            ocr_online(todo, merge)
+    finally:
+        save_types(by_page)
+    if batch is not None:
+        batch.done()                            # Type.json holds every transcribed page
 
-    print(f"✓ Updated page metadata + raw text written to {TYPE_PATH}")
+    print(f"✓ Updated page metadata + raw text for {merged} page(s) written to {TYPE_PATH}")
+    print(CACHE.summary())
+    if not BATCH_MODE:
+        print(SCHEDULER.summary())
 
 if __name__ == "__main__":
     main()
@@ -2,11 +2,16 @@ import json
 import os
 import re
 import time
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from tqdm import tqdm
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from checkpoint_store import CheckpointStore
+from gemini_clients import get_pool
+
 logging.basicConfig(
     filename='refining_log.log',
     level=logging.INFO,
@@ -16,6 +21,20 @@ logging.basicConfig(
 
 load_dotenv()
 gemini_key = os.environ["GEMINI_KEY"]
+pool = get_pool()
+
+# chunks refined at once; each one only reads its neighbours, so they can run
+# side by side (1 = one after another, continuing from the chunk just refined)
+refine_concurrency = int(os.getenv("REFINE_CONCURRENCY", "4"))
+
+# SEMANTIC_GLOSSARY=1 also gives each chunk the glossary terms whose English is
+# closest in meaning to its draft, not only the ones matched verbatim in the
+# Chinese (needs sentence-transformers; embeddings are cached beside the glossary)
+semantic_glossary = os.getenv("SEMANTIC_GLOSSARY") == "1"
+glossary_file = os.getenv("GLOSSARY_PATH", "glossary.json")
+semantic_model = os.getenv("SEMANTIC_MODEL", "all-MiniLM-L6-v2")
+semantic_top_k = 8
+semantic_min_score = 0.45
 
 system_message = """
     You are a highly skilled editor with expert level knowledge of both English and Chinese.
@@ -58,8 +77,7 @@ Now, generate the edited English text as per the instructions.
     """
 
 def generate_response(prompt, model="gemini-2.0-flash-thinking-exp-01-21"):
-    genai.configure(api_key=gemini_key)
-    model_instance = genai.GenerativeModel(model_name=model, system_instruction=system_message)
+    model_instance = pool.model(gemini_key, model, system_message)
     max_retries = 15
     delay = 10
     for attempt in range(1, max_retries + 1):
@@ -97,39 +115,118 @@ def translation_validity(response):
         logging.info(f"Error when checking validity: {e}")
         return "Error"
 
+def load_glossary():
+    """The current glossary.json, or {} when there is none."""
+    if not os.path.exists(glossary_file):
+        return {}
+    with open(glossary_file, 'r', encoding='utf-8') as gf:
+        return json.load(gf)
+
+def semantic_glossary_hits(staging_data, chunk_keys, glossary):
+    """{chunk key: extra glossary entries}, found by embedding similarity; {} when disabled or unavailable."""
+    if not semantic_glossary or not chunk_keys:
+        return {}
+    try:
+        from sentence_transformers import SentenceTransformer
+        from glossary_embeddings import load_glossary_embeddings
+    except ImportError:
+        print("SEMANTIC_GLOSSARY=1 needs numpy and sentence-transformers; using the verbatim glossary only.")
+        return {}
+    if not glossary:
+        print(f"SEMANTIC_GLOSSARY=1: {glossary_file} not found; using the verbatim glossary only.")
+        return {}
+
+    # one entry per distinct English rendering, matched against the English drafts
+    by_text = {}
+    for term, renderings in glossary.items():
+        renderings = renderings if isinstance(renderings, list) else [renderings]
+        by_text.setdefault(", ".join(renderings), []).append(term)
+    encoder = SentenceTransformer(semantic_model)
+    index = load_glossary_embeddings(Path(glossary_file), by_text, encoder, semantic_model)
+
+    drafts = encoder.encode([staging_data[k]["English"] for k in chunk_keys])
+    hits = index.search(drafts, k=semantic_top_k, threshold=semantic_min_score)
+    return {key: {term: glossary[term] for text, _ in found for term in by_text[text]}
+            for key, found in zip(chunk_keys, hits)}
+
+def chunk_glossary(chunk, glossary, extra):
+    """The chunk's glossary terms with their current renderings, plus any semantic hits."""
+    own = {term: glossary.get(term, renderings) for term, renderings in chunk["Glossary"].items()}
+    return {**extra, **own}
+
+def refine_hash(chunk, chunk_terms):
+    """Fingerprint of what a refine of this chunk depends on: its English draft and its glossary."""
+    payload = json.dumps([chunk["English"], chunk_terms], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def previous_context(staging_data, chunk_key):
+    """The chunk before *chunk_key* as it stands now: refined if it has been, else its draft."""
+    number = int(chunk_key.split()[1])
+    if number == 1:
+        return "This is the first chunk"
+    previous = staging_data.get("chunk " + str(number - 1), {})
+    refined = previous.get("Refined", "")
+    return refined if refined and refined != "ERROR" else previous.get("English", "")
+
 def process_chunks(staging_file, output_file):
     if not os.path.exists(staging_file):
         print(f"Error: {staging_file} does not exist.")
         return
-    with open(staging_file, 'r', encoding='utf-8') as sf:
-        staging_data = json.load(sf)
     error_flag = False
-    sorted_chunk_keys = sorted(staging_data.keys(), key=lambda x: int(x.split()[1]))
-    previous = "This is the first chunk"
-    
-    with tqdm(total=len(sorted_chunk_keys), desc="Processing Chunks") as pbar:
+    glossary = load_glossary()
+
+    # every put() is appended to mapping.json.wal, and the chunks are committed in order
+    with CheckpointStore(staging_file, indent=4) as store:
+        staging_data = store.data
+        sorted_chunk_keys = sorted(staging_data.keys(), key=lambda x: int(x.split()[1]))
+        extra_glossary = semantic_glossary_hits(staging_data, sorted_chunk_keys, glossary)
+        terms = {k: chunk_glossary(staging_data[k], glossary, extra_glossary.get(k, {})) for k in sorted_chunk_keys}
+        hashes = {k: refine_hash(staging_data[k], terms[k]) for k in sorted_chunk_keys}
+
+        # a chunk is refined again only when its draft or its glossary changed since the last refine
+        pending = []
         for chunk_key in sorted_chunk_keys:
             chunk = staging_data[chunk_key]
-            if "Refined" in chunk and chunk.get("Refined", "") != "ERROR":
-                pbar.update(1)
-                continue
+            if chunk.get("Refined", "") in ("", "ERROR"):
+                pending.append(chunk_key)
+            elif "RefineHash" not in chunk:         # refined before hashes were kept: take it as current
+                store.put(chunk_key, {**chunk, "RefineHash": hashes[chunk_key]})
+            elif chunk["RefineHash"] != hashes[chunk_key]:
+                pending.append(chunk_key)
+
+        def editing_prompt(chunk_key):
+            chunk = staging_data[chunk_key]
             logging.info(f"Starting process for {chunk_key}")
-            if chunk_key != "chunk 1":
-                previous = staging_data["chunk " + str(int(chunk_key.split()[1]) - 1)]["Refined"]
-            prompt = generate_editing_prompt(
-                previous,
+            return generate_editing_prompt(
+                previous_context(staging_data, chunk_key),
                 chunk["Chinese"],
                 chunk["English"],
-                chunk["Glossary"]
+                terms[chunk_key]
             )
-            response = generate_response(prompt)
-            previous = response
-            chunk["Refined"] = response
-            if response == "ERROR":
-                error_flag = True
-            with open(staging_file, 'w', encoding='utf-8') as sf:
-                json.dump(staging_data, sf, ensure_ascii=False, indent=4)
-            pbar.update(1)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, refine_concurrency))
+        try:
+            with tqdm(total=len(sorted_chunk_keys), initial=len(sorted_chunk_keys) - len(pending),
+                      desc="Processing Chunks") as pbar:
+                # one at a time, each chunk is submitted after the one before it is committed
+                # and continues from its fresh refine; concurrently, all are submitted now
+                # against their neighbours as they stand, and the pool bounds how many run
+                futures = (executor.submit(generate_response, editing_prompt(chunk_key)) for chunk_key in pending)
+                if refine_concurrency > 1:
+                    futures = list(futures)
+                for chunk_key, future in zip(pending, futures):
+                    response = future.result()
+                    record = {**staging_data[chunk_key], "Refined": response}
+                    if response == "ERROR":
+                        error_flag = True
+                        record.pop("RefineHash", None)
+                    else:
+                        record["RefineHash"] = hashes[chunk_key]
+                    store.put(chunk_key, record)
+                    pbar.update(1)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)   # Ctrl-C: drop the chunks not yet started
+
     if not error_flag:
         with open(output_file, 'w', encoding='utf-8') as out:
             for chunk_key in sorted_chunk_keys:
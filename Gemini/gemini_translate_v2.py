@@ -1,4 +1,3 @@
-import tiktoken
 import json
 import os
 import re
@@ -6,6 +5,10 @@ from tqdm import tqdm
 import logging
 import google.generativeai as genai
 from dotenv import load_dotenv
+from chunker import check_resume, get_chunks
+from glossary_index import load_glossary_index
+from glossary_validator import GlossaryValidator
+from token_budget import chunk_tokens, counter_for
 
 load_dotenv()
 gemini_key = os.environ["GEMINI_KEY"]
@@ -58,37 +61,6 @@ def generate_translation_prompt(previous_translation, current_chunk, glossary_te
             {current_chunk}
             """
 
-def get_chunks(file_path, tokens_per_chunk, encoding_name="cl100k_base"):
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-
-    chunks = []
-    current_chunk = []
-    current_tokens = 0
-
-    for line in lines:
-        line_tokens = tokenizer.encode(line)
-        line_token_count = len(line_tokens)
-        if current_tokens + line_token_count > tokens_per_chunk:
-            chunks.append(tokenizer.decode(sum(current_chunk, [])))
-            current_chunk = []
-            current_tokens = 0
-
-        # Add the current line to the chunk
-        current_chunk.append(line_tokens)
-        current_tokens += line_token_count
-
-    # Add any remaining lines as the last chunk
-    if current_chunk:
-        chunks.append(tokenizer.decode(sum(current_chunk, [])))
-
-    total_tokens = sum(len(tokenizer.encode(chunk)) for chunk in chunks)
-    print(f"Total number of tokens in the original file: {total_tokens}")
-    print(f"Number of chunks created: {len(chunks)}")
-
-    return chunks
-
 def generate_response(prompt, model):
     genai.configure(api_key=gemini_key)
     model = genai.GenerativeModel(model_name=model, system_instruction=system_message)
@@ -98,14 +70,11 @@ def generate_response(prompt, model):
             return response.candidates[0].content.parts[0].text
     return prompt
 
-def filter_glossary_for_chunk(chunk, glossary):
-    relevant_glossary = {}
-    for key, values in glossary.items():
-        if key in chunk:
-            relevant_glossary[key] = values
-    return relevant_glossary
+def filter_glossary_for_chunk(chunk, glossary, index):
+    # One Aho-Corasick pass over the chunk; terms nested inside a longer hit are dropped
+    return index.filter(chunk, glossary)
 
-def translation_validity(response, glossary):
+def translation_validity(response, glossary, validator=None):
     try:
         # Check if the text contains Chinese characters
         chinese_characters = re.search(r'[\u4e00-\u9fff]', response)
@@ -116,10 +85,10 @@ def translation_validity(response, glossary):
         if "translation" in response.lower():
             return "Preceding"
         
-        # Check glossary consistency
-        for term, translations in glossary.items():
-            if not any(re.search(re.escape(translation), response, re.IGNORECASE) for translation in translations):
-                return "Glossary"
+        # Check glossary consistency - one combined regex scan instead of one search per variant
+        validator = validator or GlossaryValidator(glossary)
+        if validator.missing(response, glossary):
+            return "Glossary"
             
         return "AllGood"
     except Exception as e:
@@ -144,7 +113,9 @@ def extract_english_sections(mapping_file, output_file):
         print(f"An error occurred: {e}")
 
 def process_file(input_file, glossary_file, staging_file, output_file, tokens_per_chunk, max_retries, model="gemini-2.0-flash-thinking-exp-01-21"):
-    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk)
+    # tokens_per_chunk=None → sized for the model's context and answer length (token_budget.py)
+    tokens_per_chunk = tokens_per_chunk or chunk_tokens(model, system_message, reserve=600)
+    chunks = get_chunks(input_file, tokens_per_chunk=tokens_per_chunk, counter=counter_for(model))
 
     # Load the glossary
     if os.path.exists(glossary_file):
@@ -155,6 +126,8 @@ def process_file(input_file, glossary_file, staging_file, output_file, tokens_pe
         return
     
     print(f"Glossary file found with {len(glossary)} entries.")
+    index = load_glossary_index(glossary_file, glossary)
+    validator = GlossaryValidator(glossary)
 
     # Load or initialize the staging file
     if os.path.exists(staging_file):
@@ -162,6 +135,7 @@ def process_file(input_file, glossary_file, staging_file, output_file, tokens_pe
             staging_data = json.load(sf)
     else:
         staging_data = {}
+    check_resume(staging_data, chunks, staging_file)
 
     # Resume processing from the last unprocessed chunk
     last_processed_chunk = max(int(key.split()[1]) for key in staging_data.keys()) if staging_data else 0
@@ -175,7 +149,7 @@ def process_file(input_file, glossary_file, staging_file, output_file, tokens_pe
                 pbar.update(1)
                 continue
 
-            glossary_subset = filter_glossary_for_chunk(chunk, glossary)
+            glossary_subset = filter_glossary_for_chunk(chunk, glossary, index)
             glossary_text = "\n".join([f'"{key}": "{", ".join(values)}"' for key, values in glossary_subset.items()])
             retries = 0
             valid_response = False
@@ -185,7 +159,7 @@ def process_file(input_file, glossary_file, staging_file, output_file, tokens_pe
             while retries < max_retries and not valid_response:
                 prompt = generate_translation_prompt(previous_translation, chunk, glossary_text)
                 response = generate_response(prompt + f"\n{retry_message}", model)
-                validity = translation_validity(response, glossary_subset)
+                validity = translation_validity(response, glossary_subset, validator)
 
                 if validity == "AllGood":
                     valid_response = True
@@ -227,5 +201,5 @@ if __name__ == "__main__":
     staging_file = "mapping.json"
     output_file = "English.txt"
 
-    process_file(input_file, glossary_file, staging_file, output_file, tokens_per_chunk=1000, max_retries=5)
+    process_file(input_file, glossary_file, staging_file, output_file, tokens_per_chunk=None, max_retries=5)
     print("\nTranslation complete. Check mapping.json for results.")
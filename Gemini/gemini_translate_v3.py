@@ -11,19 +11,29 @@ from pathlib import Path
 from typing import Dict, List
 from dotenv import load_dotenv
 
-import google.generativeai as genai
-import tiktoken
 from tqdm import tqdm
 
+from checkpoint_store import CheckpointStore
+from chunker import ChunkStats, check_resume, iter_chunks
+from gemini_clients import get_pool
+from glossary_index import GlossaryIndex, load_glossary_index
+from glossary_validator import GlossaryValidator
+from response_cache import cache_key, get_cache
+from token_budget import chunk_tokens, counter_for
+
 # ──────────────────────────────── CONFIG ──────────────────────────────── #
 load_dotenv()
 GEMINI_KEY = os.environ["GEMINI_KEY"]
 
 MODEL_NAME = "gemini-2.5-flash-preview-05-20"
-TOKENS_PER_CHUNK = 1000
+GENERATION_CONFIG: dict = {}            # sampling settings, e.g. {"temperature": 0.3}; part of the cache key
+TOKENS_PER_CHUNK = int(os.getenv("CHUNK_TOKENS", "0"))  # Gemini tokens; 0 → sized by token_budget.py
+PROMPT_RESERVE = 800                  # glossary subset + previous translation + retry hint
 MAX_RETRIES = 3
 RETRY_DELAY = 5
 MISS_ALLOWED = 0
+CACHE = get_cache()                     # LLM_CACHE=off to bypass, =refresh to re-ask
+POOL = get_pool()                       # keeps the client and model alive between chunks
 
 STYLE_PROFILE_PATH = ".\Processing_Files\style_profile.json"
 GLOSSARY_PATH       = ".\Processing_Files\glossary.json"
@@ -86,40 +96,22 @@ FAILURE_HINT = {
 # ───────────────────────── HELPER FUNCTIONS ──────────────────────────── #
 
 
-def chunk_text(file_path: str, tokens_per_chunk: int, encoding_name: str = "cl100k_base") -> List[str]:
-    enc = tiktoken.get_encoding(encoding_name)
-    with open(file_path, encoding="utf-8") as fh:
-        lines = fh.readlines()
-
-    chunks, buf, buf_tokens = [], [], 0
-    for line in lines:
-        toks = enc.encode(line)
-        if buf_tokens + len(toks) > tokens_per_chunk:
-            chunks.append(enc.decode(sum(buf, [])))
-            buf, buf_tokens = [], 0
-        buf.append(toks)
-        buf_tokens += len(toks)
-    if buf:
-        chunks.append(enc.decode(sum(buf, [])))
-
-    print(f"[INFO] File split into {len(chunks)} chunks "
-          f"({sum(len(enc.encode(c)) for c in chunks)} tokens).")
+def chunk_text(file_path: str, tokens_per_chunk: int) -> List[str]:
+    """Line-aligned chunks of *tokens_per_chunk* tokens, as MODEL_NAME counts them."""
+    stats = ChunkStats()
+    chunks = list(iter_chunks(file_path, tokens_per_chunk, stats=stats, counter=counter_for(MODEL_NAME)))
+    print(f"[INFO] File split into {stats.chunks} chunks ({stats.tokens} tokens).")
     return chunks
 
 
-def filter_glossary(chunk: str, glossary: Dict[str, List[str]]) -> Dict[str, List[str]]:
-    hits = [k for k in glossary if k in chunk]
-    if not hits:
-        return {}
-    hits.sort(key=len, reverse=True)
-    selected: list[str] = []
-    for key in hits:
-        if not any(key in longer for longer in selected):
-            selected.append(key)
-    return {k: glossary[k] for k in selected}
+def filter_glossary(chunk: str, glossary: Dict[str, List[str]],
+                    index: GlossaryIndex) -> Dict[str, List[str]]:
+    """Longest-match glossary hits for *chunk*, found in one automaton pass."""
+    return index.filter(chunk, glossary)
 
 
-def translation_validity(text: str, glossary_subset: Dict[str, List[str]]) -> tuple[str, list[str]]:
+def translation_validity(text: str, glossary_subset: Dict[str, List[str]],
+                         validator: GlossaryValidator) -> tuple[str, list[str]]:
     """
     Returns (verdict, missing_terms)
     verdict ∈ {"AllGood", "Incomplete", "Preceding", "Glossary"}
@@ -130,11 +122,8 @@ def translation_validity(text: str, glossary_subset: Dict[str, List[str]]) -> tu
     if text.strip().lower().startswith("translation"):
         return "Preceding", []
 
-    missing = []
-    for cn_term, eng_variants in glossary_subset.items():
-        pattern = "|".join(map(re.escape, eng_variants))
-        if not re.search(pattern, text, flags=re.I):
-            missing.append(f'{cn_term} → {eng_variants[0]}')
+    missing = [f'{cn_term} → {glossary_subset[cn_term][0]}'
+               for cn_term in validator.missing(text, glossary_subset)]
 
     # Apply tolerance
     if len(missing) <= MISS_ALLOWED:
@@ -147,16 +136,18 @@ def gemini_call(prompt: str) -> tuple[str | None, str]:
     """
     Returns (text_or_None, err_reason).  err_reason is '' on success.
     """
-    try:
-        genai.configure(api_key=GEMINI_KEY or os.getenv("GOOGLE_API_KEY", ""))
+    key = cache_key(MODEL_NAME, SYSTEM_TEMPLATE, prompt, config=GENERATION_CONFIG)
+    cached = CACHE.get(key)
+    if cached is not None:
+        return cached, ""
 
-        model = genai.GenerativeModel(
-            model_name=MODEL_NAME,
-            system_instruction=SYSTEM_TEMPLATE,
-        )
+    api_key = GEMINI_KEY or os.getenv("GOOGLE_API_KEY", "")
+    try:
+        # the static system template rides on a Gemini context cache when it can
+        model = POOL.model(api_key, MODEL_NAME, SYSTEM_TEMPLATE)
 
         resp = model.generate_content(
-            prompt
+            prompt, generation_config=GENERATION_CONFIG
         )
 
         if not resp.candidates:
@@ -167,9 +158,12 @@ def gemini_call(prompt: str) -> tuple[str | None, str]:
         if not getattr(cand, "content", None) or not cand.content.parts:
             return None, "EMPTY_PARTS"
 
-        return cand.content.parts[0].text.strip(), ""
+        text = cand.content.parts[0].text.strip()
+        CACHE.put(key, text)
+        return text, ""
 
     except Exception as exc:
+        POOL.failed(api_key, MODEL_NAME, SYSTEM_TEMPLATE, exc)
         return None, f"EXCEPTION {exc}"
 
 
@@ -207,13 +201,33 @@ def _normalise_newlines(text: str) -> str:
 
 def process_file() -> None:
     # — Load resources -------------------------------------------------- #
-    chunks = chunk_text(INPUT_CHINESE_PATH, TOKENS_PER_CHUNK)
+    chunks = chunk_text(INPUT_CHINESE_PATH,
+                        TOKENS_PER_CHUNK or chunk_tokens(MODEL_NAME, SYSTEM_TEMPLATE, PROMPT_RESERVE))
     glossary: Dict[str, List[str]] = load_json(GLOSSARY_PATH, {})
     if not glossary:
         print("[ERROR] Glossary not found / empty.")
         return
+    index = load_glossary_index(Path(GLOSSARY_PATH), glossary)
+    validator = GlossaryValidator(glossary)
+
+    # completed chunks are appended to mapping.json.wal; mapping.json itself
+    # is rewritten atomically when the store compacts / closes
+    with CheckpointStore(STAGING_PATH, indent=2) as store:
+        finished = _translate_chunks(chunks, glossary, index, validator, store)
+    print(CACHE.summary())
+    if not finished:
+        return
+
+    # — Concatenate all English snippets into final file --------------- #
+    _extract_english(STAGING_PATH, OUTPUT_ENGLISH_PATH)
+    print("\nTranslation complete!  Check", OUTPUT_ENGLISH_PATH)
 
-    staging = load_json(STAGING_PATH, {})
+
+def _translate_chunks(chunks: List[str], glossary: Dict[str, List[str]], index: GlossaryIndex,
+                      validator: GlossaryValidator, store: CheckpointStore) -> bool:
+    """Translate every pending chunk into *store*. Returns False if stopped early."""
+    staging = store.data
+    check_resume(staging, chunks, store.path.name)
 
     # Figure out where to resume
     completed_ids = {
@@ -232,12 +246,13 @@ def process_file() -> None:
     with tqdm(total=len(chunks), initial=next_index - 1, desc="Translating") as bar:
         for idx in range(next_index, len(chunks) + 1):
             chunk = chunks[idx - 1]
-            gloss_subset = filter_glossary(chunk, glossary)
+            gloss_subset = filter_glossary(chunk, glossary, index)
             gloss_txt = "\n".join(
                 f'"{k}": "{", ".join(v)}"' for k, v in gloss_subset.items()
             )
 
             retry_hint = ""
+            first_prompt = build_user_prompt(prev_translation_tail, chunk, gloss_txt) + retry_hint
             response: str | None = None
             attempt = 0
 
@@ -247,7 +262,6 @@ def process_file() -> None:
                 user_prompt = build_user_prompt(
                     prev_translation_tail, chunk, gloss_txt
                 ) + retry_hint
-
                 response, err = gemini_call(user_prompt)
 
                 if response is None:
@@ -255,16 +269,21 @@ def process_file() -> None:
                     time.sleep(RETRY_DELAY)
                     continue
 
-                verdict, missing = translation_validity(response, gloss_subset)
+                verdict, missing = translation_validity(response, gloss_subset, validator)
                 logging.info(
                     f"Chunk {idx}: attempt {attempt} verdict={verdict} "
                     f"missing={missing}"
                 )
 
                 if verdict == "AllGood":
+                    if attempt > 1:  # a rerun then gets the accepted answer first time
+                        CACHE.put(cache_key(MODEL_NAME, SYSTEM_TEMPLATE, first_prompt, config=GENERATION_CONFIG), response)
                     response = _normalise_newlines(response)
                     break
 
+                # never replay a rejected answer
+                CACHE.discard(cache_key(MODEL_NAME, SYSTEM_TEMPLATE, user_prompt, config=GENERATION_CONFIG))
+
                 if attempt >= MAX_RETRIES:
                     print("\n",response)
                     response = None
@@ -280,32 +299,23 @@ def process_file() -> None:
                 time.sleep(RETRY_DELAY)
 
             # — Record result & update tail ----------------------------- #
-            staging[f"chunk {idx}"] = {
+            store.put(f"chunk {idx}", {
                 "Chinese": chunk,
                 "English": response,
                 "Glossary": gloss_subset,
-            }
-            _flush_staging(staging)
+            })
             if response == "ERROR":
                 print(f"\n[STOPPED] Validation failed for chunk {idx}. "
                       "Fix glossary or rerun later.")
-                return
+                return False
 
             prev_translation_tail = "\n".join(response.strip().splitlines()[-2:])
             bar.update(1)
-
-    # — Concatenate all English snippets into final file --------------- #
-    _extract_english(STAGING_PATH, OUTPUT_ENGLISH_PATH)
-    print("\nTranslation complete!  Check", OUTPUT_ENGLISH_PATH)
+    return True
 
 
 # ──────────────────────────── UTILITIES ──────────────────────────────── #
 
-def _flush_staging(data) -> None:
-    with open(STAGING_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
 def _extract_english(mapping_file: str, out_file: str) -> None:
     data = load_json(mapping_file, {})
     with open(out_file, "w", encoding="utf-8") as out:
@@ -2,21 +2,43 @@ from __future__ import annotations
 
 from dotenv import load_dotenv
 import json, logging, os, re, sys, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Dict, List, Any
 
-import google.generativeai as genai
 from tqdm import tqdm
 
+from checkpoint_store import CheckpointStore
+from gemini_batch import GeminiBatch, text_request
+from gemini_clients import get_pool
+from glossary_index import GlossaryIndex, load_glossary_index
+from glossary_validator import GlossaryValidator
+from page_classifier import classify_all
+from rate_limiter import QuotaScheduler, estimate_tokens, usage_tokens
+from response_cache import cache_key, get_cache
+from streaming import STREAMING, StreamGuard, stream_gemini
+from telemetry import Telemetry, gemini_usage
+from translation_memory import TranslationMemory, format_examples
+
 # ───────────────────────── CONFIG ───────────────────────── #
 load_dotenv()
 PRIMARY_KEY = os.environ["GEMINI_KEY"]   # main key
 ALT_KEY     = os.environ["GEMINI_ALT_KEY"]   # backup key
 
 MODEL_ID   = "gemini-2.5-flash-preview-05-20"
+GENERATION_CONFIG: Dict[str, Any] = {}   # sampling settings, e.g. {"temperature": 0.3}; part of the cache key
 MAX_RETRIES, RETRY_DELAY = 3, 5
 MISS_ALLOWED = 0
 
+# pages in flight; 1 = strict serial mode (context = previous *English* tail),
+# >1 = concurrent mode (context = previous page's *Japanese* tail)
+CONCURRENCY    = int(os.getenv("GEMINI_CONCURRENCY", "1"))
+REORDER_WINDOW = 2 * CONCURRENCY        # max pages finished ahead of the commit point
+
+# GEMINI_BATCH=1: submit every pending page as one Batch API job (half price,
+# no per-request latency), validate, and resubmit failures with hints
+BATCH_MODE = os.getenv("GEMINI_BATCH") == "1"
+
 IMG_DIR    = Path(".") / "Input" / "Danmachi_vol20" / "Images"
 
 BASE = Path(".") / "Processing_Files" / "Danmachi_vol20"
@@ -25,16 +47,23 @@ GLOSSARY_PATH = BASE / "Glossary_v4.json"
 STYLE_PATH    = BASE / "style_profile.json"
 MAPPING_PATH  = BASE / "mapping.json"
 LOG_PATH      = BASE / "translation_log.log"
+BATCH_DIR     = BASE / "batch"
 STYLE_PROFILE_PATH = BASE / "style_profile.json"
 
 OUT_DIR = Path(".") / "Output" / "Danmachi_vol20"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 EN_TXT  = OUT_DIR / "English.txt"
 
-# rotation order
+# preference order; the scheduler routes each call to the first combo with
+# RPM/TPM/RPD headroom, so it falls back to the alt key *before* a 429
 COMBOS = [{"key": k, "tag": tag, "model": MODEL_ID}
           for k, tag in [(PRIMARY_KEY, "primary"), (ALT_KEY, "alt")] if k]
-combo_idx = 0
+SCHEDULER = QuotaScheduler(COMBOS)
+
+CACHE = get_cache()                     # LLM_CACHE=off to bypass, =refresh to re-ask
+POOL  = get_pool()                      # one client per key; models reused across pages and workers
+TM    = TranslationMemory()             # earlier volumes' pages; TRANSLATION_MEMORY=off to bypass
+TELEMETRY = Telemetry(script="gemini_translate_v4", volume=BASE.name)   # TELEMETRY=off to disable
 
 # failure guidance
 FAILURE_HINT = {
@@ -70,23 +99,19 @@ def load_glossary(path: Path) -> Dict[str, List[str]]:
     return {k: (v if isinstance(v, list) else [v]) for k, v in raw.items()}
 
 JP_RE = re.compile(r'[\u3040-\u30ff\u4e00-\u9fff]')
+PRECEDING = ("translation",)
+
+def stream_guard() -> StreamGuard:
+    """Aborts a streamed answer on the same grounds check_valid would reject it."""
+    return StreamGuard(JP_RE, prefixes=PRECEDING)
 
-def filter_glossary(txt: str, gloss: Dict[str, List[str]]):
-    hits = [k for k in gloss if k in txt]
-    hits.sort(key=len, reverse=True)
-    chosen = []
-    for h in hits:
-        if not any(h in c for c in chosen):
-            chosen.append(h)
-    return {k: gloss[k] for k in chosen}
+def filter_glossary(txt: str, gloss: Dict[str, List[str]], index: GlossaryIndex):
+    return index.filter(txt, gloss)
 
-def check_valid(text: str, sub: Dict[str, List[str]]):
+def check_valid(text: str, sub: Dict[str, List[str]], validator: GlossaryValidator):
     if JP_RE.search(text): return "Incomplete", []
-    if text.strip().lower().startswith("translation"): return "Preceding", []
-    miss = []
-    for jp, en_list in sub.items():
-        if not re.search("|".join(map(re.escape, en_list)), text, flags=re.I):
-            miss.append(f"{jp} → {en_list[0]}")
+    if text.strip().lower().startswith(PRECEDING): return "Preceding", []
+    miss = [f"{jp} → {sub[jp][0]}" for jp in validator.missing(text, sub)]
     verdict = "AllGood" if len(miss) <= MISS_ALLOWED else "Glossary"
     return verdict, miss
 
@@ -118,47 +143,156 @@ Target style guide (condensed JSON):
 {STYLE_PROFILE_TXT}
 """
 
-def gemini_call(prompt: str):
-    global combo_idx
-    api_key = COMBOS[combo_idx]["key"]
-    genai.configure(api_key=api_key)
+def prompt_key(prompt: str) -> str:
+    return cache_key(MODEL_ID, SYSTEM_TEMPLATE, prompt, config=GENERATION_CONFIG)
 
-    for attempt in range(1, MAX_RETRIES + 1):
+def gemini_call(prompt: str):
+    """(answer, "") on success; (partial answer, "ABORTED") when streaming stopped early."""
+    cached = CACHE.get(prompt_key(prompt))
+    if cached is not None:
+        TELEMETRY.cache_hit(MODEL_ID)
+        return cached, ""
+
+    # reserve input + roughly as much again for the English answer
+    est = estimate_tokens(SYSTEM_TEMPLATE + prompt) + estimate_tokens(prompt)
+    attempt = 0
+    while attempt < MAX_RETRIES:
+        slot = SCHEDULER.acquire(est)
+        if slot is None:
+            return None, "LIMITED"              # every combo is out of budget
+        call = TELEMETRY.start(slot.combo["model"], slot.combo["tag"], streamed=STREAMING, cache="miss")
         try:
-            model = genai.GenerativeModel(MODEL_ID, system_instruction=SYSTEM_TEMPLATE)
-            txt = model.generate_content(prompt).candidates[0].content.parts[0].text.strip()
+            model = POOL.model(slot.combo["key"], slot.combo["model"], SYSTEM_TEMPLATE)
+            if STREAMING:
+                # stop paying for an answer as soon as it shows Japanese or a preamble
+                guard = stream_guard()
+                txt, verdict, resp = stream_gemini(model, prompt, guard, GENERATION_CONFIG)
+                txt = txt.strip()
+                SCHEDULER.record(slot, usage_tokens(resp) or
+                                 estimate_tokens(SYSTEM_TEMPLATE + prompt) + estimate_tokens(txt))
+                call.first_token(guard.first_at)
+                call.usage(*gemini_usage(resp))
+                if verdict:
+                    call.done("ABORTED")
+                    return txt, "ABORTED"       # check_valid gives the same verdict on the partial text
+            else:
+                resp = model.generate_content(prompt, generation_config=GENERATION_CONFIG)
+                txt = resp.candidates[0].content.parts[0].text.strip()
+                SCHEDULER.record(slot, usage_tokens(resp))
+                call.usage(*gemini_usage(resp))
+            call.done()
+            CACHE.put(prompt_key(prompt), txt)
             return txt, ""
         except Exception as e:
+            POOL.failed(slot.combo["key"], slot.combo["model"], SYSTEM_TEMPLATE, e)
             if "429" in str(e) or "quota" in str(e).lower():
-                if combo_idx < len(COMBOS) - 1:
-                    combo_idx += 1
-                    print(f"\nQuota hit → switching to {COMBOS[combo_idx]['tag']} key …")
-                    time.sleep(RETRY_DELAY)
-                    return gemini_call(prompt)
-                return None, "LIMITED"
+                call.done("429", throttled=True)
+                logging.info(f"429 on {slot.combo['tag']} key despite budget → cooling it down")
+                SCHEDULER.penalize(slot)        # next acquire() routes elsewhere
+                continue
+            call.done(str(e))
+            attempt += 1
             if attempt == MAX_RETRIES:
                 return None, f"EXCEPTION {e}"
             time.sleep(RETRY_DELAY)
 
+def build_prompt(raw: str, sub: Dict[str, List[str]], prev_tail: str,
+                 tail_label: str, retry_hint: str = "", examples: str = "") -> str:
+    gloss_txt = "\n".join(f'"{k}": "{", ".join(v)}"' for k, v in sub.items()) or "[none]"
+    ref = f"\n{examples}\n" if examples else ""   # translation-memory near hits
+    return f"""
+Glossary terms (enforce exactly):
+{gloss_txt}
+
+{tail_label}
+{prev_tail or '[none]'}
+{ref}
+Translate continuously:
+{raw}
+{retry_hint}
+"""
+
+def retry_hint_for(verdict: str, miss: List[str]) -> str:
+    return ("\n\nYou MISSED/MISTRANSLATED:\n- " + "\n- ".join(miss)
+            if verdict == "Glossary" else "\n\n" + FAILURE_HINT[verdict])
+
+def translate_page(page: dict, sub: Dict[str, List[str]], validator: GlossaryValidator,
+                   prev_tail: str, tail_label: str):
+    """Translate one page with validation + hinted retries. Returns (answer|None, err)."""
+    pno = str(page["page_no"])
+
+    # the same text translated before (a recurring header, a re-OCR'd page) needs no call
+    hit = TM.exact(page["rawtext"])
+    if hit is not None and check_valid(hit.english, sub, validator)[0] == "AllGood":
+        logging.info(f"Page {pno}: translation memory hit ({hit.volume} page {hit.unit})")
+        return hit.english, ""
+    examples = format_examples(TM.examples(page["rawtext"]))
+
+    retry_hint = ""
+    first_prompt = build_prompt(page["rawtext"], sub, prev_tail, tail_label, retry_hint, examples)
+    attempt = 0
+    answer, err = None, ""
+    while attempt < MAX_RETRIES:
+        attempt += 1
+        prompt = build_prompt(page["rawtext"], sub, prev_tail, tail_label, retry_hint, examples)
+        with TELEMETRY.scope("translate", unit=pno, attempt=attempt) as scope:
+            answer, err = gemini_call(prompt)
+            verdict, miss = check_valid(answer, sub, validator) if answer is not None else ("", [])
+            scope.verdict = verdict or err
+        if err == "LIMITED": break
+        if answer is None:
+            logging.info(f"Page {pno}: {err}"); time.sleep(RETRY_DELAY); continue
+
+        logging.info(f"Page {pno}: attempt {attempt} verdict={verdict} miss={miss}")
+
+        if verdict == "AllGood":
+            if attempt > 1:                     # a rerun then gets the accepted answer first time
+                CACHE.put(prompt_key(first_prompt), answer)
+            TM.add(page["rawtext"], normalise(answer), BASE.name, pno)
+            break
+        CACHE.discard(prompt_key(prompt))       # never replay a rejected answer
+        if attempt >= MAX_RETRIES: answer = None; break
+
+        retry_hint = retry_hint_for(verdict, miss)
+        if err != "ABORTED":                    # an aborted stream is retried right away
+            time.sleep(RETRY_DELAY)
+    return answer, err
+
+def source_tail(page: dict | None) -> str:
+    """Last two lines of a page's Japanese text (context for concurrent mode)."""
+    if not page: return ""
+    return "\n".join(page.get("rawtext", "").strip().splitlines()[-2:])
+
 # ────────────────── MAIN FLOW ──────────── #
 def main() -> None:
     pages = load_json(TYPE_PATH, [])
     if not pages: print("[ERR] Type.json missing."); return
     glossary = load_glossary(GLOSSARY_PATH)
     if not glossary: print("[ERR] Glossary missing."); return
-
-    raw_map: Any = load_json(MAPPING_PATH, {})
-    if isinstance(raw_map, list):
-        mapping = {str(p["page_no"]): p for p in raw_map}
-    elif isinstance(raw_map, dict):
-        mapping = raw_map
-    else:
-        mapping = {}
-
-    for n in range(1, 424):
-        key = f"{n:03}"
-        img_file = IMG_DIR / f"page_{key}.png"
-        if key not in mapping and img_file.exists() and img_file.stat().st_size > 7*1024*1024:
+    index = load_glossary_index(GLOSSARY_PATH, glossary)
+    validator = GlossaryValidator(glossary)
+    TM.ingest_tree(BASE.parent)                 # every volume's finished mapping.json (changed files only)
+
+    # legacy list-shaped mapping.json is re-keyed by page_no on load
+    with CheckpointStore(MAPPING_PATH, indent=2, key_field="page_no") as store:
+        prepare_mapping(store, pages)
+        if BATCH_MODE:
+            translate_volume_batch(pages, glossary, index, validator, store)
+        else:
+            translate_volume(pages, glossary, index, validator, store)
+    print(CACHE.summary())
+    print(TM.summary())
+    print(SCHEDULER.summary())
+
+def prepare_mapping(store: CheckpointStore, pages: List[dict]) -> None:
+    """Add illustration-only pages and settle text/illustration flags, once per run."""
+    mapping = store.data
+
+    # OCR now sees every page (no size cut-off), so Type.json's own flags say
+    # which pages are pictures, instead of guessing from the PNG's file size
+    for page in pages:
+        key = page["page_no"]
+        if key not in mapping and page.get("contains_illustration") and not page.get("rawtext", "").strip():
             mapping[key] = {
                 "page_no": key,
                 "contains_text": False,
@@ -168,13 +302,27 @@ def main() -> None:
                 "Glossary": {}
             }
 
-    # --- resolve pages that are wrongly flagged as both text + illustration
-    for rec in mapping.values():
-        if rec.get("contains_text") and rec.get("contains_illustration"):
-            if len(rec.get("rawtext", "")) > 200:
-                rec["contains_illustration"] = False
-            else:
-                rec["contains_text"] = False
+    # --- resolve pages that are wrongly flagged as both text + illustration:
+    # the local classifier decides where it is sure, the rawtext length otherwise
+    both = [rec for rec in mapping.values() if rec.get("contains_text") and rec.get("contains_illustration")]
+    images = {rec["page_no"]: IMG_DIR / f"page_{rec['page_no']}.png" for rec in both}
+    images = {k: p for k, p in images.items() if p.exists()}
+    verdicts = dict(zip(images, classify_all(list(images.values())))) if images else {}
+    for rec in both:
+        pc = verdicts.get(rec["page_no"])
+        if pc is not None and pc.confident and (pc.contains_text or pc.contains_illustration):
+            rec["contains_text"] = pc.contains_text
+            rec["contains_illustration"] = pc.contains_illustration
+        elif len(rec.get("rawtext", "")) > 200:
+            rec["contains_illustration"] = False
+        else:
+            rec["contains_text"] = False
+
+    store.compact()                             # persist the fix-ups above once
+
+def translate_volume(pages: List[dict], glossary: Dict[str, List[str]], index: GlossaryIndex,
+                     validator: GlossaryValidator, store: CheckpointStore) -> None:
+    mapping = store.data
 
     done = [int(k) for k, v in mapping.items()
         if v.get("English") not in (None, "ERROR")]
@@ -194,67 +342,139 @@ def main() -> None:
     # work = [p for p in work if 13 <= int(p["page_no"]) <= 15]
     # -----------------------------------------------------------------
 
-    with tqdm(total=len(work), desc="Translating") as bar:
-        for page in work:
-            pno = str(page["page_no"])
-            if mapping.get(pno, {}).get("English"): bar.update(1); continue
-
-            raw = page["rawtext"]
-            sub = filter_glossary(raw, glossary)
-            gloss_txt = "\n".join(f'"{k}": "{", ".join(v)}"' for k, v in sub.items()) or "[none]"
-
-            retry_hint = ""
-            attempt = 0
-            answer = None
-            while attempt < MAX_RETRIES:
-                attempt += 1
-                prompt = f"""
-Glossary terms (enforce exactly):
-{gloss_txt}
-
-Previous English tail:
-{prev_tail or '[none]'}
-
-Translate continuously:
-{raw}
-{retry_hint}
-"""
-                answer, err = gemini_call(prompt)
-                if err == "LIMITED": break
-                if answer is None:
-                    logging.info(f"Page {pno}: {err}"); time.sleep(RETRY_DELAY); continue
-
-                verdict, miss = check_valid(answer, sub)
-                logging.info(f"Page {pno}: attempt {attempt} verdict={verdict} miss={miss}")
-
-                if verdict == "AllGood": break
-                if attempt >= MAX_RETRIES: answer = None; break
-
-                retry_hint = ("\n\nYou MISSED/MISTRANSLATED:\n- " + "\n- ".join(miss)
-                              if verdict == "Glossary" else "\n\n" + FAILURE_HINT[verdict])
-                time.sleep(RETRY_DELAY)
-
-            # store result
-            mapping[pno] = {**page,
-                            "English": normalise(answer) if answer else "ERROR",
-                            "Glossary": sub}
-            _flush(mapping)
-
-            if answer == "ERROR" or err == "LIMITED" or answer == None:
+    serial     = CONCURRENCY <= 1
+    tail_label = "Previous English tail:" if serial else \
+                 "Previous Japanese tail (context only, do not translate):"
+    window     = 1 if serial else REORDER_WINDOW
+
+    # Pages are submitted at most `window` ahead of the commit point and
+    # committed strictly in page order, so mapping.json grows in order.
+    results: Dict[int, tuple] = {}
+    in_flight: Dict[Any, int] = {}
+    next_submit = next_commit = 0
+    stop = False
+
+    with tqdm(total=len(work), desc="Translating") as bar, \
+         ThreadPoolExecutor(max_workers=max(1, CONCURRENCY)) as pool:
+        while next_commit < len(work):
+            # ── submit ──
+            while (not stop and next_submit < len(work)
+                   and next_submit < next_commit + window
+                   and len(in_flight) < max(1, CONCURRENCY)):
+                page = work[next_submit]
+                pno  = str(page["page_no"])
+                if mapping.get(pno, {}).get("English") not in (None, "", "ERROR"):
+                    results[next_submit] = (page, None, None, "DONE")
+                else:
+                    sub  = filter_glossary(page["rawtext"], glossary, index)
+                    tail = prev_tail if serial else source_tail(work[next_submit - 1] if next_submit else None)
+                    fut  = pool.submit(translate_page, page, sub, validator, tail, tail_label)
+                    in_flight[fut] = next_submit
+                    results[next_submit] = (page, sub, None, None)
+                next_submit += 1
+
+            # ── commit everything that is ready, in order ──
+            while next_commit in results and results[next_commit][3] is not None:
+                page, sub, answer, err = results.pop(next_commit)
+                next_commit += 1
+                if err == "DONE": bar.update(1); continue
+
+                pno = str(page["page_no"])
+                store.put(pno, {**page,
+                                "English": normalise(answer) if answer else "ERROR",
+                                "Glossary": sub})
+
+                if answer is None or err == "LIMITED":
+                    stop = True                     # drain in-flight pages, then exit
+                    continue
+                prev_tail = "\n".join(answer.strip().splitlines()[-2:])
+                bar.update(1)
+
+            if stop and not in_flight and next_commit >= next_submit:
                 print("\nStopped — fix issues then rerun.")
                 return
+            if not in_flight:
+                continue
 
-            prev_tail = "\n".join(answer.strip().splitlines()[-2:])
-            bar.update(1)
+            # ── wait for the next finished page ──
+            done_futs, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done_futs:
+                i = in_flight.pop(fut)
+                page, sub, _, _ = results[i]
+                answer, err = fut.result()
+                results[i] = (page, sub, answer, err or "OK")
 
     _dump_english(EN_TXT, mapping)
     print("\nDone! English output →", EN_TXT)
 
-# ───── file helpers ───── #
-def _flush(data):
-    with MAPPING_PATH.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def translate_volume_batch(pages: List[dict], glossary: Dict[str, List[str]], index: GlossaryIndex,
+                           validator: GlossaryValidator, store: CheckpointStore) -> None:
+    """
+    Batch-API flavour of translate_volume: one job per round with every
+    pending page (previous *Japanese* tail as context, as in concurrent
+    mode); answers are validated locally and the rejects go into the next
+    round with their retry hint.
+    """
+    mapping = store.data
+    work = [p for p in pages if p.get("contains_text") and p.get("rawtext")]
+    tail_label = "Previous Japanese tail (context only, do not translate):"
+    tails = {str(p["page_no"]): source_tail(work[i - 1] if i else None) for i, p in enumerate(work)}
+    todo  = {str(p["page_no"]): p for p in work
+             if mapping.get(str(p["page_no"]), {}).get("English") in (None, "", "ERROR")}
+    subs  = {pno: filter_glossary(p["rawtext"], glossary, index) for pno, p in todo.items()}
+    for pno in list(todo):                      # translation-memory exact hits skip the job
+        hit = TM.exact(todo[pno]["rawtext"])
+        if hit is not None and check_valid(hit.english, subs[pno], validator)[0] == "AllGood":
+            store.put(pno, {**todo.pop(pno), "English": normalise(hit.english), "Glossary": subs[pno]})
+    refs  = {pno: format_examples(TM.examples(p["rawtext"])) for pno, p in todo.items()}
+    hints = {pno: "" for pno in todo}           # pages still to do → retry hint for next round
+    first: Dict[str, str] = {}
+    print(f"{len(work) - len(todo)} page(s) already done, {len(todo)} to translate in batch mode.")
+
+    batch = GeminiBatch(PRIMARY_KEY, MODEL_ID)
+    for rnd in range(1, MAX_RETRIES + 1):
+        if not hints: break
+        prompts = {pno: build_prompt(todo[pno]["rawtext"], subs[pno], tails[pno], tail_label, hint, refs[pno])
+                   for pno, hint in hints.items()}
+        first   = first or dict(prompts)
+
+        answers = {}
+        for pno, prompt in prompts.items():
+            cached = CACHE.get(prompt_key(prompt))
+            if cached is not None: answers[pno] = (cached, "")
+        reqs = {pno: text_request(prompt, SYSTEM_TEMPLATE, GENERATION_CONFIG)
+                for pno, prompt in prompts.items() if pno not in answers}
+        jsonl = BATCH_DIR / f"translate_round{rnd}.jsonl"
+        if reqs:
+            answers.update(batch.run(reqs, jsonl, f"{BASE.name}-translate-r{rnd}"))
+
+        for pno in sorted(prompts, key=int):
+            answer, err = answers.get(pno, (None, "MISSING"))
+            verdict, miss = check_valid(answer, subs[pno], validator) if answer is not None else ("", [])
+            TELEMETRY.record(MODEL_ID, stage="translate", unit=pno, attempt=rnd, combo="batch",
+                             verdict=verdict, error=err)
+            if answer is None:
+                logging.info(f"Page {pno}: round {rnd} {err}"); continue
+            logging.info(f"Page {pno}: round {rnd} verdict={verdict} miss={miss}")
+            if verdict != "AllGood":
+                hints[pno] = retry_hint_for(verdict, miss)
+                continue
+            for prompt in {prompts[pno], first[pno]}:
+                CACHE.put(prompt_key(prompt), answer)
+            store.put(pno, {**todo[pno], "English": normalise(answer), "Glossary": subs[pno]})
+            TM.add(todo[pno]["rawtext"], normalise(answer), BASE.name, pno)
+            del hints[pno]
+        batch.done(jsonl)                       # every accepted page is in the WAL now
+        print(f"[batch] round {rnd}: {len(prompts) - len(hints)} accepted, {len(hints)} to retry")
+
+    for pno in hints:
+        store.put(pno, {**todo[pno], "English": "ERROR", "Glossary": subs[pno]})
+    if hints:
+        print(f"\n{len(hints)} page(s) failed validation: {sorted(hints, key=int)}")
+    _dump_english(EN_TXT, mapping)
+    print("\nDone! English output →", EN_TXT)
 
+# ───── file helpers ───── #
 def _dump_english(path: Path, data: dict):
     with path.open("w", encoding="utf-8") as out:
         # sort by numeric value but keep the original zero-padded key
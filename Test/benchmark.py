@@ -0,0 +1,234 @@
+"""
+Offline throughput benchmark: runs the real translate / glossary / OCR
+scripts end to end against Test/mock_llm_server.py, on synthetic inputs
+in a scratch directory, and reports per stage
+
+    wall time, API calls, units (distinct chunks / pages asked about),
+    units per second, retries, throttled calls, malformed answers, output tokens.
+
+    python Test/benchmark.py
+    python Test/benchmark.py --stages aya-translate,gemini-ocr --latency 0.4 --tps 80 \\
+                             --rate-429 0.05 --malformed 0.05 --pages 24 --text-chars 40000
+
+Nothing leaves the machine: Ollama scripts get OLLAMA_HOST, Gemini scripts
+get GEMINI_API_BASE, which gemini_clients turns into a REST transport
+pointed at the mock.  The
+response cache is off so every stage really calls the "model"; local
+quota limits are raised (GEMINI_LIMITS) unless already set, so the
+numbers measure the pipeline rather than the free-tier throttle.
+"""
+from __future__ import annotations
+
+import argparse, asyncio, json, os, random, runpy, subprocess, sys, tempfile, threading, time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "Test"))
+
+# ─── Stages ──────────────────────────────────────────────────────────── #
+@dataclass(frozen=True)
+class Stage:
+    script:  str        # relative to the repo root
+    workdir: str        # relative to the scratch directory; the script's cwd
+    env:     Dict[str, str]
+
+STAGES: Dict[str, Stage] = {
+    "aya-glossary":     Stage("Aya Expanse/aya_generate_glossary.py",      "aya",    {}),
+    "aya-translate":    Stage("Aya Expanse/aya_translate_v7_async.py",     "aya",    {}),
+    "gemini-ocr":       Stage("Gemini/gemini_generate_rawtext.py",         "gemini", {"GEMINI_CONCURRENCY": "8"}),
+    "gemini-glossary":  Stage("Gemini/gemini_generate_glossary_rawtext.py", "gemini", {}),
+    "gemini-translate": Stage("Gemini/gemini_translate_v4.py",             "gemini", {"GEMINI_CONCURRENCY": "8"}),
+}
+
+HIGH_LIMITS = {m: [10_000, 100_000_000, 1_000_000] for m in
+               ("gemini-2.5-pro", "gemini-2.5-flash-preview-05-20", "gemini-2.0-flash")}
+
+
+@dataclass
+class Result:
+    stage:     str
+    exit:      int
+    wall:      float
+    calls:     int
+    units:     int
+    retries:   int
+    throttled: int
+    malformed: int
+    out_tokens: int
+
+    @property
+    def rate(self) -> float:
+        return self.units / self.wall if self.wall else 0.0
+
+
+# ─── Synthetic inputs ────────────────────────────────────────────────── #
+SENTENCES = [
+    "贝尔握紧了短刀，向地下城的深处走去。", "赫斯缇雅女神在教堂里等待着他的归来。",
+    "「我一定会变得更强的！」贝尔大声说道。", "怪物的咆哮声在走廊里回荡。",
+    "魔石灯的光芒照亮了前方的道路。", "赫斯缇雅轻轻地叹了一口气，望向窗外。",
+    "「贝尔君，今天也要平安回来哦。」", "冒险者们在公会的大厅里交换着情报。",
+]
+
+def chinese_text(chars: int, rng: random.Random) -> str:
+    paras, n = [], 0
+    while n < chars:
+        para = "".join(rng.choice(SENTENCES) for _ in range(rng.randint(2, 6)))
+        paras.append(para)
+        n += len(para)
+    return "\n\n".join(paras) + "\n"
+
+def text_page(path: Path, rng: random.Random) -> None:
+    """A vertical-text page of glyph-like strokes, so the local classifier sends it to OCR."""
+    from PIL import Image, ImageDraw
+    w, h, cell = 1240, 1754, 26
+    im = Image.new("L", (w, h), 245)
+    d  = ImageDraw.Draw(im)
+    for x in range(w - 150, 120, -cell * 2):
+        for y in range(150, h - 150, cell + 6):
+            for _ in range(rng.randint(3, 7)):
+                if rng.random() < 0.5:
+                    yy = y + rng.randint(0, cell); x0 = x + rng.randint(0, cell // 2)
+                    d.line([x0, yy, x0 + rng.randint(cell // 3, cell), yy], fill=0, width=3)
+                else:
+                    xx = x + rng.randint(0, cell); y0 = y + rng.randint(0, cell // 2)
+                    d.line([xx, y0, xx, y0 + rng.randint(cell // 3, cell)], fill=0, width=3)
+    im.save(path)
+
+def build_inputs(scratch: Path, pages: int, text_chars: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    aya = scratch / "aya"
+    aya.mkdir(parents=True, exist_ok=True)
+    (aya / "Chinese.txt").write_text(chinese_text(text_chars, rng), encoding="utf-8")
+    (aya / "glossary.json").write_text(json.dumps({"贝尔": ["Bell"], "赫斯缇雅": ["Hestia"]},
+                                                  ensure_ascii=False), encoding="utf-8")
+
+    images = scratch / "gemini" / "Input" / "Danmachi_vol20" / "Images"
+    proc   = scratch / "gemini" / "Processing_Files" / "Danmachi_vol20"
+    images.mkdir(parents=True, exist_ok=True)
+    proc.mkdir(parents=True, exist_ok=True)
+    (scratch / "gemini" / "Output").mkdir(exist_ok=True)
+    for n in range(13, 13 + pages):            # the glossary pass starts at page 13
+        text_page(images / f"page_{n:03}.png", rng)
+    (proc / "Glossary_v4.json").write_text(json.dumps({"ベル": ["Bell"], "ヘスティア": ["Hestia"]},
+                                                      ensure_ascii=False), encoding="utf-8")
+    (proc / "style_profile.json").write_text(json.dumps({"tone": "light, earnest", "tense": "past"}),
+                                             encoding="utf-8")
+
+
+# ─── Mock server in a background thread ──────────────────────────────── #
+def start_mock(faults) -> tuple:
+    from aiohttp import web
+    from mock_llm_server import make_app
+
+    app   = make_app(faults=faults)
+    ready = threading.Event()
+    box: dict = {}
+
+    def serve() -> None:
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        box["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return app, f"http://127.0.0.1:{box['port']}"
+
+
+# ─── Running one stage ───────────────────────────────────────────────── #
+def run_stage(name: str, scratch: Path, app, base: str, timeout: float) -> Result:
+    from mock_llm_server import new_stats
+
+    stage = STAGES[name]
+    env = {**os.environ, **stage.env,
+           "OLLAMA_HOST": base, "GEMINI_API_BASE": base, "LLM_CACHE": "off",
+           "GEMINI_KEY": os.getenv("GEMINI_KEY", "bench"), "GEMINI_ALT_KEY": os.getenv("GEMINI_ALT_KEY", "bench-alt"),
+           "GEMINI_BATCH_POLL": "0.2", "PYTHONIOENCODING": "utf-8"}
+    env.setdefault("GEMINI_LIMITS", json.dumps(HIGH_LIMITS))
+    log = scratch / f"{name}.log"
+
+    app["stats"].update(new_stats())
+    start = time.perf_counter()
+    with open(log, "w", encoding="utf-8") as out:
+        try:
+            code = subprocess.run([sys.executable, __file__, "--child", stage.script],
+                                  cwd=scratch / stage.workdir, env=env, stdout=out,
+                                  stderr=subprocess.STDOUT, timeout=timeout).returncode
+        except subprocess.TimeoutExpired:
+            code = -1
+    wall = time.perf_counter() - start
+
+    s = app["stats"]
+    units = len(s["units"])
+    res = Result(name, code, round(wall, 2), s["calls"], units,
+                 max(0, s["calls"] - s["throttled"] - units), s["throttled"], s["malformed"], s["output_tokens"])
+    if code:
+        tail = log.read_text(encoding="utf-8", errors="replace").splitlines()[-5:]
+        print(f"[{name}] exited with {code}; last lines of {log}:\n    " + "\n    ".join(tail))
+    return res
+
+
+def child(script: str) -> None:
+    """Runs *script* as __main__ (gemini_clients sends it to GEMINI_API_BASE)."""
+    path = ROOT / script
+    sys.path[:0] = [str(path.parent), str(ROOT)]
+    sys.argv = [str(path)]
+    runpy.run_path(str(path), run_name="__main__")
+
+
+# ─── Report ──────────────────────────────────────────────────────────── #
+def report(results: List[Result]) -> None:
+    head = f"{'stage':<17}{'exit':>5}{'wall s':>9}{'calls':>7}{'units':>7}{'units/s':>9}" \
+           f"{'retries':>9}{'429/503':>9}{'malformed':>11}{'out tok':>9}"
+    print("\n" + head + "\n" + "─" * len(head))
+    for r in results:
+        print(f"{r.stage:<17}{r.exit:>5}{r.wall:>9.2f}{r.calls:>7}{r.units:>7}{r.rate:>9.2f}"
+              f"{r.retries:>9}{r.throttled:>9}{r.malformed:>11}{r.out_tokens:>9}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Offline pipeline benchmark against the mock LLM server.")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--stages", default=",".join(STAGES), help="comma-separated, run in this order")
+    ap.add_argument("--pages", type=int, default=24, help="synthetic page images for the Gemini stages")
+    ap.add_argument("--text-chars", type=int, default=40_000, help="size of the synthetic Chinese text")
+    ap.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    ap.add_argument("--tps", type=float, default=0.0, help="output tokens per second (0 = instant)")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="share of calls throttled")
+    ap.add_argument("--malformed", type=float, default=0.0, help="share of answers mangled")
+    ap.add_argument("--workdir", type=Path, help="keep inputs/outputs here (default: a temp dir)")
+    ap.add_argument("--timeout", type=float, default=900, help="per-stage limit in seconds")
+    ap.add_argument("--json", type=Path, help="also write the results here")
+    args = ap.parse_args()
+
+    if args.child:
+        return child(args.child)
+
+    from mock_llm_server import Faults
+    names = [n.strip() for n in args.stages.split(",") if n.strip()]
+    unknown = [n for n in names if n not in STAGES]
+    if unknown:
+        ap.error(f"unknown stage(s) {unknown}; choose from {list(STAGES)}")
+
+    scratch = args.workdir or Path(tempfile.mkdtemp(prefix="llm-bench-"))
+    build_inputs(scratch, args.pages, args.text_chars)
+    app, base = start_mock(Faults(args.latency, args.tps, args.rate_429, args.malformed))
+    print(f"Mock server on {base}, scratch directory {scratch}")
+
+    results = []
+    for name in names:
+        print(f"→ {name} …", flush=True)
+        results.append(run_stage(name, scratch, app, base, args.timeout))
+    report(results)
+    if args.json:
+        args.json.write_text(json.dumps([{**asdict(r), "units_per_s": round(r.rate, 3)} for r in results],
+                                        indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Local stand-in for the Gemini REST API and the Ollama API, for exercising
+the pipelines without keys, quota or a GPU.
+
+    python Test/mock_llm_server.py --port 8765 --latency 0.5 --tps 60 --rate-429 0.05
+    GEMINI_API_BASE=http://127.0.0.1:8765 GEMINI_BATCH=1 python Gemini/gemini_translate_v4.py
+    OLLAMA_HOST=http://127.0.0.1:8765 python "Aya Expanse/aya_translate_v7_async.py"
+
+Implements the Batch API round-trip (resumable file upload,
+models/*:batchGenerateContent, batches/* polling, file download), online
+models/*:generateContent / :streamGenerateContent, cachedContents (create,
+refresh, delete; requests naming one get its system instruction), and Ollama's /api/chat
+and /api/generate (streamed or not).  Answers are canned but shaped like
+the real thing: translations reuse the glossary renderings listed in the
+prompt, glossary extraction returns JSON, OCR returns a rawtext JSON.
+
+Online calls can be slowed down (fixed latency plus an output token rate),
+throttled (429 from Gemini, 503 "server busy" from Ollama) and answered
+with malformed output, each at a configurable rate.  Test/benchmark.py
+drives the real scripts against it.
+"""
+from __future__ import annotations
+
+import argparse, asyncio, hashlib, itertools, json, random, re, time
+from dataclasses import dataclass
+
+from aiohttp import web
+
+GLOSS_LINE = re.compile(r'^"([^"]+)": "([^",]+)')
+SOURCE_RE  = re.compile(r"[\d\u3040-\u30ff\u3400-\u9fff\uff00-\uffef]+")   # what retries of one unit share
+TERMS      = (("ベル", "Bell"), ("ヘスティア", "Hestia"), ("贝尔", "Bell"), ("赫斯缇雅", "Hestia"))
+
+
+@dataclass
+class Faults:
+    latency:  float = 0.0    # seconds before the first token
+    tps:      float = 0.0    # output tokens per second; 0 = instant
+    rate_429: float = 0.0    # share of online calls refused as throttled
+    malformed: float = 0.0   # share of online answers mangled (cut-off JSON / preamble)
+
+
+# ─── Canned answers ──────────────────────────────────────────────────── #
+def _split(req: dict):
+    """(system, user parts) of a REST request; the SDK sends camelCase, batch files snake_case."""
+    sys_ = req.get("system_instruction") or req.get("systemInstruction") or {}
+    system = " ".join(p.get("text", "") for p in sys_.get("parts", []))
+    return system, req["contents"][-1]["parts"]
+
+def task_of(req: dict) -> str:
+    system, parts = _split(req)
+    if any("inline_data" in p or "inlineData" in p for p in parts) and "OCR" in system:
+        return "ocr"
+    low = system.lower()
+    if "glossary extractor" in low or ("names" in low and "json format" in low):
+        return "glossary"
+    return "translate"
+
+def unit_of(req: dict) -> str:
+    """Identity of the chunk / page a request is about, equal across its retries."""
+    _, parts = _split(req)
+    blob = [(p.get("inline_data") or p.get("inlineData") or {}).get("data", "") for p in parts]
+    blob += SOURCE_RE.findall("\n".join(p.get("text", "") for p in parts))
+    return hashlib.sha1("".join(blob).encode("utf-8")).hexdigest()[:16]
+
+def answer_for(req: dict, fail_rate: float = 0.0) -> str:
+    system, parts = _split(req)
+    prompt = "\n".join(p.get("text", "") for p in parts)
+    task   = task_of(req)
+
+    if task == "ocr":
+        page = int(unit_of(req)[:4], 16)             # distinct text per page image
+        return json.dumps({"rawtext": f"「ベルは走った」\nヘスティアは{page}回笑った。\n"}, ensure_ascii=False)
+    if task == "glossary":
+        terms = {jp: en for jp, en in TERMS if jp in prompt}
+        if "glossary extractor" in system.lower():
+            return json.dumps({"glossary": terms}, ensure_ascii=False)
+        return json.dumps(terms, ensure_ascii=False)     # Aya: a flat JSON object
+
+    if random.random() < fail_rate:
+        return "途中で日本語が残った訳文。"
+    lines = (l.strip() for l in prompt.splitlines())
+    names = [m.group(2) for m in map(GLOSS_LINE.match, lines) if m]
+    return "An English rendering of the page." + "".join(f" {n} was there." for n in names)
+
+def mangle(task: str, text: str) -> str:
+    """The failure modes real models show: JSON cut off mid-object, a chatty preamble."""
+    if task == "translate":
+        return "Here is the translation:\n" + text
+    return text[: len(text) // 2]
+
+def generate_content_response(text: str, cached_tokens: int = 0) -> dict:
+    usage = {"promptTokenCount": 100 + cached_tokens, "candidatesTokenCount": len(text) // 4,
+             "totalTokenCount": 100 + cached_tokens + len(text) // 4}
+    if cached_tokens:
+        usage["cachedContentTokenCount"] = cached_tokens
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]},
+                        "finishReason": "STOP"}],
+        "usageMetadata": usage,
+    }
+
+def _timestamp(t: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+
+# ─── Server ──────────────────────────────────────────────────────────── #
+def new_stats() -> dict:
+    return {"uploads": 0, "batches": 0, "batch_requests": 0, "polls": 0,
+            "calls": 0, "throttled": 0, "malformed": 0, "output_tokens": 0, "units": set(),
+            "context_caches": 0, "cached_calls": 0}
+
+def make_app(fail_rate: float = 0.0, polls_until_done: int = 1,
+             faults: Faults | None = None) -> web.Application:
+    app    = web.Application(client_max_size=1024 ** 3)
+    ids    = itertools.count(1)
+    files: dict = {}        # "files/N" → bytes
+    jobs:  dict = {}        # "batches/N" → {"input": ..., "polls": int, "output": "files/M"}
+    caches: dict = {}       # "cachedContents/N" → the CachedContent resource
+    stats  = app["stats"] = new_stats()             # reset in place: stats.update(new_stats())
+    faults = app["faults"] = faults or Faults()
+
+    def online(req: dict):
+        """Canned answer for one online call, or None when this call is throttled."""
+        stats["calls"] += 1
+        if random.random() < faults.rate_429:
+            stats["throttled"] += 1
+            return None
+        stats["units"].add(unit_of(req))
+        task = task_of(req)
+        text = answer_for(req, fail_rate)
+        if random.random() < faults.malformed:
+            stats["malformed"] += 1
+            text = mangle(task, text)
+        stats["output_tokens"] += len(text) // 4 + 1
+        return text
+
+    def pieces(text: str):
+        """~4-char tokens, each released at the configured token rate."""
+        return [text[i:i + 4] for i in range(0, len(text), 4)] or [""]
+
+    async def pace(n_tokens: int = 0) -> None:
+        delay = n_tokens / faults.tps if faults.tps else 0.0
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def upload(request: web.Request) -> web.Response:
+        cmd = request.headers.get("X-Goog-Upload-Command", "")
+        if cmd == "start":
+            url = f"{request.scheme}://{request.host}/upload/v1beta/files?upload_id={next(ids)}"
+            return web.json_response({}, headers={"X-Goog-Upload-URL": url})
+        name = f"files/{request.query.get('upload_id', next(ids))}"
+        files[name] = await request.read()
+        stats["uploads"] += 1
+        return web.json_response({"file": {"name": name, "state": "ACTIVE"}})
+
+    async def model_action(request: web.Request) -> web.Response:
+        model, _, action = request.match_info["spec"].partition(":")
+        if action in ("generateContent", "streamGenerateContent"):
+            return await generate(request, await request.json(), action == "streamGenerateContent")
+        if action != "batchGenerateContent":
+            raise web.HTTPNotFound(text=f"unsupported action {action!r}")
+        body = await request.json()
+        name = f"batches/{next(ids)}"
+        jobs[name] = {"input": body["batch"]["input_config"]["file_name"], "polls": 0,
+                      "model": model, "output": None}
+        stats["batches"] += 1
+        return web.json_response({"name": name, "metadata": {"state": "BATCH_STATE_PENDING"}})
+
+    async def batch_status(request: web.Request) -> web.Response:
+        name = f"batches/{request.match_info['id']}"
+        job  = jobs.get(name)
+        if job is None:
+            raise web.HTTPNotFound(text=name)
+        job["polls"] += 1
+        stats["polls"] += 1
+        if job["polls"] <= polls_until_done:
+            return web.json_response({"name": name, "metadata": {"state": "BATCH_STATE_RUNNING"}})
+
+        if job["output"] is None:
+            lines = []
+            for line in files[job["input"]].decode("utf-8").splitlines():
+                rec = json.loads(line)
+                stats["batch_requests"] += 1
+                lines.append(json.dumps({"key": rec["key"], "response": generate_content_response(
+                    answer_for(rec["request"], fail_rate))}, ensure_ascii=False))
+            job["output"] = f"files/{next(ids)}"
+            files[job["output"]] = ("\n".join(lines) + "\n").encode("utf-8")
+        return web.json_response({"name": name, "done": True,
+                                  "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+                                  "response": {"responsesFile": job["output"]}})
+
+    async def download(request: web.Request) -> web.Response:
+        name = "files/" + request.match_info["spec"].partition(":")[0]
+        if name not in files:
+            raise web.HTTPNotFound(text=name)
+        return web.Response(body=files[name], content_type="application/jsonl")
+
+    # ── context caches ──────────────────────────────────────────────── #
+    def cache_resource(name: str, body: dict) -> dict:
+        now = time.time()
+        ttl = float(str(body.get("ttl", "3600s")).rstrip("s"))
+        system = body.get("systemInstruction") or body.get("system_instruction") or {}
+        tokens = len(" ".join(p.get("text", "") for p in system.get("parts", [])).encode("utf-8")) // 3
+        old = caches.get(name, {})
+        body = {k: v for k, v in body.items() if k not in ("ttl", "expireTime")}   # answered as expireTime
+        return {**old, **body, "name": name, "createTime": old.get("createTime", _timestamp(now)),
+                "updateTime": _timestamp(now), "expireTime": _timestamp(now + ttl),
+                "usageMetadata": {"totalTokenCount": tokens}}
+
+    async def cache_create(request: web.Request) -> web.Response:
+        name = f"cachedContents/{next(ids)}"
+        caches[name] = cache_resource(name, await request.json())
+        stats["context_caches"] += 1
+        return web.json_response(caches[name])
+
+    async def cache_item(request: web.Request) -> web.Response:
+        name = f"cachedContents/{request.match_info['id']}"
+        if name not in caches:
+            raise web.HTTPNotFound(text=f"CachedContent not found: {name}")
+        if request.method == "DELETE":
+            del caches[name]
+            return web.json_response({})
+        if request.method == "PATCH":               # only the TTL / expiry can change
+            body = await request.json()
+            caches[name] = cache_resource(name, {k: v for k, v in body.items() if k in ("ttl", "expireTime")})
+        return web.json_response(caches[name])
+
+    # ── online Gemini ───────────────────────────────────────────────── #
+    async def generate(request: web.Request, body: dict, stream: bool) -> web.StreamResponse:
+        cached_tokens = 0
+        ref = body.get("cachedContent") or body.get("cached_content")
+        if ref:
+            if ref not in caches:
+                return web.json_response({"error": {"code": 404, "status": "NOT_FOUND",
+                                                    "message": f"CachedContent not found: {ref}"}}, status=404)
+            cc = caches[ref]
+            body = {**body, "systemInstruction": cc.get("systemInstruction") or cc.get("system_instruction")}
+            cached_tokens = cc["usageMetadata"]["totalTokenCount"]
+            stats["cached_calls"] += 1
+        await asyncio.sleep(faults.latency)
+        text = online(body)
+        if text is None:
+            return web.json_response({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                                "message": "Resource has been exhausted (e.g. check quota)."}},
+                                     status=429)
+        if not stream:
+            await pace(len(text) // 4 + 1)
+            return web.json_response(generate_content_response(text, cached_tokens))
+        # alt=sse → server-sent events; otherwise one JSON array written element by element (SDK REST transport)
+        sse  = request.query.get("alt") == "sse"
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream" if sse else "application/json"})
+        await resp.prepare(request)
+        if not sse:
+            await resp.write(b"[")
+        for i, piece in enumerate(pieces(text)):
+            await pace(1)
+            chunk = json.dumps(generate_content_response(piece, cached_tokens), ensure_ascii=False)
+            await resp.write((f"data: {chunk}\r\n\r\n" if sse else ("," if i else "") + chunk + "\r\n").encode("utf-8"))
+        if not sse:
+            await resp.write(b"]")
+        await resp.write_eof()
+        return resp
+
+    # ── Ollama ──────────────────────────────────────────────────────── #
+    async def ollama(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        chat = request.path.endswith("/chat")
+        if chat:
+            msgs   = body.get("messages", [])
+            system = "\n".join(m["content"] for m in msgs if m.get("role") == "system")
+            prompt = next((m["content"] for m in reversed(msgs) if m.get("role") == "user"), "")
+        else:
+            system, prompt = body.get("system", ""), body.get("prompt", "")
+        req = {"system_instruction": {"parts": [{"text": system}]}, "contents": [{"parts": [{"text": prompt}]}]}
+
+        await asyncio.sleep(faults.latency)
+        text = online(req)
+        if text is None:
+            return web.json_response({"error": "server busy, please try again.  maximum pending requests exceeded"},
+                                     status=503)
+
+        def frame(piece: str, done: bool) -> dict:
+            base = {"model": body.get("model", ""), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+            if done:
+                base.update(done_reason="stop", prompt_eval_count=len(prompt) // 2, eval_count=len(text) // 4 + 1)
+            if chat:
+                return {**base, "message": {"role": "assistant", "content": piece}}
+            return {**base, "response": piece}
+
+        if not body.get("stream", True):                # Ollama streams unless told otherwise
+            await pace(len(text) // 4 + 1)
+            return web.json_response(frame(text, True))
+        resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await resp.prepare(request)
+        for piece in pieces(text):
+            await pace(1)
+            await resp.write((json.dumps(frame(piece, False), ensure_ascii=False) + "\n").encode("utf-8"))
+        await resp.write((json.dumps(frame("", True)) + "\n").encode("utf-8"))
+        await resp.write_eof()
+        return resp
+
+    app.router.add_post("/upload/v1beta/files", upload)
+    app.router.add_post("/v1beta/models/{spec}", model_action)
+    app.router.add_get("/v1beta/batches/{id}", batch_status)
+    app.router.add_get("/download/v1beta/files/{spec}", download)
+    app.router.add_post("/v1beta/cachedContents", cache_create)
+    app.router.add_route("*", "/v1beta/cachedContents/{id}", cache_item)
+    app.router.add_post("/api/chat", ollama)
+    app.router.add_post("/api/generate", ollama)
+    return app
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local Gemini / Ollama API stand-in.")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of translations left in Japanese")
+    ap.add_argument("--polls", type=int, default=1, help="status polls before a batch finishes")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    ap.add_argument("--tps", type=float, default=0.0, help="output tokens per second (0 = instant)")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="share of online calls throttled")
+    ap.add_argument("--malformed", type=float, default=0.0, help="share of online answers mangled")
+    args = ap.parse_args()
+    faults = Faults(args.latency, args.tps, args.rate_429, args.malformed)
+    web.run_app(make_app(args.fail_rate, args.polls, faults), host="127.0.0.1", port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import requests
 import json
-import tiktoken
+from pathlib import Path
+from segmenter import get_chunks  # sentence-aligned, so no overlap between chunks
+from token_budget import counter_for  # chunk sizes in the target model's tokens
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+from glossary_embeddings import load_glossary_embeddings  # entries embedded once, cached beside the glossary
 
 def generate_response(prompt, model="qwen2.5", url="http://localhost:11434/api/generate"):
     headers = {"Content-Type": "application/json"}
@@ -23,35 +26,22 @@ def generate_response(prompt, model="qwen2.5", url="http://localhost:11434/api/g
         return "Failed to decode JSON response from the API."
 
 
-def get_chunks(file_path, tokens_per_chunk, encoding_name="cl100k_base"):
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    with open(file_path, 'r', encoding='utf-8') as file:
-        text = file.read()
-    tokens = tokenizer.encode(text)
-    total_tokens = len(tokens)
-    print(f"Total number of tokens in the original file: {total_tokens}")
-    
-    chunks = [
-        tokenizer.decode(tokens[i:i + tokens_per_chunk])
-        for i in range(0, total_tokens, tokens_per_chunk)
-    ]
-    return chunks
-
-
-def extract_relevant_glossary(glossary_path, chunk_text, model, similarity_threshold=0.8):
-    # Load glossary
+def load_glossary(glossary_path, model, model_name):
+    """The glossary, its "category: name" → definition lookup and its embedding index."""
     with open(glossary_path, 'r', encoding="utf-8") as file:
         glossary = json.load(file)
-    
+
     # Flatten glossary into key-value pairs with categories
-    glossary_items = [
-        (f"{category}: {name}", definition)
+    definitions = {
+        f"{category}: {name}": definition
         for category, entries in glossary.items()
         for name, definition in entries.items()
-    ]
-    glossary_texts = [item[0] for item in glossary_items]
-    glossary_definitions = [item[1] for item in glossary_items]
+    }
+    index = load_glossary_embeddings(Path(glossary_path), definitions, model, model_name)
+    return glossary, definitions, index
+
 
+def extract_relevant_glossary(glossary, definitions, index, chunk_text, model, similarity_threshold=0.8):
     # Perform direct substring matches
     substring_matches = set()
     for category, entries in glossary.items():
@@ -67,15 +57,9 @@ def extract_relevant_glossary(glossary_path, chunk_text, model, similarity_thres
                 if any(part in chunk_text for part in name_parts):
                     substring_matches.add(f"{category}: {name}: {definition}")
 
-    # Perform semantic similarity matches
-    chunk_embedding = model.encode(chunk_text, convert_to_tensor=True)
-    glossary_embeddings = model.encode(glossary_texts, convert_to_tensor=True)
-    similarities = util.pytorch_cos_sim(chunk_embedding, glossary_embeddings)[0]
-    
-    semantic_matches = {
-        f"{glossary_texts[idx]}: {glossary_definitions[idx]}"
-        for idx in (similarities > similarity_threshold).nonzero(as_tuple=True)[0]
-    }
+    # Perform semantic similarity matches (only the chunk is embedded here)
+    hits = index.search(model.encode(chunk_text), threshold=similarity_threshold)[0]
+    semantic_matches = {f"{text}: {definitions[text]}" for text, _ in hits}
 
     # Combine and deduplicate matches
     combined_matches = substring_matches.union(semantic_matches)
@@ -91,8 +75,10 @@ if __name__ == "__main__":
     glossary_file_path = 'refining_glossary.json'
     output_file_path = 'Refined_English.txt'
 
-    # Load the embedding model
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    # Load the embedding model and the glossary (embedded once, not per chunk)
+    embedding_model_name = 'all-MiniLM-L6-v2'
+    embedding_model = SentenceTransformer(embedding_model_name)
+    glossary, definitions, glossary_index = load_glossary(glossary_file_path, embedding_model, embedding_model_name)
 
     # Enhanced prompt
     refinement_prompt = """
@@ -111,7 +97,7 @@ if __name__ == "__main__":
     """
 
     # Chunk the input file
-    chunks = get_chunks(input_file_path, tokens_per_chunk=600)
+    chunks = get_chunks(input_file_path, tokens_per_chunk=600, counter=counter_for("qwen2.5"))
 
     # Process each chunk and save results with a progress bar
     last_context = ""  # Stores the last 200-300 characters from the previous translation
@@ -119,7 +105,7 @@ if __name__ == "__main__":
         with tqdm(total=len(chunks), desc="Processing Chunks") as progress_bar:
             for idx, chunk in enumerate(chunks):
                 # Extract relevant glossary entries dynamically using semantic similarity
-                glossary_text = extract_relevant_glossary(glossary_file_path, chunk, embedding_model)
+                glossary_text = extract_relevant_glossary(glossary, definitions, glossary_index, chunk, embedding_model)
                 
                 # Prepare context for the current chunk
                 context_prompt = f"\n\nLast Context:\n{last_context}" if last_context else ""
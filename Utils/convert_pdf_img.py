@@ -1,10 +1,10 @@
 from pathlib import Path
-import json
-from io import BytesIO
+import hashlib, json, os
+from concurrent.futures import ProcessPoolExecutor
 
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from reportlab.lib.utils import simpleSplit, ImageReader
+from reportlab.lib.utils import simpleSplit
 from PIL import Image
 
 # ─── Paths ──────────────────────────────────────────────────────────── #
@@ -15,6 +15,10 @@ IMG_DIR    = BASE_DIR / "Input" / "Danmachi_vol20" / "Images"
 MAPPING_PATH = PROC_DIR / "mapping.json"
 OUT_PDF      = BASE_DIR / "Output" / "Danmachi_vol20" / "Danmachi_Vol20_EN.pdf"
 
+# derivatives + wrapped-line layouts from earlier builds; safe to delete
+CACHE_DIR    = BASE_DIR / ".pdf_cache"
+INDEX_PATH   = CACHE_DIR / "index.json"
+
 TITLE = "Danmachi – Volume 20 (EN)"
 
 # ─── Layout constants ──────────────────────────────────────────────── #
@@ -28,53 +32,93 @@ TITLE_FONT   = ("Helvetica-Bold", 20)
 # ─── Image-handling constants (size + JPEG quality) ─────────────────── #
 MAX_PX  = 1650   # longest edge after down-sampling  ≈ 300 dpi on Letter
 JPEG_Q  = 85
+WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 4)))
+
+# ─── Cache helpers ──────────────────────────────────────────────────── #
+def _load_index() -> dict:
+    if INDEX_PATH.exists():
+        return json.loads(INDEX_PATH.read_text(encoding="utf-8"))
+    return {"sources": {}, "layouts": {}}
+
+def _save_index(index: dict):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = INDEX_PATH.with_name(INDEX_PATH.name + ".tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, INDEX_PATH)
+
+def _source_hash(img_path: Path, sources: dict) -> str:
+    """sha256 of a scan, re-read only when its size or mtime changed."""
+    st = img_path.stat()
+    hit = sources.get(str(img_path))
+    if hit and hit[:2] == [st.st_size, st.st_mtime_ns]:
+        return hit[2]
+    digest = hashlib.sha256(img_path.read_bytes()).hexdigest()
+    sources[str(img_path)] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+def _derivative_path(digest: str) -> Path:
+    return CACHE_DIR / "images" / f"{digest[:32]}-{MAX_PX}-q{JPEG_Q}.jpg"
+
+def _layout_key(text: str) -> str:
+    usable_w = PAGE_SIZE[0] - 2 * MARGIN
+    return hashlib.sha256(f"{BODY_FONT}|{usable_w}|{text}".encode("utf-8")).hexdigest()[:32]
+
+# ─── Workers (run in the process pool) ──────────────────────────────── #
+def _build_derivative(job):
+    """Down-sampled JPEG of one scan, written once per (source hash, MAX_PX, JPEG_Q)."""
+    img_path, out = job
+    img = Image.open(img_path).convert("RGB")
+    img.thumbnail((MAX_PX, MAX_PX), Image.LANCZOS)        # only ever shrinks
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + f".{os.getpid()}.tmp")
+    img.save(tmp, format="JPEG", quality=JPEG_Q, optimize=True)
+    os.replace(tmp, out)
+    return out
+
+def _wrap(text: str):
+    """Wrapped lines of one page; None marks a paragraph gap."""
+    usable_w = PAGE_SIZE[0] - 2 * MARGIN
+    lines = []
+    for raw in text.splitlines():
+        if not raw.strip():                                 # blank line
+            lines.append(None)
+            continue
+        lines.extend(simpleSplit(raw.strip(), BODY_FONT[0], BODY_FONT[1], usable_w))
+    return lines
 
 # ─── Text page helper ───────────────────────────────────────────────── #
-def _render_text_page(pdf: canvas.Canvas, text: str):
+def _render_text_page(pdf: canvas.Canvas, lines):
     pdf.showPage()                                          # fresh sheet
     width, height = PAGE_SIZE
-    usable_w = width - 2 * MARGIN
     x, y = MARGIN, height - MARGIN
     pdf.setFont(*BODY_FONT)
 
-    for raw in text.splitlines():
-        if not raw.strip():                                 # blank line
+    for line in lines:
+        if line is None:
             y -= PARA_SPACING
             continue
-        for line in simpleSplit(raw.strip(), BODY_FONT[0], BODY_FONT[1], usable_w):
-            if y < MARGIN + LINE_SPACING:                  # new PDF page
-                pdf.showPage()
-                pdf.setFont(*BODY_FONT)
-                y = height - MARGIN
-            pdf.drawString(x, y, line)
-            y -= LINE_SPACING
+        if y < MARGIN + LINE_SPACING:                      # new PDF page
+            pdf.showPage()
+            pdf.setFont(*BODY_FONT)
+            y = height - MARGIN
+        pdf.drawString(x, y, line)
+        y -= LINE_SPACING
 
 # ─── Image page helper ──────────────────────────────────────────────── #
-def _render_image_page(pdf: canvas.Canvas, img_path: Path):
+def _render_image_page(pdf: canvas.Canvas, jpg_path: Path):
     pdf.showPage()                                          # fresh sheet
 
     width, height = PAGE_SIZE
-    img = Image.open(img_path).convert("RGB")
-
-    # down-sample very large scans
-    scale_px = MAX_PX / max(img.size)
-    if scale_px < 1.0:
-        new_size = (int(img.size[0] * scale_px), int(img.size[1] * scale_px))
-        img = img.resize(new_size, Image.LANCZOS)
+    with Image.open(jpg_path) as img:                       # header only, no decode
+        iw, ih = img.size
 
-    # compress to in-memory JPEG
-    buf = BytesIO()
-    img.save(buf, format="JPEG", quality=JPEG_Q, optimize=True)
-    buf.seek(0)
-    img_reader = ImageReader(buf)
-
-    iw, ih = img.size
     max_w, max_h = width - 2 * MARGIN, height - 2 * MARGIN
     scale = min(max_w / iw, max_h / ih)
     dw, dh = iw * scale, ih * scale
     x, y = (width - dw) / 2, (height - dh) / 2
 
-    pdf.drawImage(img_reader, x, y, dw, dh,
+    # a JPEG file is embedded as-is (DCT passthrough), never re-encoded
+    pdf.drawImage(str(jpg_path), x, y, dw, dh,
                   preserveAspectRatio=True, anchor='c')
     # Do NOT call pdf.showPage() here; the helper already began with one.
 
@@ -82,6 +126,38 @@ def _render_image_page(pdf: canvas.Canvas, img_path: Path):
 def mapping_to_pdf(mapping_path: Path, img_dir: Path, out_pdf: Path):
     raw = json.loads(mapping_path.read_text(encoding="utf-8"))
     pages = {str(p["page_no"]): p for p in (raw if isinstance(raw, list) else raw.values())}
+    order = sorted(pages.keys(), key=lambda s: int(s))
+
+    # plan every page first, so all the expensive work can go to the pool at once
+    index   = _load_index()
+    plan    = []                                            # ("image", jpg) | ("text", layout key)
+    images  = {}                                            # derivative → source, still to build
+    texts   = {}                                            # layout key → text, still to wrap
+    for key in order:
+        rec = pages[key]
+        img_path = img_dir / f"page_{int(key):03}.png"  # adjust ext if needed
+
+        if rec.get("contains_illustration") and img_path.exists():
+            jpg = _derivative_path(_source_hash(img_path, index["sources"]))
+            if not jpg.exists():
+                images[jpg] = img_path
+            plan.append(("image", jpg))
+            continue
+
+        eng = rec.get("English", "").strip() or "[Blank page]"
+        lkey = _layout_key(eng)
+        if lkey not in index["layouts"]:
+            texts[lkey] = eng
+        plan.append(("text", lkey))
+
+    if images or texts:
+        with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+            built = pool.map(_build_derivative, [(src, out) for out, src in images.items()])
+            wrapped = pool.map(_wrap, texts.values(), chunksize=8)
+            index["layouts"].update(zip(texts, wrapped))
+            list(built)                                     # surface worker errors
+    print(f"{len(images)} image(s) and {len(texts)} text page(s) rebuilt, "
+          f"{len(plan) - len(images) - len(texts)} from cache.")
 
     pdf = canvas.Canvas(str(out_pdf), pagesize=PAGE_SIZE)
     w, h = PAGE_SIZE
@@ -92,18 +168,17 @@ def mapping_to_pdf(mapping_path: Path, img_dir: Path, out_pdf: Path):
     pdf.drawString((w - pdf.stringWidth(TITLE, *TITLE_FONT)) / 2, h * 0.6, TITLE)
     pdf.showPage()
 
-    for key in sorted(pages.keys(), key=lambda s: int(s)):
-        rec = pages[key]
-        img_path = img_dir / f"page_{int(key):03}.png"  # adjust ext if needed
-
-        if rec.get("contains_illustration") and img_path.exists():
-            _render_image_page(pdf, img_path)
-            continue
-
-        eng = rec.get("English", "").strip()
-        _render_text_page(pdf, eng or "[Blank page]")
+    for kind, ref in plan:
+        if kind == "image":
+            _render_image_page(pdf, ref)
+        else:
+            _render_text_page(pdf, index["layouts"][ref])
 
     pdf.save()
+    # keep only the layouts this build used, so edited pages don't pile up
+    used = {ref for kind, ref in plan if kind == "text"}
+    index["layouts"] = {k: v for k, v in index["layouts"].items() if k in used}
+    _save_index(index)
     print("✓ PDF written to", out_pdf)
 
 # ─── Run ─────────────────────────────────────────────────────────────── #
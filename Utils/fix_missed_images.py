@@ -1,9 +1,35 @@
 from pathlib import Path
 import json
+from translation_db import TranslationDB
 
 MAPPING_PATH = Path("./Processing_Files/Danmachi_vol20/mapping.json")
+DB_PATH      = MAPPING_PATH.with_name("translation.db")   # used instead when present
+LAST_PAGE    = 423
+
+def blank_page(key: str) -> dict:
+    return {
+        "page_no": key,
+        "contains_text": False,
+        "contains_illustration": True,
+        "rawtext": "",
+        "English": "",
+        "Glossary": {}
+    }
+
+def fix_db() -> None:
+    with TranslationDB(DB_PATH) as db:
+        missing = db.missing_pages(1, LAST_PAGE)
+        for num in missing:
+            db.put(f"{num:03}", blank_page(f"{num:03}"))
+    if missing:
+        print(f"✓ Added {len(missing)} missing page(s). {DB_PATH.name} updated.")
+    else:
+        print("All pages already present – no changes made.")
 
 def main() -> None:
+    if DB_PATH.exists():
+        fix_db()
+        return
     if not MAPPING_PATH.exists():
         raise FileNotFoundError(MAPPING_PATH)
 
@@ -14,17 +40,10 @@ def main() -> None:
         data = {str(p["page_no"]): p for p in data}
 
     added = 0
-    for num in range(1, 424):          # 001 … 423 inclusive
+    for num in range(1, LAST_PAGE + 1):    # 001 … 423 inclusive
         key = f"{num:03}"
         if key not in data:
-            data[key] = {
-                "page_no": key,
-                "contains_text": False,
-                "contains_illustration": True,
-                "rawtext": "",
-                "English": "",
-                "Glossary": {}
-            }
+            data[key] = blank_page(key)
             added += 1
 
     if added:
@@ -1,22 +1,28 @@
 from pathlib import Path
 import json
+from translation_db import TranslationDB
 
 MAPPING_PATH = Path("./Processing_Files/Danmachi_vol20/mapping.json")
+DB_PATH      = MAPPING_PATH.with_name("translation.db")   # used instead when present
 
 def main():
-    data = json.loads(MAPPING_PATH.read_text(encoding="utf-8"))
-
-    # tolerant to old list format
-    if isinstance(data, list):
-        pages = {str(p["page_no"]): p for p in data}
+    if DB_PATH.exists():
+        with TranslationDB(DB_PATH) as db:
+            both = db.pages_with_both()             # indexed on the page-type flags
     else:
-        pages = {str(k): v for k, v in data.items()}
+        data = json.loads(MAPPING_PATH.read_text(encoding="utf-8"))
+
+        # tolerant to old list format
+        if isinstance(data, list):
+            pages = {str(p["page_no"]): p for p in data}
+        else:
+            pages = {str(k): v for k, v in data.items()}
 
-    both = [
-        int(k) for k, rec in pages.items()
-        if rec.get("contains_text") and rec.get("contains_illustration")
-    ]
-    both.sort()
+        both = [
+            int(k) for k, rec in pages.items()
+            if rec.get("contains_text") and rec.get("contains_illustration")
+        ]
+        both.sort()
 
     print("Pages that contain *both* text and illustration:")
     print(both or "[none]")
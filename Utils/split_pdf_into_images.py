@@ -1,24 +1,67 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from pdf2image import convert_from_path
+from tempfile import TemporaryDirectory
+from pdf2image import convert_from_path, pdfinfo_from_path
 
 # ─── Paths ──────────────────────────────────────────────────────────────
-PDF_PATH  = Path(".\Input\Danmachi_vol20\Danmachi_vol20.pdf")
-OUT_DIR   = Path(".\Input\Danmachi_vol20\Images")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-
-# ─── Render & save ───────────────────────────────────────────────────────
-# 600 dpi ⇒ ~2× typical screen resolution; adjust if files get too big
-pages = convert_from_path(
-    PDF_PATH,
-    dpi=600,
-    fmt="png",            # keeps transparency off; change to "jpeg" if you like
-    thread_count=4        # speeds things up on multi-core CPUs
-    # poppler_path=r"C:\Tools\poppler-24.02.0\Library\bin"  # <- uncomment if needed
-)
-
-for i, page in enumerate(pages, start=1):
-    out_file = OUT_DIR / f"page_{i:03}.png"
-    page.save(out_file, "PNG")
-    print(f"✅  Saved {out_file}")
-
-print(f"\nDone. {len(pages)} pages written to {OUT_DIR.resolve()}")
\ No newline at end of file
+PDF_PATH  = Path(".") / "Input" / "Danmachi_vol20" / "Danmachi_vol20.pdf"
+OUT_DIR   = Path(".") / "Input" / "Danmachi_vol20" / "Images"
+POPPLER   = None          # r"C:\Tools\poppler-24.02.0\Library\bin"  # <- set if poppler is not on PATH
+
+# ─── Rendering ──────────────────────────────────────────────────────────
+# 600 dpi ⇒ ~2× typical screen resolution; image_prep.py downsizes for upload anyway
+DPI        = int(os.getenv("RASTER_DPI", "600"))
+FMT        = "png"          # every consumer (OCR, classifier, image_prep, v4) reads page_NNN.png
+WORKERS    = int(os.getenv("RASTER_WORKERS", str(os.cpu_count() or 4)))
+RANGE_SIZE = 8            # pages per pdftoppm call; each worker holds one page at a time
+
+
+def page_file(n):
+    return OUT_DIR / f"page_{n:03}.{FMT}"
+
+def missing_ranges(total):
+    """(first, last) page ranges still to render, at most RANGE_SIZE pages each."""
+    todo = [n for n in range(1, total + 1) if not page_file(n).exists()]
+    ranges, start = [], None
+    for i, n in enumerate(todo):
+        if start is None:
+            start = n
+        nxt = todo[i + 1] if i + 1 < len(todo) else None
+        if nxt != n + 1 or n - start + 1 == RANGE_SIZE:
+            ranges.append((start, n))
+            start = None
+    return ranges
+
+def render_range(first, last):
+    """
+    Render pages first..last straight to disk (poppler writes the files;
+    nothing is decoded into PIL) and move each into place atomically, so
+    an interrupted run never leaves a half-written page_NNN behind.
+    """
+    with TemporaryDirectory(dir=OUT_DIR) as tmp:
+        paths = convert_from_path(
+            PDF_PATH, dpi=DPI, fmt=FMT, first_page=first, last_page=last,
+            output_folder=tmp, output_file="p", paths_only=True, poppler_path=POPPLER,
+        )
+        for n, path in zip(range(first, last + 1), sorted(paths)):
+            os.replace(path, page_file(n))
+    return first, last
+
+def main():
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    total = pdfinfo_from_path(PDF_PATH, poppler_path=POPPLER)["Pages"]
+    ranges = missing_ranges(total)
+    left = sum(b - a + 1 for a, b in ranges)
+    print(f"{total} pages, {total - left} already rendered, {left} to go at {DPI} dpi ({FMT}).")
+
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        futures = [pool.submit(render_range, a, b) for a, b in ranges]
+        for fut in as_completed(futures):
+            a, b = fut.result()
+            print(f"✅  Saved page_{a:03}–{b:03}")
+
+    print(f"\nDone. {total} pages in {OUT_DIR.resolve()}")
+
+if __name__ == "__main__":
+    main()
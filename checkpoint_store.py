@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import json, os
+from pathlib import Path
+from typing import Any, Dict
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+WAL_SUFFIX       = ".wal"           # mapping.json → mapping.json.wal
+MIN_COMPACT_SIZE = 1 * 1024 * 1024  # don't bother compacting a WAL smaller than this
+
+
+class CheckpointStore:
+    """
+    Crash-safe, append-only checkpoints for a JSON dict file (mapping.json,
+    glossary.json, …).
+
+    Every `put()` appends one JSON line to `<file>.wal` instead of rewriting
+    the whole file.  The WAL is folded back into the regular JSON file (same
+    shape and indent as before, so existing readers keep working) by an
+    atomic write-then-rename whenever it outgrows the snapshot, and on
+    `close()`.  On open, a leftover WAL from a crashed run is replayed; a
+    torn final line is ignored.
+    """
+
+    def __init__(self, path: Path | str, indent: int = 2, key_field: str | None = None):
+        self.path      = Path(path)
+        self.wal_path  = self.path.with_name(self.path.name + WAL_SUFFIX)
+        self.indent    = indent
+        self.key_field = key_field          # index legacy list snapshots by this field
+        self.data: Dict[str, Any] = {}
+        self._wal = None
+        self._snapshot_size = 0
+
+    # ─── lifecycle ─── #
+    def load(self) -> Dict[str, Any]:
+        """Snapshot + replayed WAL.  The returned dict is live: mutate it, then put()/compact()."""
+        self.data = {}
+        if self.path.exists():
+            raw = json.loads(self.path.read_text(encoding="utf-8") or "{}")
+            if isinstance(raw, list) and self.key_field:
+                raw = {str(rec[self.key_field]): rec for rec in raw}
+            if isinstance(raw, dict):
+                self.data = raw
+            self._snapshot_size = self.path.stat().st_size
+
+        replayed = self._replay()
+        if replayed:
+            print(f"[checkpoint] recovered {replayed} record(s) from {self.wal_path.name}")
+            self.compact()
+        self._wal = self.wal_path.open("a", encoding="utf-8")
+        return self.data
+
+    def close(self) -> None:
+        if self._wal is None:
+            return
+        self.compact()
+        self._wal.close()
+        self._wal = None
+        try:
+            self.wal_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "CheckpointStore":
+        self.load()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ─── writes ─── #
+    def put(self, key: str, record: Any) -> None:
+        """Record one finished chunk/page/term durably (append + fsync)."""
+        self.data[key] = record
+        self._wal.write(json.dumps({"k": key, "v": record}, ensure_ascii=False) + "\n")
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        if self._wal.tell() > max(self._snapshot_size, MIN_COMPACT_SIZE):
+            self.compact()
+
+    def compact(self) -> None:
+        """Atomically rewrite the JSON file from memory, then truncate the WAL."""
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=self.indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._snapshot_size = self.path.stat().st_size
+        if self._wal is not None:
+            self._wal.seek(0)
+            self._wal.truncate()
+        elif self.wal_path.exists():
+            self.wal_path.write_text("", encoding="utf-8")
+
+    # ─── recovery ─── #
+    def _replay(self) -> int:
+        if not self.wal_path.exists():
+            return 0
+        n = 0
+        with self.wal_path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    break                   # torn write from a crash – everything before it is good
+                self.data[rec["k"]] = rec["v"]
+                n += 1
+        return n
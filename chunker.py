@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator, List, Mapping, Sequence, Tuple
+
+from token_budget import TiktokenCounter, TokenCounter
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+ENCODING    = "cl100k_base"
+BATCH_LINES = 1024                  # lines handed to one encode_batch() call
+
+
+@dataclass
+class ChunkStats:
+    chunks: int = 0
+    tokens: int = 0                 # sum of per-line counts, so no second encode pass
+
+
+# ─── Packing ─────────────────────────────────────────────────────────── #
+def pack(pairs: Iterable[Tuple[str, int]], budget: int,
+         stats: ChunkStats | None = None) -> Iterator[str]:
+    """
+    Greedy packing of (piece, token count) pairs — lines, sentences … — into
+    chunks of at most *budget* tokens, using the counts already computed.
+
+    A piece larger than the budget becomes a chunk of its own.  Running
+    totals only — each piece is touched once and joined once.
+    """
+    stats = stats if stats is not None else ChunkStats()
+    buf: List[str] = []
+    used = 0
+    for piece, n in pairs:
+        if buf and used + n > budget:
+            stats.chunks += 1
+            yield "".join(buf)
+            buf, used = [], 0
+        buf.append(piece)
+        used += n
+        stats.tokens += n
+    if buf:
+        stats.chunks += 1
+        yield "".join(buf)
+
+
+def count_pieces(pieces: Iterable[str], counter: TokenCounter) -> Iterator[Tuple[str, int]]:
+    """(piece, token count) pairs, counted BATCH_LINES at a time."""
+    it = iter(pieces)
+    while True:
+        batch = list(islice(it, BATCH_LINES))
+        if not batch:
+            return
+        yield from zip(batch, counter.count_batch(batch))
+
+
+# ─── File chunking ───────────────────────────────────────────────────── #
+def iter_chunks(file_path, tokens_per_chunk: int, encoding_name: str = ENCODING,
+                stats: ChunkStats | None = None, counter: TokenCounter | None = None) -> Iterator[str]:
+    """
+    Stream *file_path* line by line and yield line-aligned chunks lazily.
+    Sizes are in *counter*'s tokens (token_budget.counter_for(model)); without
+    one, in *encoding_name* tiktoken tokens.
+    """
+    counter = counter or TiktokenCounter(encoding_name)
+    with open(file_path, encoding="utf-8") as fh:
+        yield from pack(count_pieces(fh, counter), tokens_per_chunk, stats)
+
+
+def check_resume(staging: Mapping[str, dict], chunks: Sequence[str], staging_file="mapping.json") -> None:
+    """
+    Stop before resuming a staging file whose "chunk N" records were cut
+    differently from *chunks* (another chunk size or token counter): resume
+    goes by chunk number, so new source text would land under old English.
+    """
+    for key, rec in staging.items():
+        if not key.startswith("chunk ") or "Chinese" not in rec:
+            continue
+        n = int(key.split()[1])
+        if n > len(chunks) or rec["Chinese"].strip() != chunks[n - 1].strip():
+            raise SystemExit(f"{staging_file}: {key} does not match the input as it is chunked now "
+                             f"({len(chunks)} chunks). It was started with another chunk size or token "
+                             "counter; rerun with that tokens_per_chunk, or move it aside to start over.")
+
+
+def get_chunks(file_path, tokens_per_chunk: int, encoding_name: str = ENCODING,
+               verbose: bool = True, counter: TokenCounter | None = None) -> List[str]:
+    """iter_chunks() collected into a list, with the totals printed once."""
+    stats = ChunkStats()
+    chunks = list(iter_chunks(file_path, tokens_per_chunk, encoding_name, stats, counter))
+    if verbose:
+        print(f"Total number of tokens in the original file: {stats.tokens}")
+        print(f"Number of chunks created: {stats.chunks}")
+    return chunks
+
@@ -0,0 +1,146 @@
+"""
+Gemini context caching for a script's static system instruction (rules +
+style profile), so it is stored once per run instead of being resent with
+every page and every retry.
+
+Scripts do not use it directly: gemini_clients.ClientPool keeps one per
+system instruction and builds its models from the handles.
+
+    cached = ContextCache(SYSTEM_TEMPLATE).cached(key, model)   # CachedContent or None
+    model  = genai.GenerativeModel.from_cached_content(cached) if cached else ...
+
+Cached content belongs to one API key and one model, so there is one
+handle per (key, model).  It is created on first use, its TTL is extended
+when it gets close to running out, and it is deleted when the process
+exits.  Whenever caching is unavailable (prefix below the model's minimum,
+model without caching, old SDK, any API error) cached() returns None and
+the caller sends the system instruction inline; that (key, model) is then
+left alone for a while before caching is tried again.
+"""
+from __future__ import annotations
+
+import atexit, datetime, hashlib, logging, os, threading, time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Dict, Iterator, Tuple
+
+import google.generativeai as genai
+
+from rate_limiter import estimate_tokens
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+ENABLED     = os.getenv("GEMINI_CONTEXT_CACHE", "on").lower() != "off"
+TTL_S       = int(os.getenv("GEMINI_CONTEXT_TTL", "3600"))   # billed per hour stored; refreshed while in use
+REFRESH_S   = min(300, TTL_S // 4)                           # extend once less than this is left
+RETRY_AFTER = 600                                            # seconds before a failed (key, model) is retried
+
+# smallest prefix the API will cache; shorter ones are sent inline
+MIN_TOKENS: Dict[str, int] = {
+    "gemini-2.5-pro":   4_096,
+    "gemini-2.0-flash": 4_096,
+}
+DEFAULT_MIN_TOKENS = 1_024
+
+
+@dataclass
+class _Handle:
+    cached:  object | None = None       # genai.caching.CachedContent
+    expires: float = 0.0                # monotonic deadline of the current TTL
+    retry:   float = 0.0                # monotonic time before which creation is not retried
+
+
+_configure_lock = threading.Lock()
+
+@contextmanager
+def configured(key: str) -> Iterator[None]:
+    """genai's cache calls use the process-global client: hold it on *key* meanwhile."""
+    with _configure_lock:
+        genai.configure(api_key=key)
+        yield
+
+
+class ContextCache:
+    """Per-(key, model) cached-content handles for one fixed system instruction."""
+
+    def __init__(self, system: str, label: str = "", enabled: bool = ENABLED, ttl: int = TTL_S,
+                 session: Callable[[str], ContextManager] = configured):
+        self.system  = system
+        self.label   = label
+        self.enabled = enabled and hasattr(genai, "caching")     # SDKs before 0.7 have no caching
+        self.ttl     = ttl
+        self.session = session                  # runs the create / update / delete calls for a key
+        self.digest  = hashlib.sha256(system.encode("utf-8")).hexdigest()[:12]
+        self._handles: Dict[Tuple[str, str], _Handle] = {}
+        self._locks:   Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    # ── handle for one call ───────────────────────────────────────────── #
+    def cached(self, key: str, model: str):
+        """The live CachedContent for (*key*, *model*), or None to send the instruction inline."""
+        return self._cached(key, model) if self._eligible(model) else None
+
+    def failed(self, key: str, model: str, exc: Exception) -> None:
+        """Drop the handle when a call was refused because of it (expired or deleted cache)."""
+        if "cached" not in str(exc).lower():
+            return
+        with self._lock:
+            handle = self._handles.get((key, model))
+        if handle is not None:
+            handle.cached, handle.expires = None, 0.0
+
+    def close(self) -> None:
+        """Delete every cache this process created (storage is billed until the TTL ends)."""
+        with self._lock:
+            handles, self._handles = list(self._handles.items()), {}
+        for (key, _), h in handles:
+            if h.cached is not None:
+                try:
+                    with self.session(key):
+                        h.cached.delete()
+                except Exception:
+                    pass                        # it expires on its own
+
+    # ── internals ─────────────────────────────────────────────────────── #
+    def _eligible(self, model: str) -> bool:
+        return self.enabled and estimate_tokens(self.system) >= MIN_TOKENS.get(model, DEFAULT_MIN_TOKENS)
+
+    def _cached(self, key: str, model: str):
+        with self._lock:
+            handle = self._handles.setdefault((key, model), _Handle())
+            lock   = self._locks.setdefault((key, model), threading.Lock())
+        now = time.monotonic()
+        if handle.cached is not None and handle.expires - now > REFRESH_S:
+            return handle.cached                # fast path: no lock, no API call
+        if handle.cached is None and now < handle.retry:
+            return None
+
+        with lock:                              # one worker creates / refreshes, the others wait
+            now = time.monotonic()
+            if handle.cached is not None and handle.expires - now > REFRESH_S:
+                return handle.cached
+            if handle.cached is not None:
+                try:
+                    with self.session(key):
+                        handle.cached.update(ttl=datetime.timedelta(seconds=self.ttl))
+                    handle.expires = now + self.ttl
+                    return handle.cached
+                except Exception as e:          # already expired or deleted → make a new one
+                    logging.info(f"context cache {self.label or self.digest}: refresh failed ({e}); recreating")
+                    handle.cached = None
+            if now < handle.retry:
+                return None
+            try:
+                with self.session(key):
+                    handle.cached = genai.caching.CachedContent.create(
+                        model=model if model.startswith("models/") else f"models/{model}",
+                        display_name=f"{self.label or 'system'}-{self.digest}"[:128],
+                        system_instruction=self.system,
+                        ttl=datetime.timedelta(seconds=self.ttl),
+                    )
+                handle.expires = now + self.ttl
+            except Exception as e:
+                logging.info(f"context cache {self.label or self.digest}: unavailable for {model} ({e}); "
+                             "sending the system instruction inline")
+                handle.cached, handle.retry = None, now + RETRY_AFTER
+            return handle.cached
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import base64, json, mimetypes, os, time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import requests
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+API_BASE     = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+POLL_SECONDS = float(os.getenv("GEMINI_BATCH_POLL", "60"))
+TIMEOUT      = 300                                    # per HTTP call, seconds
+
+DONE_STATES = {"BATCH_STATE_SUCCEEDED", "BATCH_STATE_FAILED",
+               "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"}
+
+
+# ─── Request builders ────────────────────────────────────────────────── #
+def text_request(prompt: str, system: str, config: dict | None = None) -> dict:
+    """One GenerateContentRequest for the batch input file."""
+    req = {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "system_instruction": {"parts": [{"text": system}]},
+    }
+    if config:
+        req["generation_config"] = config
+    return req
+
+def image_request(prompt: str, image_path: Path, system: str, config: dict | None = None) -> dict:
+    """Like text_request, with the page image sent inline (base64)."""
+    req = text_request(prompt, system, config)
+    mime = mimetypes.guess_type(str(image_path))[0] or "image/png"
+    req["contents"][0]["parts"].append({"inline_data": {
+        "mime_type": mime,
+        "data": base64.b64encode(Path(image_path).read_bytes()).decode("ascii"),
+    }})
+    return req
+
+
+# ─── Batch job ───────────────────────────────────────────────────────── #
+class GeminiBatch:
+    """
+    Thin REST client for the Gemini Batch API (half the price of online
+    calls; results within 24 h).
+
+    run() writes the requests as JSONL, uploads it, creates the job, polls it
+    and downloads the responses.  The job name is remembered next to the
+    JSONL file, so an interrupted run resumes polling the same job instead
+    of paying for it twice.  That note is kept until the caller has saved
+    the results and calls done(), so a crash while merging them re-downloads
+    the finished job rather than submitting it again.  GEMINI_API_BASE points it at a stand-in server
+    (see Test/mock_llm_server.py).
+    """
+
+    def __init__(self, api_key: str, model: str, base: str = API_BASE):
+        self.model = model
+        self.base  = base.rstrip("/")
+        self.http  = requests.Session()
+        self.http.headers["x-goog-api-key"] = api_key
+        self.downloaded: List[Path] = []       # .job notes of runs whose results are not saved yet
+
+    # ─── steps ─── #
+    def write_jsonl(self, reqs: Dict[str, dict], path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            for key, req in reqs.items():
+                f.write(json.dumps({"key": key, "request": req}, ensure_ascii=False) + "\n")
+        return path
+
+    def upload(self, path: Path) -> str:
+        """Resumable upload of the JSONL input; returns the file resource name."""
+        size = path.stat().st_size
+        start = self.http.post(f"{self.base}/upload/v1beta/files", timeout=TIMEOUT, headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": "application/jsonl",
+        }, json={"file": {"display_name": path.name}})
+        start.raise_for_status()
+        url = start.headers["X-Goog-Upload-URL"]
+        with path.open("rb") as f:
+            done = self.http.post(url, data=f, timeout=TIMEOUT, headers={
+                "Content-Length": str(size),
+                "X-Goog-Upload-Offset": "0",
+                "X-Goog-Upload-Command": "upload, finalize",
+            })
+        done.raise_for_status()
+        return done.json()["file"]["name"]
+
+    def create(self, file_name: str, display_name: str) -> str:
+        r = self.http.post(f"{self.base}/v1beta/models/{self.model}:batchGenerateContent", timeout=TIMEOUT,
+                           json={"batch": {"display_name": display_name,
+                                           "input_config": {"file_name": file_name}}})
+        r.raise_for_status()
+        return r.json()["name"]
+
+    def get(self, job: str) -> dict:
+        r = self.http.get(f"{self.base}/v1beta/{job}", timeout=TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    def wait(self, job: str, every: float = POLL_SECONDS) -> dict:
+        while True:
+            op = self.get(job)
+            state = _state(op)
+            if state in DONE_STATES:
+                return op
+            print(f"[batch] {job}: {state} … next check in {every:.0f}s")
+            time.sleep(every)
+
+    def download(self, op: dict) -> Dict[str, Tuple[str | None, str]]:
+        """{key: (text|None, err)} from a finished job's responses file."""
+        if _state(op) != "BATCH_STATE_SUCCEEDED":
+            raise RuntimeError(f"batch ended in {_state(op)}: {op.get('error')}")
+        out_file = (op.get("response", {}).get("responsesFile")
+                    or op.get("metadata", {}).get("output", {}).get("responsesFile"))
+        r = self.http.get(f"{self.base}/download/v1beta/{out_file}:download",
+                          params={"alt": "media"}, timeout=TIMEOUT)
+        r.raise_for_status()
+
+        results: Dict[str, Tuple[str | None, str]] = {}
+        for line in r.text.splitlines():
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            results[rec["key"]] = _answer(rec)
+        return results
+
+    # ─── all together ─── #
+    def run(self, reqs: Dict[str, dict], jsonl_path: Path, display_name: str,
+            every: float = POLL_SECONDS) -> Dict[str, Tuple[str | None, str]]:
+        job_path = jsonl_path.with_name(jsonl_path.name + ".job")
+        job = job_path.read_text(encoding="utf-8").strip() if job_path.exists() else ""
+        if job:
+            print(f"[batch] resuming {job}")
+        else:
+            self.write_jsonl(reqs, jsonl_path)
+            job = self.create(self.upload(jsonl_path), display_name)
+            job_path.write_text(job, encoding="utf-8")
+            print(f"[batch] submitted {len(reqs)} request(s) as {job}")
+
+        results = self.download(self.wait(job, every))
+        if job_path not in self.downloaded:
+            self.downloaded.append(job_path)
+        return results
+
+    def done(self, jsonl_path: Path | None = None) -> None:
+        """
+        Forget the job behind *jsonl_path* (all downloaded jobs when None)
+        once its results are saved; the next run then submits afresh.
+        """
+        paths = ([jsonl_path.with_name(jsonl_path.name + ".job")] if jsonl_path is not None
+                 else list(self.downloaded))
+        for job_path in paths:
+            job_path.unlink(missing_ok=True)
+            if job_path in self.downloaded:
+                self.downloaded.remove(job_path)
+
+
+def _state(op: dict) -> str:
+    return op.get("metadata", {}).get("state") or op.get("state", "")
+
+def _answer(rec: dict) -> Tuple[str | None, str]:
+    if "error" in rec:
+        return None, f"ERROR {rec['error'].get('message', rec['error'])}"
+    cands = rec.get("response", {}).get("candidates") or []
+    if not cands:
+        return None, "SAFETY_BLOCK"
+    parts = cands[0].get("content", {}).get("parts") or []
+    if not parts:
+        return None, "EMPTY_PARTS"
+    return "".join(p.get("text", "") for p in parts).strip(), ""
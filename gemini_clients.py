@@ -0,0 +1,129 @@
+"""
+Long-lived Gemini clients: one per API key, and one reusable GenerativeModel
+per (key, model, system instruction), instead of genai.configure() and a new
+GenerativeModel on every attempt.
+
+    POOL  = get_pool()
+    model = POOL.model(slot.combo["key"], slot.combo["model"], SYSTEM_TEMPLATE)
+    resp  = model.generate_content(prompt)
+    ...
+    except Exception as e:
+        POOL.failed(slot.combo["key"], slot.combo["model"], SYSTEM_TEMPLATE, e)
+
+genai.configure() swaps the process-global clients, so rotating keys with
+it before each request races as soon as two workers are routed to
+different keys.  Here every key has its own client manager and each model
+is bound to its key's client, so nothing global changes per call and
+models can be shared between threads and asyncio tasks.  Static system
+instructions go through context_cache.ContextCache; its few create /
+refresh / delete calls are the only ones still made on the global client,
+one at a time.
+
+GEMINI_API_BASE (a stand-in server such as Test/mock_llm_server.py) makes
+every client use the REST transport against that address.
+
+Per-key clients rely on google-generativeai 0.8 internals (_ClientManager
+and GenerativeModel._client; the version is pinned in requirements.txt).
+On an SDK without them the pool falls back to the old behaviour:
+genai.configure() for the key, then a fresh model for every call.
+"""
+from __future__ import annotations
+
+import os, threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from context_cache import ContextCache
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+API_BASE = os.getenv("GEMINI_API_BASE", "")          # empty → Google's endpoint, default transport
+PER_KEY  = hasattr(genai_client, "_ClientManager")   # False → global genai.configure() per call
+
+
+def client_options() -> dict:
+    """transport / client_options every client is built with, besides its key."""
+    return {"transport": "rest", "client_options": {"api_endpoint": API_BASE}} if API_BASE else {}
+
+
+class ClientPool:
+    """Thread-safe store of per-key clients and ready-to-use models."""
+
+    def __init__(self):
+        self._managers: Dict[str, genai_client._ClientManager] = {}
+        self._models:   Dict[Tuple[str, str, str], Tuple[str, genai.GenerativeModel]] = {}
+        self._contexts: Dict[str, ContextCache] = {}
+        self._lock     = threading.Lock()
+        self._sdk_lock = threading.Lock()
+
+    def client(self, key: str):
+        """The GenerativeServiceClient for *key*, created on first use."""
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is None:
+                manager = self._managers[key] = genai_client._ClientManager()
+                manager.configure(api_key=key, **client_options())
+            return manager.get_default_client("generative")
+
+    def model(self, key: str, model: str, system: str = "") -> genai.GenerativeModel:
+        """
+        The model for (*key*, *model*, *system*).  *system* rides on a
+        context cache when it is long enough, else it is sent inline.
+        """
+        if not PER_KEY:
+            return self._global_model(key, model, system)
+        cached = self._context(system).cached(key, model) if system else None
+        name   = cached.name if cached is not None else ""
+        with self._lock:
+            entry = self._models.get((key, model, system))
+        if entry is not None and entry[0] == name:
+            return entry[1]
+
+        gm = (genai.GenerativeModel.from_cached_content(cached) if cached is not None
+              else genai.GenerativeModel(model_name=model, system_instruction=system or None))
+        if not hasattr(gm, "_client"):
+            return self._global_model(key, model, system)
+        gm._client = self.client(key)                 # not the default client genai.configure() sets
+        with self._lock:
+            self._models[(key, model, system)] = (name, gm)
+        return gm
+
+    def failed(self, key: str, model: str, system: str, exc: Exception) -> None:
+        """Report a failed call, so a context cache that expired under it is recreated."""
+        if system:
+            self._context(system).failed(key, model, exc)
+
+    # ── internals ─────────────────────────────────────────────────────── #
+    def _global_model(self, key: str, model: str, system: str) -> genai.GenerativeModel:
+        """Fallback for SDKs without per-key clients: point the global client at *key*."""
+        with self._sdk_lock:
+            genai.configure(api_key=key, **client_options())
+            return genai.GenerativeModel(model_name=model, system_instruction=system or None)
+
+    def _context(self, system: str) -> ContextCache:
+        with self._lock:
+            ctx = self._contexts.get(system)
+            if ctx is None:
+                ctx = self._contexts[system] = ContextCache(system, session=self._configured)
+            return ctx
+
+    @contextmanager
+    def _configured(self, key: str) -> Iterator[None]:
+        """Cached-content calls only exist on the global client: point it at *key* meanwhile."""
+        with self._sdk_lock:
+            genai.configure(api_key=key, **client_options())
+            yield
+
+
+_shared: ClientPool | None = None
+_shared_lock = threading.Lock()
+
+def get_pool() -> ClientPool:
+    """Process-wide pool shared by every script module."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ClientPool()
+        return _shared
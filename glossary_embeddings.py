@@ -0,0 +1,116 @@
+"""
+Precomputed glossary embeddings for semantic glossary lookup.
+
+    index = load_glossary_embeddings(Path("refining_glossary.json"), entries, encoder, "all-MiniLM-L6-v2")
+    hits  = index.search(encoder.encode(chunks), k=8, threshold=0.45)   # per chunk: [(entry, score), …]
+
+The entries are embedded once and saved next to the glossary as
+<name>.embindex.npz, together with a content hash per entry.  The file
+holds one L2-normalised float32 row per entry plus the entry list.  A
+rerun embeds only new or changed entries; a different encoder rebuilds
+the whole file.  A lookup is one matrix product plus argpartition, so its
+cost per chunk barely grows with the glossary.
+
+*encoder* is anything with encode(list[str], batch_size=int) -> 2-D
+array, such as sentence_transformers.SentenceTransformer.  numpy is needed here; callers
+treat both as optional.
+"""
+from __future__ import annotations
+
+import hashlib, os
+from pathlib import Path
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+INDEX_VERSION = 1
+INDEX_SUFFIX  = ".embindex.npz"     # refining_glossary.json → refining_glossary.embindex.npz
+BATCH_SIZE    = 64
+
+
+def entry_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:20]
+
+def _normalise(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms == 0, 1, norms)
+
+
+# ─── Index ───────────────────────────────────────────────────────────── #
+class GlossaryEmbeddings:
+    """Entry texts and their unit-length embedding rows; cosine similarity is a dot product."""
+
+    def __init__(self, texts: List[str], vectors: np.ndarray):
+        self.texts   = texts
+        self.vectors = vectors
+
+    def search(self, queries: np.ndarray, k: int | None = None,
+               threshold: float = -1.0) -> List[List[Tuple[str, float]]]:
+        """
+        Per query row, the best *k* entries (all when None) scoring at
+        least *threshold*, best first.  A 1-D *queries* is one query.
+        """
+        q = np.asarray(queries, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        if not self.texts:
+            return [[] for _ in range(len(q))]
+        scores = _normalise(q) @ self.vectors.T          # (queries, entries)
+
+        out = []
+        for row in scores:
+            idx = np.flatnonzero(row >= threshold)
+            if k is not None and len(idx) > k:
+                idx = idx[np.argpartition(-row[idx], k - 1)[:k]]
+            idx = idx[np.argsort(-row[idx], kind="stable")]
+            out.append([(self.texts[i], float(row[i])) for i in idx])
+        return out
+
+
+# ─── Persistence ─────────────────────────────────────────────────────── #
+def embeddings_path_for(glossary_path: Path) -> Path:
+    glossary_path = Path(glossary_path)
+    return glossary_path.with_name(glossary_path.stem + INDEX_SUFFIX)
+
+def _load(path: Path, model_name: str) -> dict:
+    """hash → row of a saved index made by *model_name*; {} when absent / stale / unreadable."""
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"]) != INDEX_VERSION or str(z["model"]) != model_name:
+                return {}
+            return dict(zip(z["hashes"].tolist(), z["vectors"]))
+    except Exception:
+        return {}
+
+def _save(path: Path, model_name: str, texts: Sequence[str], hashes: Sequence[str], vectors: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, version=INDEX_VERSION, model=model_name, texts=np.array(texts, dtype=str),
+                     hashes=np.array(hashes, dtype=str), vectors=vectors)
+        os.replace(tmp, path)
+    except OSError:
+        pass                                    # read-only dir: just use the in-memory copy
+
+def load_glossary_embeddings(glossary_path: Path, entries: Iterable[str], encoder,
+                             model_name: str) -> GlossaryEmbeddings:
+    """
+    Embedding index over *entries* (the texts to match against, e.g.
+    "Characters: Bell Cranel"), reusing every row of the saved index whose
+    entry is unchanged and embedding only the rest.
+    """
+    path   = embeddings_path_for(glossary_path)
+    texts  = list(dict.fromkeys(t for t in entries if t))
+    hashes = [entry_hash(t) for t in texts]
+    rows   = _load(path, model_name) if path.exists() else {}
+
+    missing = [t for t, h in zip(texts, hashes) if h not in rows]
+    if missing:
+        new = np.asarray(encoder.encode(missing, batch_size=BATCH_SIZE), dtype=np.float32)
+        rows.update(zip(map(entry_hash, missing), _normalise(new)))
+
+    vectors = (np.stack([rows[h] for h in hashes]) if texts else np.zeros((0, 0), dtype=np.float32))
+    if missing or len(rows) != len(hashes):     # new rows, or rows for entries that are gone
+        _save(path, model_name, texts, hashes, vectors)
+    return GlossaryEmbeddings(texts, vectors)
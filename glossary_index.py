@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import hashlib, json, pickle
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+INDEX_VERSION = 1
+INDEX_SUFFIX  = ".acindex"          # Glossary.json → Glossary.acindex
+
+
+# ─── Aho-Corasick automaton ──────────────────────────────────────────── #
+class GlossaryIndex:
+    """
+    Aho-Corasick automaton over the glossary keys.
+
+    Built once per glossary load; every chunk is then scanned in a single
+    linear pass, regardless of how many thousand terms the glossary holds.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys: List[str] = sorted({k for k in keys if k})
+        self.digest = keys_digest(self.keys)
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int]            = [0]
+        self._out:  List[int]            = [-1]   # key id ending exactly here
+        self._link: List[int]            = [0]    # next node on fail chain with output
+
+        for kid, key in enumerate(self.keys):
+            node = 0
+            for ch in key:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(-1)
+                    self._link.append(0)
+                node = nxt
+            self._out[node] = kid
+
+        # breadth-first pass to wire failure + dictionary-suffix links
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                fl = self._fail[nxt]
+                self._link[nxt] = fl if self._out[fl] != -1 else self._link[fl]
+                queue.append(nxt)
+
+    def iter_hits(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yield every (start, end, key) occurrence in *text*, overlaps included."""
+        goto, fail, out, link, keys = self._goto, self._fail, self._out, self._link, self.keys
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] != -1 else link[node]
+            while hit:
+                key = keys[out[hit]]
+                yield i + 1 - len(key), i + 1, key
+                hit = link[hit]
+
+    def matches(self, text: str) -> List[str]:
+        """
+        Keys present in *text*, in order of first appearance.
+
+        An occurrence that sits entirely inside the span of a longer hit
+        (e.g. 「ベル」 inside 「ベル・クラネル」) is dropped; the same key
+        found on its own elsewhere in the text is still kept.
+        """
+        hits = sorted(self.iter_hits(text), key=lambda h: (h[0], -h[1]))
+        chosen: Dict[str, None] = {}
+        max_end = -1
+        for start, end, key in hits:
+            if end > max_end:
+                chosen.setdefault(key, None)
+                max_end = end
+        return list(chosen)
+
+    def filter(self, text: str, glossary: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Glossary subset relevant to *text* (drop-in for the old filter_glossary)."""
+        return {k: glossary[k] for k in self.matches(text) if k in glossary}
+
+
+# ─── Persistence ─────────────────────────────────────────────────────── #
+def keys_digest(keys: Iterable[str]) -> str:
+    """Content hash of the key set; the automaton only depends on the keys."""
+    h = hashlib.sha256()
+    for k in sorted(set(keys)):
+        h.update(k.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def index_path_for(glossary_path: Path) -> Path:
+    glossary_path = Path(glossary_path)
+    return glossary_path.with_name(glossary_path.stem + INDEX_SUFFIX)
+
+def load_glossary_index(glossary_path: Path,
+                        glossary: Dict[str, List[str]] | None = None) -> GlossaryIndex:
+    """
+    Return the automaton for *glossary_path*, reusing the cached copy next to
+    the glossary when its key set is unchanged, rebuilding (and re-caching)
+    otherwise.  Pass *glossary* if it is already loaded to skip a re-read.
+    """
+    glossary_path = Path(glossary_path)
+    if glossary is None:
+        with glossary_path.open(encoding="utf-8") as f:
+            glossary = json.load(f)
+
+    digest = keys_digest(k for k in glossary if k)
+    cache  = index_path_for(glossary_path)
+
+    if cache.exists():
+        try:
+            with cache.open("rb") as f:
+                version, cached_digest, index = pickle.load(f)
+            if version == INDEX_VERSION and cached_digest == digest:
+                return index
+        except Exception:
+            pass                                # stale / corrupt → rebuild
+
+    index = GlossaryIndex(glossary.keys())
+    try:
+        tmp = cache.with_suffix(cache.suffix + ".tmp")
+        with tmp.open("wb") as f:
+            pickle.dump((INDEX_VERSION, digest, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(cache)
+    except OSError:
+        pass                                    # read-only dir: just use in-memory copy
+    return index
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Set
+
+
+class GlossaryValidator:
+    """
+    Checks a translation against glossary terms with one precompiled regex.
+
+    Every English rendering in the glossary goes into a single case-insensitive
+    alternation (folded into a prefix trie so the regex engine does not try
+    thousands of branches per offset), wrapped in a look-ahead so that
+    overlapping renderings are all seen.  A response is scanned once; each
+    term's variant group is then resolved against the renderings found.
+    """
+
+    def __init__(self, glossary: Dict[str, Iterable[str]]):
+        variants = {v.lower() for vs in glossary.values() for v in _as_list(vs) if v}
+        self._variants: Set[str] = variants
+        self._contained: Dict[str, Set[str]] = {}
+        self._pattern = re.compile(f"(?=({_trie_pattern(variants)}))", re.I) if variants else None
+
+    def found(self, text: str) -> Set[str]:
+        """Lower-cased glossary renderings present anywhere in *text*."""
+        if self._pattern is None:
+            return set()
+        present: Set[str] = set()
+        for m in self._pattern.finditer(text):
+            present |= self._renderings_in(m.group(1).lower())
+        return present
+
+    def missing(self, text: str, terms: Dict[str, Iterable[str]]) -> List[str]:
+        """Keys of *terms* none of whose English variants appear in *text*."""
+        present = self.found(text)
+        lowered = None
+        miss = []
+        for term, variants in terms.items():
+            ok = False
+            for v in _as_list(variants):
+                v = v.lower()
+                if v in self._variants:
+                    ok = v in present
+                else:                           # rendering not seen at build time
+                    lowered = text.lower() if lowered is None else lowered
+                    ok = v in lowered
+                if ok:
+                    break
+            if not ok:
+                miss.append(term)
+        return miss
+
+    def _renderings_in(self, match: str) -> Set[str]:
+        # the look-ahead only reports the longest rendering at each offset, so
+        # shorter ones it contains ("Bell" in "Bell Cranel") are filled in here
+        hit = self._contained.get(match)
+        if hit is None:
+            hit = {v for v in self._variants if v in match}
+            self._contained[match] = hit
+        return hit
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex matching the longest of *words* at a position, built as a prefix trie."""
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:                                 # a word stops here; longer ones preferred
+            return f"(?:{body})?" if len(branches) == 1 else body + "?"
+        return body
+
+    return build(trie)
+
+
+def _as_list(v) -> List[str]:
+    return [v] if isinstance(v, str) else list(v)
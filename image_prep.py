@@ -0,0 +1,87 @@
+"""
+Upload-ready derivatives of the 600-dpi page scans: grayscale, contrast
+stretched, capped in resolution and recompressed as WebP or JPEG.
+
+Derivatives are named after the source's content hash, so a page is
+converted once no matter how many scripts (OCR, glossary, classification)
+send it, and a re-rendered page gets a fresh derivative automatically.
+
+    python image_prep.py Input/Danmachi_vol20/Images      # prebuild all
+"""
+from __future__ import annotations
+
+import argparse, hashlib, io, mimetypes, os, threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List
+
+from PIL import Image, ImageOps
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", ".image_cache"))
+MAX_SIDE  = int(os.getenv("IMAGE_MAX_SIDE", "2304"))     # 3 Gemini 768-px tiles on the long side
+FORMAT    = os.getenv("IMAGE_FORMAT", "webp").lower()     # webp | jpeg
+QUALITY   = int(os.getenv("IMAGE_QUALITY", "85"))
+VERSION   = 1                                             # bump when the pipeline below changes
+
+mimetypes.add_type("image/webp", ".webp")                 # missing from older mimetypes tables
+
+
+@dataclass(frozen=True)
+class Prepared:
+    path: Path          # the derivative on disk
+    mime: str
+    source_hash: str    # sha256 of the original scan
+
+    def part(self) -> dict:
+        """Inline image part for GenerativeModel.generate_content()."""
+        return {"mime_type": self.mime, "data": self.path.read_bytes()}
+
+
+def _derivative_name(source_hash: str) -> str:
+    ext = "jpg" if FORMAT in ("jpg", "jpeg") else "webp"
+    return f"{source_hash[:32]}-v{VERSION}-{MAX_SIDE}-q{QUALITY}.{ext}"
+
+def prepare(src: Path | str) -> Prepared:
+    """Derivative of *src*, built on first use and served from CACHE_DIR afterwards."""
+    data = Path(src).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    out = CACHE_DIR / _derivative_name(digest)
+    mime = mimetypes.guess_type(out.name)[0]
+    if out.exists():
+        return Prepared(out, mime, digest)
+
+    with Image.open(io.BytesIO(data)) as im:
+        im = ImageOps.autocontrast(im.convert("L"), cutoff=1)   # text pages: ink vs paper
+        im.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)       # only ever shrinks
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_name(out.name + f".{os.getpid()}-{threading.get_ident()}.tmp")   # per thread
+        if out.suffix == ".jpg":
+            im.save(tmp, "JPEG", quality=QUALITY, optimize=True)
+        else:
+            im.save(tmp, "WEBP", quality=QUALITY, method=4)
+    os.replace(tmp, out)                                        # concurrent builders just race to the same bytes
+    return Prepared(out, mime, digest)
+
+
+def prepare_all(paths: Iterable[Path], workers: int | None = None) -> List[Prepared]:
+    """prepare() over many pages in a process pool (decode/resize is CPU-bound)."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(prepare, paths, chunksize=4))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Prebuild upload derivatives for page images.")
+    ap.add_argument("images_dir", type=Path)
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    paths = sorted(args.images_dir.glob("page_*.png"))
+    before = sum(p.stat().st_size for p in paths)
+    done = prepare_all(paths, args.workers)
+    after = sum(p.path.stat().st_size for p in done)
+    print(f"{len(done)} page(s): {before / 2**20:.1f} MB → {after / 2**20:.1f} MB in {CACHE_DIR}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Local text / illustration classifier for page scans, from plain image
+statistics — no API call, a few hundred pages in seconds.
+
+    python page_classifier.py Input/Danmachi_vol20/Images Processing_Files/Danmachi_vol20/Type.json
+
+Features (on a ~1000 px grayscale copy):
+  ink / midtone / paper shares of the histogram — print is ink on paper,
+      drawings carry large dark areas and screentone greys;
+  colour share — any real colour means a colour insert;
+  column / row banding — lines of text alternate ink and gutter along the
+      reading axis, many times across the page;
+  edge orientation — CJK glyph strokes are mostly horizontal / vertical,
+      drawn lines run at every angle (straightness = diagonal-kernel over
+      axis-kernel Sobel energy: 1.5 for purely axis-aligned edges, ~1 for
+      edges at random angles).
+Pages that match neither profile cleanly come back with confident=False,
+and the callers leave those to the vision model.
+"""
+from __future__ import annotations
+
+import argparse, json, logging, os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from PIL import Image, ImageFilter, ImageStat
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+WORK_SIDE      = 1000     # long side the statistics are taken at
+INK_LEVEL      = 96       # grey ≤ this counts as ink
+PAPER_LEVEL    = 200      # grey ≥ this counts as paper
+BLANK_INK      = 0.0003   # less ink than this: blank page (a chapter title is ~0.001)
+MIN_BANDS      = 40       # ink/gutter alternations that make a text block (~20 lines)
+TEXT_STRAIGHT  = 1.15     # straightness printed glyphs reach; drawings stay near 1
+MAX_TEXT_MID   = 0.12     # screentone / shading share a text page never reaches
+MAX_TEXT_INK   = 0.25
+COLOUR_SHARE   = 0.05     # share of saturated pixels that makes a colour page
+
+_K = lambda *w: ImageFilter.Kernel((3, 3), w, scale=1)
+SOBEL = {
+    "x":  (_K(-1, 0, 1, -2, 0, 2, -1, 0, 1),  _K(1, 0, -1, 2, 0, -2, 1, 0, -1)),
+    "y":  (_K(-1, -2, -1, 0, 0, 0, 1, 2, 1),  _K(1, 2, 1, 0, 0, 0, -1, -2, -1)),
+    "d1": (_K(0, 1, 2, -1, 0, 1, -2, -1, 0),  _K(0, -1, -2, 1, 0, -1, 2, 1, 0)),
+    "d2": (_K(-2, -1, 0, -1, 0, 1, 0, 1, 2),  _K(2, 1, 0, 1, 0, -1, 0, -1, -2)),
+}
+
+
+@dataclass
+class PageClass:
+    contains_text: bool
+    contains_illustration: bool
+    confident: bool
+    features: Dict[str, float] = field(default_factory=dict)
+
+
+# ─── Features ────────────────────────────────────────────────────────── #
+def _load(path: Path) -> Image.Image:
+    im = Image.open(path)
+    im.draft("RGB", (WORK_SIDE, WORK_SIDE))             # JPEG: decode at reduced size
+    if im.mode == "1" or im.mode.startswith("I"):
+        im = im.convert("L")                            # reduce() has no 1-bit / 16-bit path
+    elif im.mode not in ("L", "RGB"):
+        im = im.convert("RGB")                          # palette, alpha, CMYK …
+    factor = max(1, max(im.size) // WORK_SIDE)
+    im = im.reduce(factor) if factor > 1 else im.copy()
+    return im
+
+def _bands(profile: List[int]) -> int:
+    """Ink/gutter alternations along a projection profile (a text block has many)."""
+    lo, hi = min(profile), max(profile)
+    if hi - lo < 8:
+        return 0
+    cut, state, flips = (lo + hi) / 2, None, 0
+    for v in profile:
+        inky = v < cut                                   # darker than midway = ink column
+        if state is not None and inky != state:
+            flips += 1
+        state = inky
+    return flips
+
+def _energy(g: Image.Image, axis: str) -> float:
+    pos, neg = SOBEL[axis]
+    return ImageStat.Stat(g.filter(pos)).mean[0] + ImageStat.Stat(g.filter(neg)).mean[0]
+
+def features(path: Path) -> Dict[str, float]:
+    im = _load(path)
+    g = im.convert("L")
+    n = g.width * g.height
+    hist = g.histogram()
+    ink   = sum(hist[:INK_LEVEL + 1]) / n
+    paper = sum(hist[PAPER_LEVEL:]) / n
+
+    colour = 0.0
+    if im.mode not in ("L", "1", "LA", "I", "I;16"):
+        sat = im.convert("RGB").convert("HSV").getchannel("S").histogram()
+        colour = sum(sat[64:]) / n
+
+    # projection profiles over the middle of the page (margins and page numbers excluded)
+    box = (g.width // 10, g.height // 10, g.width * 9 // 10, g.height * 9 // 10)
+    core = g.crop(box)
+    cols = list(core.resize((core.width, 1), Image.BOX).tobytes())
+    rows = list(core.resize((1, core.height), Image.BOX).tobytes())
+
+    axis = _energy(g, "x") + _energy(g, "y")
+    diag = _energy(g, "d1") + _energy(g, "d2")
+    return {
+        "ink": round(ink, 4), "mid": round(1 - ink - paper, 4), "colour": round(colour, 4),
+        "bands": max(_bands(cols), _bands(rows)),
+        "straightness": round(diag / axis, 3) if axis else 0.0,
+    }
+
+
+# ─── Decision ────────────────────────────────────────────────────────── #
+def classify(path: Path | str) -> PageClass:
+    try:
+        f = features(Path(path))
+    except Exception as e:                              # unreadable page: leave it to the vision model
+        logging.warning(f"classify {path}: {e}")
+        return PageClass(True, True, False, {})
+    if f["ink"] < BLANK_INK and f["mid"] < BLANK_INK:
+        return PageClass(False, False, True, f)
+
+    texty   = f["bands"] >= MIN_BANDS and f["straightness"] >= TEXT_STRAIGHT
+    pictury = f["colour"] >= COLOUR_SHARE or f["mid"] > MAX_TEXT_MID or f["ink"] > MAX_TEXT_INK
+
+    if texty and not pictury:
+        return PageClass(True, False, True, f)
+    if pictury and not texty and f["straightness"] < TEXT_STRAIGHT:
+        return PageClass(False, True, True, f)
+    # mixed signals: text over artwork, a caption, a chapter title page …
+    return PageClass(texty, pictury, False, f)
+
+def classify_all(paths: Iterable[Path], workers: int | None = None) -> List[PageClass]:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(classify, paths, chunksize=4))
+
+
+def fill_type(type_path: Path, images_dir: Path, workers: int | None = None) -> Dict[str, int]:
+    """
+    Set contains_text / contains_illustration in Type.json for every page
+    image; pages already transcribed keep the flags the OCR pass gave them.
+    """
+    pages = json.loads(type_path.read_text(encoding="utf-8")) if type_path.exists() else []
+    by_page = {p["page_no"]: p for p in pages}
+    paths = sorted(images_dir.glob("page_*.png"))
+    counts = {"text": 0, "illustration": 0, "blank": 0, "uncertain": 0, "kept": 0}
+    for path, pc in zip(paths, classify_all(paths, workers)):
+        page_no = path.stem.split("_")[1]
+        rec = by_page.setdefault(page_no, {"page_no": page_no})
+        if rec.get("rawtext"):
+            counts["kept"] += 1
+            continue
+        rec["contains_text"] = pc.contains_text
+        rec["contains_illustration"] = pc.contains_illustration
+        if not pc.confident:
+            rec["needs_ocr"] = True                      # vision model decides on the OCR pass
+            counts["uncertain"] += 1
+        else:
+            rec.pop("needs_ocr", None)
+            counts["text" if pc.contains_text else "illustration" if pc.contains_illustration else "blank"] += 1
+
+    out = sorted(by_page.values(), key=lambda d: int(d["page_no"]))
+    tmp = type_path.with_name(type_path.name + ".tmp")
+    type_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, type_path)
+    return counts
+
+def needs_vision(rec: dict) -> bool:
+    """False for pages the classifier settled as pure illustration or blank."""
+    if rec.get("needs_ocr") or "contains_text" not in rec:
+        return True
+    return bool(rec.get("contains_text"))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Classify page images as text / illustration locally.")
+    ap.add_argument("images_dir", type=Path)
+    ap.add_argument("type_json", type=Path, nargs="?")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--show", action="store_true", help="print per-page features instead of writing")
+    args = ap.parse_args()
+
+    if args.show or not args.type_json:
+        paths = sorted(args.images_dir.glob("page_*.png"))
+        for path, pc in zip(paths, classify_all(paths, args.workers)):
+            print(path.name, json.dumps(asdict(pc)))
+        return
+    counts = fill_type(args.type_json, args.images_dir, args.workers)
+    print(f"✓ {args.type_json}: " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import json, os, threading, time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple
+
+try:
+    from zoneinfo import ZoneInfo
+    PACIFIC = ZoneInfo("America/Los_Angeles")         # Gemini daily quotas reset at midnight PT
+except Exception:                                     # no tz database (e.g. Windows without tzdata)
+    PACIFIC = timezone(timedelta(hours=-8))
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+@dataclass(frozen=True)
+class Limits:
+    rpm: int            # requests per minute
+    tpm: int            # tokens per minute (input + output)
+    rpd: int            # requests per day
+
+# free-tier numbers; override with GEMINI_LIMITS='{"model": [rpm, tpm, rpd], ...}'
+DEFAULT_LIMITS: Dict[str, Limits] = {
+    "gemini-2.5-pro":                 Limits(rpm=5,  tpm=250_000,   rpd=100),
+    "gemini-2.5-flash-preview-05-20": Limits(rpm=10, tpm=250_000,   rpd=500),
+    "gemini-2.0-flash":               Limits(rpm=15, tpm=1_000_000, rpd=1_500),
+}
+FALLBACK_LIMITS = Limits(rpm=5, tpm=250_000, rpd=100)
+DEFAULT_LIMITS.update({m: Limits(*v) for m, v in json.loads(os.getenv("GEMINI_LIMITS", "{}")).items()})
+
+MAX_WAIT      = 120     # seconds acquire() will block before reporting every combo exhausted
+COOLDOWN_BASE = 30      # first back-off after an unexpected 429; doubles while they keep coming
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-ish estimate: ~1 token per CJK char, ~3 bytes per token otherwise."""
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+# ─── Buckets ─────────────────────────────────────────────────────────── #
+class TokenBucket:
+    """Classic token bucket: *capacity* tokens, refilled continuously over *period* seconds."""
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate     = capacity / period
+        self.tokens   = float(capacity)
+        self.updated  = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, n: float) -> float:
+        self._refill()
+        n = min(n, self.capacity)
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def take(self, n: float) -> None:
+        self._refill()
+        self.tokens -= min(n, self.capacity)
+
+    def refund(self, n: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + n)
+
+
+class DailyWindow:
+    """Requests-per-day counter that resets at the next Pacific midnight, like the API does."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used  = 0
+        self.resets_at = _next_midnight()
+
+    def wait_for(self, n: int = 1) -> float:
+        now = datetime.now(PACIFIC)
+        if now >= self.resets_at:
+            self.used, self.resets_at = 0, _next_midnight()
+        return 0.0 if self.used + n <= self.limit else (self.resets_at - now).total_seconds()
+
+    def take(self, n: int = 1) -> None:
+        self.used += n
+
+def _next_midnight() -> datetime:
+    now = datetime.now(PACIFIC)
+    return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class ComboBudget:
+    def __init__(self, combo: dict, limits: Limits):
+        self.combo  = combo
+        self.limits = limits
+        self.rpm = TokenBucket(limits.rpm, 60)
+        self.tpm = TokenBucket(limits.tpm, 60)
+        self.rpd = DailyWindow(limits.rpd)
+        self.cooldown_until = 0.0
+        self.strikes = 0
+
+    def wait_for(self, tokens: int) -> float:
+        return max(self.cooldown_until - time.monotonic(),
+                   self.rpm.wait_for(1), self.tpm.wait_for(tokens), self.rpd.wait_for(1), 0.0)
+
+    def take(self, tokens: int) -> None:
+        self.rpm.take(1); self.tpm.take(tokens); self.rpd.take(1)
+
+
+class Slot(NamedTuple):
+    idx:    int
+    combo:  dict
+    tokens: int         # tokens reserved; settled against real usage in record()
+
+
+# ─── Scheduler ───────────────────────────────────────────────────────── #
+class QuotaScheduler:
+    """
+    Routes each request to a (key, model) combo that still has RPM/TPM/RPD
+    headroom, before the API has to answer 429.
+
+    Combos are tried in list order, so the primary key is used whenever its
+    buckets allow and the scheduler drifts back to it as soon as they refill.
+    acquire() blocks (up to *max_wait*) when every combo is momentarily out
+    of budget.  Thread-safe; one instance is shared by all workers.
+    """
+
+    def __init__(self, combos: List[dict], limits: Dict[str, Limits] | None = None,
+                 max_wait: float = MAX_WAIT):
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.budgets  = [ComboBudget(c, limits.get(c["model"], FALLBACK_LIMITS)) for c in combos]
+        self.max_wait = max_wait
+        self._cond    = threading.Condition()
+
+    def acquire(self, tokens: int) -> Slot | None:
+        """Reserve one request + *tokens* on the best combo; None if all are exhausted."""
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while True:
+                waits = []
+                for i, b in enumerate(self.budgets):
+                    w = b.wait_for(tokens)
+                    if w <= 0:
+                        b.take(tokens)
+                        return Slot(i, b.combo, tokens)
+                    waits.append(w)
+                w = min(waits)
+                if time.monotonic() + w > deadline:
+                    return None
+                self._cond.wait(w)
+
+    def record(self, slot: Slot, used_tokens: int | None) -> None:
+        """Settle the reservation against the usage the API reported, and clear back-off."""
+        with self._cond:
+            b = self.budgets[slot.idx]
+            b.strikes = 0
+            if used_tokens is not None:
+                diff = slot.tokens - used_tokens
+                if diff > 0: b.tpm.refund(diff)
+                else:        b.tpm.take(-diff)
+            self._cond.notify_all()
+
+    def penalize(self, slot: Slot) -> None:
+        """The API said 429 anyway: rest this combo, backing off exponentially."""
+        with self._cond:
+            b = self.budgets[slot.idx]
+            b.cooldown_until = time.monotonic() + COOLDOWN_BASE * 2 ** b.strikes
+            b.strikes += 1
+            self._cond.notify_all()
+
+    def state(self) -> List[dict]:
+        """Current headroom per combo (for logs / progress output)."""
+        with self._cond:
+            out = []
+            for b in self.budgets:
+                b.rpm._refill(); b.tpm._refill(); b.rpd.wait_for(0)
+                out.append({
+                    "tag":        b.combo.get("tag", ""),
+                    "model":      b.combo["model"],
+                    "rpm_left":   int(b.rpm.tokens),
+                    "tpm_left":   int(b.tpm.tokens),
+                    "rpd_left":   b.limits.rpd - b.rpd.used,
+                    "cooldown_s": round(max(0.0, b.cooldown_until - time.monotonic()), 1),
+                })
+            return out
+
+    def summary(self) -> str:
+        return "\n".join(f"[quota] {s['tag'] or '#'+str(i)} {s['model']}: "
+                         f"{s['rpm_left']} rpm, {s['tpm_left']} tpm, {s['rpd_left']} rpd left"
+                         + (f", cooling {s['cooldown_s']}s" if s["cooldown_s"] else "")
+                         for i, s in enumerate(self.state()))
+
+
+def usage_tokens(resp) -> int | None:
+    """Total tokens a google.generativeai response reports, if any."""
+    meta = getattr(resp, "usage_metadata", None)
+    return getattr(meta, "total_token_count", None) or None
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import hashlib, json, os, sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Iterable
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"))
+CACHE_MODE = os.getenv("LLM_CACHE", "on").lower()     # on | off | refresh (skip reads, still write)
+CACHE_MB   = float(os.getenv("LLM_CACHE_MB", "512"))  # LRU bound on stored response text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key       TEXT PRIMARY KEY,
+    response  TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used);
+"""
+
+
+def cache_key(model: str, system: str | None, prompt: Any,
+              images: Iterable[Path | bytes] = (), config: dict | None = None) -> str:
+    """Content hash of everything that determines a model's answer."""
+    h = hashlib.sha256()
+    for part in (model, system or "", json.dumps(prompt, ensure_ascii=False, sort_keys=True),
+                 json.dumps(config or {}, sort_keys=True)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    for img in images:
+        data = img if isinstance(img, bytes) else Path(img).read_bytes()
+        h.update(hashlib.sha256(data).digest())
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of LLM responses.
+
+    Callers key a request with cache_key(); only answers that passed the
+    caller's own checks should be put() (or a rejected one discard()ed), so
+    a retry with the same prompt reaches the model again.  Entries are
+    evicted least-recently-used first once the stored text exceeds
+    *max_mb*.  Safe to share between threads and asyncio tasks.
+    """
+
+    def __init__(self, path: Path | str = CACHE_PATH, max_mb: float = CACHE_MB, mode: str = CACHE_MODE):
+        self.path      = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.mode      = mode
+        self.hits = self.misses = self.writes = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        if mode != "off":
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def get(self, key: str) -> str | None:
+        if self._conn is None or self.mode == "refresh":
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        if self._conn is None:
+            return
+        size = len(response.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO responses(key, response, size, last_used) "
+                               "VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+            self.writes += 1
+            self._evict()
+
+    def discard(self, key: str) -> None:
+        if self._conn is None:
+            return
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed, doomed = 0, []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def summary(self) -> str:
+        looked = self.hits + self.misses
+        rate = f"{100 * self.hits / looked:.0f}%" if looked else "n/a"
+        return f"[cache] {self.hits} hit(s), {self.misses} miss(es) ({rate}), {self.writes} stored"
+
+
+_shared: ResponseCache | None = None
+_shared_lock = threading.Lock()
+
+def get_cache() -> ResponseCache:
+    """Process-wide cache configured from LLM_CACHE / LLM_CACHE_PATH / LLM_CACHE_MB."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ResponseCache()
+        return _shared
@@ -1,36 +1,40 @@
 import json
-import re
+import os
+from glossary_validator import GlossaryValidator
+from translation_db import TranslationDB
 
-def check_glossary_consistency(staging_file):
+def check_glossary_consistency(staging_file, db_path=None):
     """
     Checks if the English translations in mapping.json include all glossary terms.
     Outputs chunks with missing glossary key-value pairs.
     """
-    if not staging_file:
+    if db_path:
+        # Only finished translations can be checked - fetched through the status index
+        with TranslationDB(db_path) as db:
+            staging_data = db.records_with_status("done")
+    elif not staging_file:
         print(f"Staging file {staging_file} not found. Exiting.")
         return
-
-    # Load the staging file
-    with open(staging_file, 'r', encoding='utf-8') as sf:
-        staging_data = json.load(sf)
+    else:
+        # Load the staging file
+        with open(staging_file, 'r', encoding='utf-8') as sf:
+            staging_data = json.load(sf)
 
     problematic_chunks = []
 
-    # Regular expression to detect glossary key in English section
-    def is_term_present(english_text, term):
-        pattern = re.escape(term)  # Escape special characters for exact matching
-        return re.search(pattern, english_text, re.IGNORECASE)
+    # One combined pattern over every rendering used anywhere in the volume, compiled once
+    all_terms = {}
+    for chunk_data in staging_data.values():
+        for term, translations in chunk_data.get("Glossary", {}).items():
+            all_terms.setdefault(term, set()).update(translations)
+    validator = GlossaryValidator(all_terms)
 
     # Iterate over chunks and check for glossary consistency
     for chunk_key, chunk_data in staging_data.items():
         english_text = chunk_data.get("English", "")
         glossary = chunk_data.get("Glossary", {})
 
-        missing_terms = []
-        for term, translations in glossary.items():
-            # Check if any translation for the term exists in the English text
-            if not any(is_term_present(english_text, translation) for translation in translations):
-                missing_terms.append({term: translations})
+        missing_terms = [{term: glossary[term]} for term in validator.missing(english_text, glossary)]
 
         if missing_terms:
             problematic_chunks.append({"chunk": chunk_key, "missing_terms": missing_terms})
@@ -48,4 +52,4 @@ def check_glossary_consistency(staging_file):
         print("All chunks are consistent with the glossary.")
 
 if __name__ == "__main__":
-    check_glossary_consistency(staging_file="mapping.json")
+    check_glossary_consistency(staging_file="mapping.json", db_path=os.getenv("TRANSLATION_DB"))
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import re
+from typing import Iterator, List, Tuple
+
+from chunker import ChunkStats, count_pieces, pack
+from token_budget import TiktokenCounter, TokenCounter
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+SENTENCE_END = set("。！？!?")
+TRAILERS     = set("。！？!?…」』）)”’\"")     # stay with the sentence they close
+OPENERS      = {"「": "」", "『": "』"}
+CLOSERS      = set(OPENERS.values())
+MARKS        = re.compile(r"[「『」』\n。！？!?]")
+
+# progressively finer cut points for a segment that alone exceeds the budget
+FALLBACK_SPLITS = [
+    re.compile(r"(?<=\n)"),                     # lines swallowed by an unclosed 「
+    re.compile(r"(?<=[。！？!?])(?![。！？!?…」』）)”’\"])"),   # sentence ends inside a long dialogue block
+    re.compile(r"(?<=[，、；：,;:])"),            # clause punctuation
+]
+
+
+# ─── Segmentation ────────────────────────────────────────────────────── #
+def segments(text: str) -> Iterator[str]:
+    """
+    Split *text* into sentences / paragraphs in one linear scan.
+
+    Boundaries fall after 。！？ (with any closing quotes that follow) and
+    after line breaks, but never inside a 「」 / 『』 dialogue block, so a
+    quoted speech is always packed whole.  Joining the segments gives back
+    *text* exactly.
+    """
+    start, depth, n = 0, 0, len(text)
+    i = 0
+    for m in MARKS.finditer(text):               # only the characters that can matter
+        if m.start() < i:
+            continue                             # already absorbed as a trailer
+        ch, i = m.group(), m.end()
+        if ch in OPENERS:
+            depth += 1
+        elif ch in CLOSERS:
+            depth = max(0, depth - 1)            # a stray closer must not lock the scan
+        elif ch == "\n":
+            if depth and not text.startswith("\n", i):
+                continue                         # line wrap inside dialogue; a blank line ends it
+            while i < n and text[i] in "\r\n":
+                i += 1
+            depth = 0
+            yield text[start:i]
+            start = i
+        elif not depth:                          # 。！？ outside dialogue
+            while i < n and text[i] in TRAILERS:
+                i += 1
+            while i < n and text[i] in " \t\u3000":
+                i += 1
+            if i < n and text[i] in "\r\n":
+                continue                         # the line break closes it, with the newline attached
+            yield text[start:i]
+            start = i
+    if start < n:
+        yield text[start:]
+
+
+def split_oversized(piece: str, n: int, counter: TokenCounter, budget: int,
+                    level: int = 0) -> Iterator[Tuple[str, int]]:
+    """Cut a segment larger than *budget* at the finest natural boundary needed."""
+    if n <= budget:
+        yield piece, n
+        return
+    if level < len(FALLBACK_SPLITS):
+        parts = [p for p in FALLBACK_SPLITS[level].split(piece) if p]
+        if len(parts) > 1:
+            for part, m in zip(parts, counter.count_batch(parts)):
+                yield from split_oversized(part, m, counter, budget, level + 1)
+            return
+        yield from split_oversized(piece, n, counter, budget, level + 1)
+        return
+    # no punctuation left: cut on characters (never inside one, unlike token slicing)
+    step = max(1, len(piece) * budget // n)
+    parts = [piece[i:i + step] for i in range(0, len(piece), step)]
+    yield from zip(parts, counter.count_batch(parts))
+
+
+def segment_chunks(text: str, tokens_per_chunk: int, counter: TokenCounter,
+                   stats: ChunkStats | None = None) -> Iterator[str]:
+    """Greedy packing of segments() into chunks of at most *tokens_per_chunk* tokens."""
+    def fitted() -> Iterator[Tuple[str, int]]:
+        for seg, n in count_pieces(segments(text), counter):
+            yield from split_oversized(seg, n, counter, tokens_per_chunk)
+    return pack(fitted(), tokens_per_chunk, stats)
+
+
+def get_chunks(file_path, tokens_per_chunk: int = 1000, encoding_name: str = "cl100k_base",
+               counter: TokenCounter | None = None, verbose: bool = True) -> List[str]:
+    """Sentence-aligned chunks of *file_path*; no overlap is needed between them."""
+    with open(file_path, encoding="utf-8") as fh:
+        text = fh.read()
+    stats = ChunkStats()
+    chunks = list(segment_chunks(text, tokens_per_chunk, counter or TiktokenCounter(encoding_name), stats))
+    if verbose:
+        print(f"Total number of tokens in the original file: {stats.tokens}")
+        print(f"Number of chunks created: {stats.chunks}")
+    return chunks
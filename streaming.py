@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json, os, re, time
+from typing import Iterable, Tuple
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+STREAMING = os.getenv("LLM_STREAM", "1") != "0"      # LLM_STREAM=0 → wait for full completions
+
+CJK_RE = re.compile(r"[\u3040-\u30ff\u4e00-\u9fff]")    # kana + CJK ideographs (Japanese source)
+HAN_RE = re.compile(r"[\u4e00-\u9fff]")                # CJK ideographs only (Chinese source)
+
+
+class StreamGuard:
+    """
+    Incremental validator for a streamed answer.
+
+    feed() every delta; it returns the failure verdict ("Incomplete" or
+    "Preceding", same names the batch validators use) as soon as the text
+    contains a source-script character or a forbidden preamble, so the
+    caller can drop the stream instead of paying for the rest of it.
+    A clean stream still needs the full validation (glossary) at the end.
+
+    It also notes when the first delta arrived (first_at, a perf_counter()
+    reading) and, for Ollama, the token counts of the final message.
+    """
+
+    def __init__(self, script_re: re.Pattern = CJK_RE,
+                 prefixes: Iterable[str] = (), anywhere: Iterable[str] = ()):
+        self.script_re = script_re
+        self.prefixes  = [p.lower() for p in prefixes]   # forbidden at the start of the answer
+        self.anywhere  = [w.lower() for w in anywhere]   # forbidden anywhere in the answer
+        self._tail     = max(map(len, self.anywhere), default=1) - 1
+        self._parts: list[str] = []
+        self._lead = ""                                  # lower-cased start, while a prefix could still match
+        self._prev = ""                                  # lower-cased tail of the text before this delta
+        self.first_at: float | None = None
+        self.usage: Tuple[int | None, int | None] = (None, None)   # (prompt, completion) tokens
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> str | None:
+        if delta and self.first_at is None:
+            self.first_at = time.perf_counter()
+        self._parts.append(delta)
+        if self.script_re.search(delta):
+            return "Incomplete"
+
+        low = delta.lower()
+        if self.prefixes:
+            self._lead = (self._lead + low).lstrip()
+            if any(self._lead.startswith(p) for p in self.prefixes):
+                return "Preceding"
+            if not any(p.startswith(self._lead) for p in self.prefixes):
+                self.prefixes = []                       # answer has started; no prefix can match now
+        if self.anywhere:
+            window = self._prev + low                    # catch words split across deltas
+            if any(w in window for w in self.anywhere):
+                return "Preceding"
+            self._prev = window[-self._tail:] if self._tail else ""
+        return None
+
+
+# ─── Ollama ──────────────────────────────────────────────────────────── #
+async def stream_ollama_chat(session, url: str, payload: dict, guard: StreamGuard) -> Tuple[str, str | None]:
+    """
+    POST an /api/chat request with "stream": true through aiohttp.
+    Returns (text, verdict); on a bad verdict the connection is dropped,
+    which makes Ollama stop generating.
+    """
+    async with session.post(url, json={**payload, "stream": True}) as response:
+        if response.status != 200:
+            raise RuntimeError(f"Ollama returned HTTP {response.status}")
+        async for line in response.content:
+            if not line.strip():
+                continue
+            msg = json.loads(line)
+            verdict = guard.feed(msg.get("message", {}).get("content", ""))
+            if verdict:
+                response.close()
+                return guard.text, verdict
+            if msg.get("done"):
+                guard.usage = (msg.get("prompt_eval_count"), msg.get("eval_count"))
+                break
+    return guard.text, None
+
+def stream_ollama_lib(model: str, messages: list, guard: StreamGuard,
+                      options: dict | None = None) -> Tuple[str, str | None]:
+    """Same, through the `ollama` package (synchronous scripts)."""
+    import ollama
+    stream = ollama.chat(model, messages, stream=True, options=options)
+    try:
+        for chunk in stream:
+            verdict = guard.feed(chunk["message"]["content"])
+            if verdict:
+                return guard.text, verdict
+            if chunk.get("done"):
+                guard.usage = (chunk.get("prompt_eval_count"), chunk.get("eval_count"))
+    finally:
+        close = getattr(stream, "close", None)
+        if close: close()                        # closes the HTTP stream → generation stops
+    return guard.text, None
+
+
+# ─── Gemini ──────────────────────────────────────────────────────────── #
+def stream_gemini(model, prompt, guard: StreamGuard, config: dict | None = None) -> Tuple[str, str | None, object]:
+    """
+    generate_content(stream=True) on a google.generativeai model.
+    Returns (text, verdict, last_chunk) — the last chunk carries usage_metadata.
+    """
+    last = None
+    for chunk in model.generate_content(prompt, stream=True, generation_config=config):
+        last = chunk
+        verdict = guard.feed(_chunk_text(chunk))
+        if verdict:
+            return guard.text, verdict, last     # iterator dropped → stream cancelled
+    return guard.text, None, last
+
+def _chunk_text(chunk) -> str:
+    cands = getattr(chunk, "candidates", None) or []
+    if not cands or not getattr(cands[0], "content", None):
+        return ""
+    return "".join(getattr(p, "text", "") for p in cands[0].content.parts)
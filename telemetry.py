@@ -0,0 +1,231 @@
+"""
+Structured per-call telemetry: one JSON line per model call (or cache hit)
+with latency, time to first token, prompt / completion tokens, key/model
+combo, attempt number and the caller's verdict on the answer.
+
+    with TELEMETRY.scope("translate", unit=page_no, attempt=n) as scope:
+        answer = call_model(...)            # does TELEMETRY.start(...) … call.done()
+        scope.verdict = check(answer)
+
+    python telemetry.py summary                       # every volume in .telemetry.jsonl
+    python telemetry.py summary --volume Danmachi_vol20 --stage translate
+"""
+from __future__ import annotations
+
+import argparse, contextvars, json, math, os, threading, time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+TELEMETRY_PATH = Path(os.getenv("TELEMETRY_PATH", ".telemetry.jsonl"))
+ENABLED        = os.getenv("TELEMETRY", "on").lower() != "off"
+
+
+@dataclass
+class Call:
+    script:  str = ""
+    volume:  str = ""
+    stage:   str = ""
+    unit:    str = ""                   # page_no / chunk index the call is about
+    attempt: int = 0
+    model:   str = ""
+    combo:   str = ""                   # key tag of the (key, model) combo used
+    cache:   str = ""                   # "hit" | "miss" | "" when not cached
+    streamed: bool = False
+    latency_s: float | None = None
+    ttft_s:    float | None = None
+    prompt_tokens:     int | None = None
+    completion_tokens: int | None = None
+    cached_tokens:     int | None = None    # prompt tokens served from a Gemini context cache
+    throttled: bool = False             # refused with a 429 / server-busy answer
+    verdict: str = ""
+    error:   str = ""
+    ts:      float = field(default_factory=time.time)
+    _t0:     float = field(default_factory=time.perf_counter, repr=False)
+    _sink:   "Telemetry | None" = field(default=None, repr=False)
+
+    def first_token(self, at: float | None = None) -> None:
+        """Mark the first streamed delta (*at* is a perf_counter() reading, default now)."""
+        if self.ttft_s is None:
+            self.ttft_s = round((at or time.perf_counter()) - self._t0, 3)
+
+    def usage(self, prompt_tokens: int | None, completion_tokens: int | None,
+              cached_tokens: int | None = None) -> None:
+        self.prompt_tokens, self.completion_tokens = prompt_tokens, completion_tokens
+        self.cached_tokens = cached_tokens
+
+    def done(self, error: str = "", throttled: bool = False) -> None:
+        self.latency_s = round(time.perf_counter() - self._t0, 3)
+        self.error = error[:200]
+        self.throttled = throttled
+        if self._sink:
+            self._sink._finish(self)
+
+
+class Scope:
+    """One attempt at one unit; its verdict is stamped on every call made inside it."""
+
+    def __init__(self, stage: str, unit: str, attempt: int):
+        self.stage, self.unit, self.attempt = stage, unit, attempt
+        self.verdict = ""
+        self.calls: List[Call] = []
+
+
+_scope: contextvars.ContextVar[Scope | None] = contextvars.ContextVar("telemetry_scope", default=None)
+
+
+class Telemetry:
+    """
+    Appends call records to a JSONL file.  Safe to share between threads
+    and asyncio tasks: the active scope is a context variable, so each
+    worker thread / task sees only its own attempt.
+    """
+
+    def __init__(self, path: Path | str = TELEMETRY_PATH, script: str = "", volume: str = "",
+                 enabled: bool = ENABLED):
+        self.path    = Path(path)
+        self.script  = script
+        self.volume  = volume
+        self.enabled = enabled
+        self._lock   = threading.Lock()
+
+    # ── recording ─────────────────────────────────────────────────────── #
+    @contextmanager
+    def scope(self, stage: str, unit: str | int = "", attempt: int = 1) -> Iterator[Scope]:
+        scope = Scope(stage, str(unit), attempt)
+        token = _scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _scope.reset(token)
+            for call in scope.calls:
+                call.verdict = call.verdict or scope.verdict
+                self._write(call)
+
+    def start(self, model: str, combo: str = "", streamed: bool = False, cache: str = "") -> Call:
+        scope = _scope.get()
+        return Call(self.script, self.volume, scope.stage if scope else "", scope.unit if scope else "",
+                    scope.attempt if scope else 0, model, combo, cache, streamed, _sink=self)
+
+    def cache_hit(self, model: str) -> None:
+        call = self.start(model, cache="hit")
+        call.done()
+
+    def record(self, model: str, **fields) -> None:
+        """A call known only by its outcome (Batch API answers carry no timing)."""
+        self._write(Call(self.script, self.volume, model=model, **fields))
+
+    def _finish(self, call: Call) -> None:
+        scope = _scope.get()
+        if scope is not None:
+            scope.calls.append(call)            # written with the verdict when the scope closes
+        else:
+            self._write(call)
+
+    def _write(self, call: Call) -> None:
+        if not self.enabled:
+            return
+        rec = {f.name: getattr(call, f.name) for f in fields(call) if not f.name.startswith("_")}
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(line)
+
+
+def gemini_usage(resp) -> tuple:
+    """(prompt, completion, cached) tokens from a google.generativeai response's usage_metadata."""
+    meta = getattr(resp, "usage_metadata", None)
+    return (getattr(meta, "prompt_token_count", None) or None,
+            getattr(meta, "candidates_token_count", None) or None,
+            getattr(meta, "cached_content_token_count", None) or None)
+
+def ollama_usage(msg) -> tuple:
+    """(prompt, completion) tokens from an Ollama response (prompt_eval_count / eval_count)."""
+    get = msg.get if isinstance(msg, dict) else lambda k: getattr(msg, k, None)
+    return get("prompt_eval_count"), get("eval_count")
+
+
+# ─── Summary ─────────────────────────────────────────────────────────── #
+def load(path: Path) -> List[dict]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+def pct(values: List[float], q: float) -> float | None:
+    """Nearest-rank percentile; None for no data."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+def summarize(records: List[dict]) -> Dict[tuple, dict]:
+    """
+    Per (volume, stage): latency/TTFT percentiles, tokens per unit and what
+    retries cost.  Tokens are the ones the API reported; a stream dropped
+    early by a StreamGuard reports none.
+    """
+    groups: Dict[tuple, List[dict]] = defaultdict(list)
+    for r in records:
+        groups[(r.get("volume", ""), r.get("stage", ""))].append(r)
+
+    out = {}
+    for key, recs in sorted(groups.items()):
+        api    = [r for r in recs if r.get("cache") != "hit"]
+        tokens = lambda r: (r.get("prompt_tokens") or 0) + (r.get("completion_tokens") or 0)
+        units  = {r.get("unit") for r in recs}
+        wasted = [r for r in api if r.get("error") or r.get("verdict") not in ("", "AllGood")]
+        total  = sum(map(tokens, api))
+        out[key] = {
+            "calls": len(api), "cache_hits": len(recs) - len(api), "units": len(units),
+            "throttled": sum(bool(r.get("throttled")) for r in recs),
+            "latency_p50": pct([r["latency_s"] for r in api if r.get("latency_s") is not None], 50),
+            "latency_p95": pct([r["latency_s"] for r in api if r.get("latency_s") is not None], 95),
+            "ttft_p50": pct([r["ttft_s"] for r in api if r.get("ttft_s") is not None], 50),
+            "ttft_p95": pct([r["ttft_s"] for r in api if r.get("ttft_s") is not None], 95),
+            "tokens": total,
+            "cached_tokens": sum(r.get("cached_tokens") or 0 for r in api),
+            "tokens_per_unit": round(total / len(units)) if units else 0,
+            "attempts_per_unit": round(len(api) / len(units), 2) if units else 0,
+            "retry_calls": len(wasted),
+            "retry_tokens": sum(map(tokens, wasted)),
+            "retry_share": round(sum(map(tokens, wasted)) / total, 3) if total else 0.0,
+        }
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Summarise model-call telemetry.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("summary", help="p50/p95 latency, tokens per page and retry cost per volume")
+    s.add_argument("path", type=Path, nargs="?", default=TELEMETRY_PATH)
+    s.add_argument("--volume")
+    s.add_argument("--stage")
+    s.add_argument("--json", action="store_true", help="machine-readable output")
+    args = ap.parse_args()
+
+    recs = [r for r in load(args.path)
+            if (not args.volume or r.get("volume") == args.volume)
+            and (not args.stage or r.get("stage") == args.stage)]
+    table = summarize(recs)
+    if args.json:
+        print(json.dumps([{"volume": v, "stage": st, **row} for (v, st), row in table.items()], indent=2))
+        return
+    if not table:
+        print(f"No telemetry in {args.path}.")
+        return
+    fmt = lambda x: "-" if x is None else f"{x:.2f}"
+    for (volume, stage), row in table.items():
+        print(f"{volume or '?'} / {stage or '?'}: {row['units']} unit(s), {row['calls']} call(s), "
+              f"{row['cache_hits']} cache hit(s), {row['throttled']} throttled")
+        print(f"    latency p50 {fmt(row['latency_p50'])}s  p95 {fmt(row['latency_p95'])}s   "
+              f"first token p50 {fmt(row['ttft_p50'])}s  p95 {fmt(row['ttft_p95'])}s")
+        print(f"    {row['tokens']} tokens ({row['cached_tokens']} from context cache), "
+              f"{row['tokens_per_unit']} per unit, {row['attempts_per_unit']} attempts per unit")
+        print(f"    retries: {row['retry_calls']} of {row['calls']} call(s) rejected or failed, costing "
+              f"{row['retry_tokens']} reported tokens ({100 * row['retry_share']:.1f}%)")
+
+if __name__ == "__main__":
+    main()
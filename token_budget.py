@@ -0,0 +1,232 @@
+"""
+Token counting in the target model's own units, and chunk sizes derived
+from what that model can take in and reliably write back.
+
+    python token_budget.py budget aya-expanse
+    python token_budget.py calibrate gemini-2.0-flash Input/Chinese.txt
+"""
+from __future__ import annotations
+
+import argparse, json, math, os, re, sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Protocol, Sequence, Tuple
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+CALIBRATION_PATH = Path(os.getenv("TOKEN_CALIBRATION", ".token_calibration.json"))
+AYA_TOKENIZER    = os.getenv("AYA_TOKENIZER", "")    # local tokenizer.json for Aya Expanse
+SAFETY           = 0.9                               # headroom for counting error
+MIN_CHUNK        = 200
+
+CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")   # CJK, kana, full-width punct.
+
+@dataclass(frozen=True)
+class ModelBudget:
+    backend: str            # which tokenizer counts for this model
+    context: int            # prompt + answer window (for Ollama this is the num_ctx we request)
+    reliable_output: int    # longest answer the model finishes without truncating or drifting
+    output_ratio: float     # answer tokens per source token, Chinese/Japanese → English
+
+MODEL_BUDGETS: Dict[str, ModelBudget] = {
+    "aya-expanse":                         ModelBudget("aya",    8_192,     1_024, 1.3),
+    "gemini-2.0-flash":                    ModelBudget("gemini", 1_048_576, 4_096, 1.0),
+    "gemini-2.0-flash-thinking-exp-01-21": ModelBudget("gemini", 1_048_576, 4_096, 1.0),
+    "gemini-2.5-flash-preview-05-20":      ModelBudget("gemini", 1_048_576, 4_096, 1.0),
+    "gemini-2.5-pro":                      ModelBudget("gemini", 1_048_576, 4_096, 1.0),
+}
+FALLBACK_BUDGET = ModelBudget("cl100k", 8_192, 1_024, 1.0)
+
+# chars per token as (CJK, everything else); rough until `calibrate` has been run
+DEFAULT_RATIOS: Dict[str, Tuple[float, float]] = {
+    "gemini": (1.2, 4.0),
+    "aya":    (1.3, 4.2),
+}
+
+
+# ─── Counters ────────────────────────────────────────────────────────── #
+class TokenCounter(Protocol):
+    name: str
+    def count(self, text: str) -> int: ...
+    def count_batch(self, texts: Sequence[str]) -> List[int]: ...
+
+
+class TiktokenCounter:
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        import tiktoken
+        self.name = encoding_name
+        self.enc  = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self.enc.encode(text, disallowed_special=()))
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [len(t) for t in self.enc.encode_batch(list(texts), disallowed_special=())]
+
+
+class HFCounter:
+    """A Hugging Face `tokenizers` tokenizer.json — exact counts, fully offline."""
+
+    def __init__(self, tokenizer, name: str):
+        self.tok  = tokenizer
+        self.name = name
+
+    def count(self, text: str) -> int:
+        return len(self.tok.encode(text, add_special_tokens=False).ids)
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [len(e.ids) for e in self.tok.encode_batch(list(texts), add_special_tokens=False)]
+
+
+class VertexCounter:
+    """Gemini's SentencePiece model via vertexai's local tokenizer (no API call per count)."""
+
+    def __init__(self, tokenizer, name: str):
+        self.tok  = tokenizer
+        self.name = name
+
+    def count(self, text: str) -> int:
+        return self.tok.count_tokens(text).total_tokens
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [self.count(t) for t in texts]
+
+
+class RatioCounter:
+    """Chars-per-token estimate, with CJK and other text weighted separately."""
+
+    def __init__(self, cjk_chars: float, other_chars: float, name: str = "ratio"):
+        self.cjk_chars   = cjk_chars
+        self.other_chars = other_chars
+        self.name        = name
+
+    def count(self, text: str) -> int:
+        cjk = len(CJK_RE.findall(text))
+        return math.ceil(cjk / self.cjk_chars + (len(text) - cjk) / self.other_chars)
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [self.count(t) for t in texts]
+
+
+# ─── Lookup ──────────────────────────────────────────────────────────── #
+_COUNTERS: Dict[str, TokenCounter] = {}
+
+def model_budget(model: str) -> ModelBudget:
+    return MODEL_BUDGETS.get(model, FALLBACK_BUDGET)
+
+def counter_for(model: str) -> TokenCounter:
+    """Most exact counter available offline for *model*, memoised."""
+    if model not in _COUNTERS:
+        _COUNTERS[model] = _make_counter(model, model_budget(model).backend)
+    return _COUNTERS[model]
+
+def _make_counter(model: str, backend: str) -> TokenCounter:
+    if backend == "aya" and AYA_TOKENIZER:
+        try:
+            from tokenizers import Tokenizer
+            return HFCounter(Tokenizer.from_file(AYA_TOKENIZER), "aya")
+        except Exception as err:                     # missing package or unreadable file
+            print(f"[tokens] AYA_TOKENIZER unusable ({err}); estimating instead.")
+    if backend == "gemini":
+        try:
+            from vertexai.preview.tokenization import get_tokenizer_for_model
+            return VertexCounter(get_tokenizer_for_model(model), "gemini")
+        except Exception:
+            pass                                     # optional; fall back to the ratio estimate
+    if backend in DEFAULT_RATIOS:
+        cjk, other = load_calibration().get(backend, DEFAULT_RATIOS[backend])
+        return RatioCounter(cjk, other, f"{backend}~")
+    return TiktokenCounter(backend if backend != "cl100k" else "cl100k_base")
+
+
+def chunk_tokens(model: str, system_prompt: str = "", reserve: int = 0,
+                 output_ratio: float | None = None) -> int:
+    """
+    Largest source chunk, in *model* tokens, whose prompt still fits the
+    context window and whose expected answer stays within reliable_output.
+
+    *reserve* covers the per-chunk extras (glossary subset, previous
+    context, retry hint); *output_ratio* overrides the model default for
+    non-translation tasks such as glossary extraction.
+    """
+    b = model_budget(model)
+    ratio = b.output_ratio if output_ratio is None else output_ratio
+    room = b.context - counter_for(model).count(system_prompt) - reserve
+    by_context = room / (1 + ratio)
+    by_output  = b.reliable_output / ratio if ratio else by_context
+    return max(MIN_CHUNK, int(min(by_context, by_output) * SAFETY))
+
+
+# ─── Calibration ─────────────────────────────────────────────────────── #
+def load_calibration() -> Dict[str, Tuple[float, float]]:
+    if not CALIBRATION_PATH.exists():
+        return {}
+    return {k: tuple(v) for k, v in json.loads(CALIBRATION_PATH.read_text(encoding="utf-8")).items()}
+
+def fit_ratios(lines: Sequence[str], counts: Sequence[int],
+               defaults: Tuple[float, float] = (1.2, 4.0)) -> Tuple[float, float]:
+    """
+    Least-squares fit of tokens ≈ cjk/a + other/b over sample lines → (a, b).
+    A sample with too little non-CJK text to fit b keeps the default b; one
+    with no CJK text (or no usable fit) returns *defaults* unchanged.
+    """
+    default_other = defaults[1]
+    sxx = sxy = syy = sxt = syt = 0.0
+    for line, n in zip(lines, counts):
+        x = len(CJK_RE.findall(line)); y = len(line) - x
+        sxx += x * x; sxy += x * y; syy += y * y; sxt += x * n; syt += y * n
+    det = sxx * syy - sxy * sxy
+    if det > 0:
+        p = (sxt * syy - syt * sxy) / det         # tokens per CJK char
+        q = (syt * sxx - sxt * sxy) / det         # tokens per other char
+        if p > 0 and q > 0:
+            return round(1 / p, 3), round(1 / q, 3)
+    # other text is noise here: charge it at the default rate, fit CJK alone
+    if sxx == 0:
+        return defaults
+    p = (sxt - sxy / default_other) / sxx
+    if p <= 0:
+        return defaults
+    return round(1 / p, 3), default_other
+
+def exact_counts(model: str, lines: Sequence[str]) -> List[int]:
+    backend = model_budget(model).backend
+    if backend == "gemini":
+        import google.generativeai as genai
+        genai.configure(api_key=os.environ["GEMINI_KEY"])
+        gm = genai.GenerativeModel(model)
+        return [gm.count_tokens(line).total_tokens for line in lines]
+    if backend == "aya":                        # only Aya's own tokenizer.json counts it, and then exactly
+        raise SystemExit("aya: nothing to fit against offline. Set AYA_TOKENIZER to Aya Expanse's "
+                         "tokenizer.json for exact counts; without it the default ratios apply.")
+    raise SystemExit(f"{model}: {backend} is counted exactly already; nothing to calibrate")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Per-model token counts and chunk budgets.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("budget", help="print the chunk size for a model")
+    b.add_argument("model")
+    b.add_argument("--system", type=Path, help="file holding the system prompt")
+    b.add_argument("--reserve", type=int, default=0)
+    c = sub.add_parser("calibrate", help="fit chars/token against exact counts for a model")
+    c.add_argument("model")
+    c.add_argument("sample", type=Path)
+    c.add_argument("--lines", type=int, default=200, help="sample lines (API calls for Gemini)")
+    args = ap.parse_args()
+
+    if args.cmd == "budget":
+        system = args.system.read_text(encoding="utf-8") if args.system else ""
+        print(f"{args.model}: {model_budget(args.model)} counted by {counter_for(args.model).name}")
+        print(f"chunk size: {chunk_tokens(args.model, system, args.reserve)} tokens")
+        return
+
+    lines = [l for l in args.sample.read_text(encoding="utf-8").splitlines() if l.strip()]
+    lines = lines[:: max(1, len(lines) // args.lines)][: args.lines]
+    backend = model_budget(args.model).backend
+    ratios = fit_ratios(lines, exact_counts(args.model, lines), DEFAULT_RATIOS[backend])
+    data = {**load_calibration(), backend: ratios}
+    CALIBRATION_PATH.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    print(f"{backend}: {ratios[0]} CJK chars/token, {ratios[1]} other chars/token → {CALIBRATION_PATH}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import argparse, json, sqlite3, threading
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+# ─── Schema ──────────────────────────────────────────────────────────── #
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    key                   TEXT PRIMARY KEY,       -- "chunk 12" (text pipeline) or "013" (page pipeline)
+    kind                  TEXT NOT NULL,          -- 'chunk' | 'page'
+    seq                   INTEGER NOT NULL,       -- numeric order of the key
+    status                TEXT NOT NULL,          -- 'pending' | 'done' | 'error'
+    contains_text         INTEGER,
+    contains_illustration INTEGER,
+    data                  TEXT NOT NULL           -- full JSON record, round-trips every field
+);
+CREATE INDEX IF NOT EXISTS idx_records_status ON records(status, seq);
+CREATE INDEX IF NOT EXISTS idx_records_type   ON records(contains_text, contains_illustration);
+
+CREATE TABLE IF NOT EXISTS attempts (
+    id       INTEGER PRIMARY KEY,
+    key      TEXT NOT NULL,
+    attempt  INTEGER NOT NULL,
+    verdict  TEXT NOT NULL,
+    missing  TEXT,
+    created  TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_key ON attempts(key);
+
+CREATE TABLE IF NOT EXISTS glossary (
+    term     TEXT PRIMARY KEY,
+    variants TEXT NOT NULL                        -- JSON list of English renderings
+);
+
+CREATE TABLE IF NOT EXISTS record_terms (         -- which glossary terms each record used
+    key  TEXT NOT NULL,
+    term TEXT NOT NULL,
+    PRIMARY KEY (key, term)
+);
+CREATE INDEX IF NOT EXISTS idx_record_terms_term ON record_terms(term);
+"""
+
+# fields that live in mapping.json but not in Type.json
+MAPPING_ONLY_FIELDS = ("English", "Glossary", "Refined")
+
+
+def record_status(rec: dict) -> str:
+    eng = rec.get("English")
+    if eng == "ERROR": return "error"
+    return "done" if eng else "pending"
+
+def key_order(key: str) -> tuple[str, int]:
+    """('chunk', 12) for "chunk 12", ('page', 13) for "013"."""
+    if key.startswith("chunk "):
+        return "chunk", int(key.split()[1])
+    return "page", int(key)
+
+
+class TranslationDB:
+    """
+    Optional SQLite backend for mapping.json / Type.json / Glossary.json.
+
+    Offers the same load()/put()/compact()/close() surface as
+    CheckpointStore, so a script can swap one for the other, plus indexed
+    queries by status, page type and glossary term.  The database runs in
+    WAL mode; every put() is a single-row upsert, so several workers or
+    processes can write without clobbering each other.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self.data = RecordView(self)
+
+    # ─── lifecycle ─── #
+    def load(self) -> "RecordView":
+        """Open the database. The returned mapping reads/writes rows lazily."""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self.data
+
+    def compact(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self) -> "TranslationDB":
+        self.load()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ─── records ─── #
+    def put(self, key: str, record: dict) -> None:
+        kind, seq = key_order(key)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO records(key, kind, seq, status, contains_text, contains_illustration, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET status=excluded.status, contains_text=excluded.contains_text, "
+                "contains_illustration=excluded.contains_illustration, data=excluded.data",
+                (key, kind, seq, record_status(record),
+                 _flag(record.get("contains_text")), _flag(record.get("contains_illustration")),
+                 json.dumps(record, ensure_ascii=False)))
+            self._conn.execute("DELETE FROM record_terms WHERE key = ?", (key,))
+            self._conn.executemany("INSERT OR IGNORE INTO record_terms(key, term) VALUES (?, ?)",
+                                   [(key, t) for t in (record.get("Glossary") or {})])
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._conn.execute("SELECT data FROM records WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM records WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM record_terms WHERE key = ?", (key,))
+
+    def keys(self, status: str | None = None) -> List[str]:
+        """Keys in numeric order, optionally only those with *status*."""
+        if status is None:
+            rows = self._conn.execute("SELECT key FROM records ORDER BY kind, seq")
+        else:
+            rows = self._conn.execute("SELECT key FROM records WHERE status = ? ORDER BY kind, seq", (status,))
+        return [r[0] for r in rows]
+
+    def records_with_status(self, status: str) -> Dict[str, dict]:
+        rows = self._conn.execute(
+            "SELECT key, data FROM records WHERE status = ? ORDER BY kind, seq", (status,))
+        return {k: json.loads(d) for k, d in rows}
+
+    def keys_with_term(self, term: str) -> List[str]:
+        rows = self._conn.execute(
+            "SELECT r.key FROM record_terms t JOIN records r ON r.key = t.key "
+            "WHERE t.term = ? ORDER BY r.kind, r.seq", (term,))
+        return [r[0] for r in rows]
+
+    def pages_with_both(self) -> List[int]:
+        """Pages flagged as containing both text and an illustration."""
+        rows = self._conn.execute(
+            "SELECT seq FROM records WHERE kind = 'page' AND contains_text = 1 "
+            "AND contains_illustration = 1 ORDER BY seq")
+        return [r[0] for r in rows]
+
+    def missing_pages(self, first: int, last: int) -> List[int]:
+        present = {r[0] for r in self._conn.execute(
+            "SELECT seq FROM records WHERE kind = 'page' AND seq BETWEEN ? AND ?", (first, last))}
+        return [n for n in range(first, last + 1) if n not in present]
+
+    # ─── attempts ─── #
+    def log_attempts(self, key: str, verdicts: List[str], missing: List[str] | None = None) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO attempts(key, attempt, verdict, missing) VALUES (?, ?, ?, ?)",
+                [(key, i, v, json.dumps(missing or [], ensure_ascii=False))
+                 for i, v in enumerate(verdicts, start=1)])
+
+    # ─── glossary ─── #
+    def glossary(self) -> Dict[str, List[str]]:
+        return {t: json.loads(v) for t, v in self._conn.execute("SELECT term, variants FROM glossary")}
+
+    def put_term(self, term: str, variants: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO glossary(term, variants) VALUES (?, ?)",
+                               (term, json.dumps(variants, ensure_ascii=False)))
+
+    # ─── JSON import / export ─── #
+    def import_mapping(self, path: Path) -> int:
+        raw = json.loads(Path(path).read_text(encoding="utf-8"))
+        recs = {str(p["page_no"]): p for p in raw} if isinstance(raw, list) else raw
+        for key, rec in recs.items():
+            self.put(key, rec)
+        return len(recs)
+
+    def import_type(self, path: Path) -> int:
+        """Merge Type.json page metadata without touching existing translations."""
+        pages = json.loads(Path(path).read_text(encoding="utf-8"))
+        for page in pages:
+            key = str(page["page_no"])
+            self.put(key, {**page, **{f: v for f, v in (self.get(key) or {}).items()
+                                      if f in MAPPING_ONLY_FIELDS}})
+        return len(pages)
+
+    def import_glossary(self, path: Path) -> int:
+        raw = json.loads(Path(path).read_text(encoding="utf-8"))
+        for term, variants in raw.items():
+            self.put_term(term, variants if isinstance(variants, list) else [variants])
+        return len(raw)
+
+    def export_mapping(self, path: Path, indent: int = 2) -> None:
+        """Records with translation fields only; pages known just from Type.json stay out."""
+        records = {k: rec for k, rec in self.data.items() if any(f in rec for f in MAPPING_ONLY_FIELDS)}
+        _write_json(path, records, indent)
+
+    def export_type(self, path: Path, indent: int = 2) -> None:
+        pages = [{f: v for f, v in rec.items() if f not in MAPPING_ONLY_FIELDS}
+                 for key, rec in self.data.items() if not key.startswith("chunk ")]
+        _write_json(path, pages, indent)
+
+    def export_glossary(self, path: Path, indent: int = 2) -> None:
+        _write_json(path, self.glossary(), indent)
+
+
+class RecordView(MutableMapping):
+    """dict-like view over the records table, so existing `staging_data[...]` code keeps working."""
+
+    def __init__(self, db: TranslationDB):
+        self._db = db
+
+    def __getitem__(self, key: str) -> dict:
+        rec = self._db.get(key)
+        if rec is None:
+            raise KeyError(key)
+        return rec
+
+    def __setitem__(self, key: str, rec: dict) -> None:
+        self._db.put(key, rec)
+
+    def __delitem__(self, key: str) -> None:
+        self._db.delete(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._db.keys())
+
+    def __len__(self) -> int:
+        return self._db._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def items(self):
+        rows = self._db._conn.execute("SELECT key, data FROM records ORDER BY kind, seq")
+        return [(k, json.loads(d)) for k, d in rows]
+
+
+def _flag(v) -> int | None:
+    return None if v is None else int(bool(v))
+
+def _write_json(path: Path, data: Any, indent: int) -> None:
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=indent), encoding="utf-8")
+    tmp.replace(path)
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────── #
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Import/export the translation SQLite store.")
+    ap.add_argument("action", choices=["import", "export"])
+    ap.add_argument("db", type=Path, help="e.g. Processing_Files/Danmachi_vol20/translation.db")
+    ap.add_argument("--mapping",  type=Path, help="mapping.json")
+    ap.add_argument("--type",     type=Path, help="Type.json")
+    ap.add_argument("--glossary", type=Path, help="Glossary.json")
+    ap.add_argument("--indent",   type=int, default=2)
+    args = ap.parse_args()
+
+    with TranslationDB(args.db) as db:
+        if args.action == "import":
+            if args.mapping:  print(f"✓ {db.import_mapping(args.mapping)} record(s) from {args.mapping}")
+            if args.type:     print(f"✓ {db.import_type(args.type)} page(s) from {args.type}")
+            if args.glossary: print(f"✓ {db.import_glossary(args.glossary)} term(s) from {args.glossary}")
+        else:
+            if args.mapping:  db.export_mapping(args.mapping, args.indent);   print(f"✓ {args.mapping}")
+            if args.type:     db.export_type(args.type, args.indent);         print(f"✓ {args.type}")
+            if args.glossary: db.export_glossary(args.glossary, args.indent); print(f"✓ {args.glossary}")
+
+if __name__ == "__main__":
+    main()
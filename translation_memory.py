@@ -0,0 +1,303 @@
+"""
+Translation memory: every accepted (source, English) pair from finished
+mapping.json files, across volumes, for exact and fuzzy reuse.
+
+    python translation_memory.py build Processing_Files      # ingest every mapping.json below
+    python translation_memory.py lookup "第一章　冒険者"      # exact hit / near hits for a text
+    python translation_memory.py stats
+
+Segments are whole units (a page or chunk) plus, where source and English
+have the same number of paragraphs, each paragraph pair, so chapter
+headers, 【skill】 lines and stock phrases are found on their own.  Sources
+are compared after NFKC, with ruby readings (`かな`) and whitespace
+removed, so a re-OCR'd page that reads the same is an exact hit.
+
+Fuzzy lookup is MinHash over character trigrams with LSH banding (16 bands
+of 4 rows: pairs above ~0.5 Jaccard almost always share a band); the
+candidates are then scored by their true trigram Jaccard.
+"""
+from __future__ import annotations
+
+import argparse, hashlib, json, os, random, re, sqlite3, threading, time, unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+# ─── Config ──────────────────────────────────────────────────────────── #
+TM_PATH    = Path(os.getenv("TM_PATH", ".translation_memory.sqlite"))
+TM_ENABLED = os.getenv("TRANSLATION_MEMORY", "on").lower() != "off"
+
+SHINGLE      = 3          # characters per shingle (CJK text has no word boundaries)
+BANDS, ROWS  = 16, 4      # 64 MinHash values
+FUZZY_MIN    = 0.6        # trigram Jaccard a near hit must reach
+MIN_CHARS    = 4          # shorter paragraphs ("……", a lone 「」) are not stored on their own
+MAX_EXAMPLES = 3
+
+_PRIME  = (1 << 61) - 1
+_rng    = random.Random(20240611)
+_PERMS  = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS)]
+RUBY_RE = re.compile(r"`[^`\n]*`")
+PARA_RE = re.compile(r"\n\s*\n")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id      INTEGER PRIMARY KEY,
+    key     TEXT UNIQUE NOT NULL,       -- hash of the normalised source
+    source  TEXT NOT NULL,
+    english TEXT NOT NULL,
+    kind    TEXT NOT NULL,              -- unit | para
+    volume  TEXT NOT NULL,
+    unit    TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    band    INTEGER NOT NULL,
+    bucket  INTEGER NOT NULL,
+    seg     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bands ON bands(band, bucket);
+CREATE TABLE IF NOT EXISTS ingested (
+    path     TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+# ─── Text helpers ────────────────────────────────────────────────────── #
+def normalise(text: str) -> str:
+    text = unicodedata.normalize("NFKC", RUBY_RE.sub("", text))
+    return "".join(text.split())
+
+def source_key(text: str) -> str:
+    return hashlib.sha256(normalise(text).encode("utf-8")).hexdigest()
+
+def shingles(norm: str) -> set:
+    if len(norm) <= SHINGLE:
+        return {norm} if norm else set()
+    return {norm[i:i + SHINGLE] for i in range(len(norm) - SHINGLE + 1)}
+
+def _h64(data: str) -> int:
+    return int.from_bytes(hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(), "big")
+
+def minhash(sh: set) -> List[int]:
+    hashes = [_h64(s) for s in sh]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS]
+
+def band_buckets(sig: List[int]) -> List[int]:
+    return [int.from_bytes(hashlib.blake2b(repr(sig[i * ROWS:(i + 1) * ROWS]).encode(), digest_size=8).digest(),
+                           "big", signed=True) for i in range(BANDS)]
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+def paragraphs(text: str) -> List[str]:
+    """Blank-line separated paragraphs, the unit both storing and looking up use."""
+    return [p.strip() for p in PARA_RE.split(text.strip()) if p.strip()]
+
+def align(source: str, english: str) -> List[Tuple[str, str]]:
+    """
+    Paragraph pairs, when source and English split into the same number of
+    blank-line paragraphs.  Single source lines are never paired: OCR
+    hard-wraps them, so their count says nothing about the English.
+    """
+    en, src = paragraphs(english), paragraphs(source)
+    return list(zip(src, en)) if len(src) == len(en) > 1 else []
+
+
+@dataclass
+class Match:
+    source:  str
+    english: str
+    score:   float                      # 1.0 for an exact hit, trigram Jaccard otherwise
+    kind:    str
+    volume:  str
+    unit:    str
+
+
+# ─── Store ───────────────────────────────────────────────────────────── #
+class TranslationMemory:
+    """
+    Persistent (source → English) store with exact and MinHash lookup.
+    Safe to share between threads; with enabled=False every lookup misses
+    and nothing is written.
+    """
+
+    def __init__(self, path: Path | str = TM_PATH, enabled: bool = TM_ENABLED):
+        self.path = Path(path)
+        self.exact_hits = self.fuzzy_hits = self.added = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        if enabled:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    # ── writing ───────────────────────────────────────────────────────── #
+    def add(self, source: str, english: str, volume: str = "", unit: str = "") -> None:
+        """Store an accepted translation, and its paragraph pairs where they align."""
+        if self._conn is None or not english.strip() or english.strip() == "ERROR":
+            return
+        pairs = [(source, english, "unit")] + [(s, e, "para") for s, e in align(source, english)
+                                                if len(normalise(s)) >= MIN_CHARS]
+        with self._lock, self._conn:
+            for src, en, kind in pairs:
+                self._put(src, en.strip(), kind, volume, str(unit))
+
+    def _put(self, source: str, english: str, kind: str, volume: str, unit: str) -> None:
+        norm = normalise(source)
+        if not norm:
+            return
+        key = hashlib.sha256(norm.encode("utf-8")).hexdigest()
+        row = self._conn.execute("SELECT id, kind FROM segments WHERE key = ?", (key,)).fetchone()
+        if row is not None:                     # latest accepted wording wins; a unit outranks a paragraph
+            if row[1] == "unit" and kind != "unit":
+                return
+            self._conn.execute("UPDATE segments SET english = ?, kind = ?, volume = ?, unit = ?, updated = ? "
+                               "WHERE id = ?", (english, kind,
+                                                volume, unit, time.time(), row[0]))
+            return
+        cur = self._conn.execute("INSERT INTO segments(key, source, english, kind, volume, unit, updated) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (key, source, english, kind, volume, unit, time.time()))
+        self._conn.executemany("INSERT INTO bands(band, bucket, seg) VALUES (?, ?, ?)",
+                               [(i, b, cur.lastrowid) for i, b in enumerate(band_buckets(minhash(shingles(norm))))])
+        self.added += 1
+
+    def ingest_mapping(self, mapping_path: Path, volume: str = "") -> int:
+        """Add every finished record of a mapping.json (page- or chunk-keyed, or a legacy list)."""
+        mapping_path = Path(mapping_path)
+        data = json.loads(mapping_path.read_text(encoding="utf-8"))
+        type_path = mapping_path.with_name("Type.json")
+        type_src: Dict[str, str] = {}
+        if type_path.exists():                  # source for records that only kept the English
+            type_src = {str(p.get("page_no")): p.get("rawtext", "")
+                        for p in json.loads(type_path.read_text(encoding="utf-8"))}
+        n = 0
+        for key, rec in (data.items() if isinstance(data, dict) else enumerate(data)):
+            english = rec.get("English") or ""
+            if english in ("", "ERROR"):
+                continue
+            unit   = str(rec.get("page_no", key))
+            source = rec.get("rawtext") or rec.get("Chinese") or rec.get("Japanese") or type_src.get(unit, "")
+            if source.strip():
+                self.add(source, english, volume or mapping_path.parent.name, unit)
+                n += 1
+        return n
+
+    def ingest_tree(self, root: Path) -> int:
+        """ingest_mapping() for every mapping.json under *root* that changed since it was last read."""
+        if self._conn is None or not Path(root).exists():
+            return 0
+        n = 0
+        for path in sorted(Path(root).rglob("mapping.json")):
+            mtime = path.stat().st_mtime_ns
+            with self._lock:
+                row = self._conn.execute("SELECT mtime_ns FROM ingested WHERE path = ?", (str(path),)).fetchone()
+            if row is not None and row[0] == mtime:
+                continue
+            try:
+                n += self.ingest_mapping(path)
+            except (OSError, ValueError, AttributeError):
+                continue                        # half-written or foreign JSON: try again next time
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO ingested(path, mtime_ns) VALUES (?, ?)",
+                                   (str(path), mtime))
+        return n
+
+    # ── lookup ────────────────────────────────────────────────────────── #
+    def exact(self, source: str) -> Match | None:
+        """
+        A whole unit translated before with the same text.  Aligned
+        paragraphs are only ever prompt examples, never reused as-is.
+        """
+        if self._conn is None or not normalise(source):
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT source, english, kind, volume, unit FROM segments "
+                                     "WHERE key = ? AND kind = 'unit'", (source_key(source),)).fetchone()
+        if row is None:
+            return None
+        self.exact_hits += 1
+        return Match(row[0], row[1], 1.0, row[2], row[3], row[4])
+
+    def similar(self, source: str, k: int = MAX_EXAMPLES, min_score: float = FUZZY_MIN) -> List[Match]:
+        """Up to *k* stored segments sharing ≥ *min_score* trigram Jaccard with *source*, best first."""
+        norm = normalise(source)
+        if self._conn is None or not norm:
+            return []
+        sh  = shingles(norm)
+        key = hashlib.sha256(norm.encode("utf-8")).hexdigest()
+        with self._lock:
+            ids = {seg for i, b in enumerate(band_buckets(minhash(sh)))
+                   for (seg,) in self._conn.execute("SELECT seg FROM bands WHERE band = ? AND bucket = ?", (i, b))}
+            rows = [self._conn.execute("SELECT source, english, kind, volume, unit, key FROM segments WHERE id = ?",
+                                       (i,)).fetchone() for i in ids]
+        scored = [(jaccard(sh, shingles(normalise(r[0]))), r) for r in rows if r and r[5] != key]
+        scored = sorted((s, r) for s, r in scored if s >= min_score)[::-1][:k]
+        self.fuzzy_hits += bool(scored)
+        return [Match(r[0], r[1], round(s, 3), r[2], r[3], r[4]) for s, r in scored]
+
+    def examples(self, source: str, k: int = MAX_EXAMPLES) -> List[Match]:
+        """
+        Reference pairs for a prompt: exact hits for the unit's own
+        paragraphs (headers, 【】 lines) first, then near hits for the unit.
+        """
+        if self._conn is None:
+            return []
+        out: List[Match] = []
+        for para in dict.fromkeys(paragraphs(source)):
+            if len(normalise(para)) >= MIN_CHARS and len(out) < k:
+                with self._lock:
+                    row = self._conn.execute("SELECT source, english, kind, volume, unit FROM segments "
+                                             "WHERE key = ?", (source_key(para),)).fetchone()
+                if row is not None:
+                    out.append(Match(row[0], row[1], 1.0, row[2], row[3], row[4]))
+        return out + self.similar(source, k - len(out)) if len(out) < k else out
+
+    def summary(self) -> str:
+        return f"[tm] {self.exact_hits} exact reuse(s), {self.fuzzy_hits} unit(s) with near hits, {self.added} stored"
+
+    def stats(self) -> Dict[str, int]:
+        if self._conn is None:
+            return {}
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, COUNT(*) FROM segments GROUP BY kind").fetchall()
+            vols = self._conn.execute("SELECT COUNT(DISTINCT volume) FROM segments").fetchone()[0]
+        return {**dict(rows), "volumes": vols}
+
+
+def format_examples(examples: Iterable[Match]) -> str:
+    """Prompt block of reference pairs; "" when there are none."""
+    blocks = [f"{m.source.strip()}\n→ {m.english.strip()}" for m in examples]
+    if not blocks:
+        return ""
+    return ("Earlier translations of matching passages (reuse their wording where the source matches):\n"
+            + "\n\n".join(blocks))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Build / query the translation memory.")
+    ap.add_argument("--path", type=Path, default=TM_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="ingest every mapping.json under the given folders")
+    b.add_argument("roots", type=Path, nargs="+")
+    q = sub.add_parser("lookup", help="exact and near hits for a source text")
+    q.add_argument("text")
+    sub.add_parser("stats")
+    args = ap.parse_args()
+
+    tm = TranslationMemory(args.path, enabled=True)
+    if args.cmd == "build":
+        n = sum(tm.ingest_tree(r) for r in args.roots)
+        print(f"✓ {n} record(s) ingested, {tm.added} new segment(s); {tm.stats()}")
+    elif args.cmd == "lookup":
+        hit = tm.exact(args.text)
+        if hit:
+            print(f"exact ({hit.volume} {hit.unit}): {hit.english}")
+        for m in tm.similar(args.text):
+            print(f"{m.score:.2f} ({m.volume} {m.unit}, {m.kind}): {m.source[:60]!r} → {m.english[:80]!r}")
+    else:
+        print(tm.stats())
+
+if __name__ == "__main__":
+    main()